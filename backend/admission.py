@@ -0,0 +1,92 @@
+"""
+Admission control for endpoints that hand work to the SMTP relay
+
+When the relay slows down, accepted submissions pile up in the mail queue
+faster than they drain. Rather than keep accepting work that cannot be
+delivered for minutes (and letting clients and the proxy time out), new
+submissions are turned away early with 503 and a Retry-After telling the
+client when the backlog should have drained.
+
+The signal is the shared outbound queue, so it covers every worker on the
+host: messages waiting, messages being sent right now, and the mean SMTP
+attempt time over the last ADMISSION_WINDOW seconds. From those the backlog
+is estimated to drain in backlog * latency / in_flight seconds; above
+ADMISSION_MAX_DRAIN_SECONDS, or above ADMISSION_MAX_BACKLOG messages,
+submissions are shed. Each worker refreshes its view at most every
+ADMISSION_REFRESH_INTERVAL seconds, so the check costs a dict lookup on
+most requests and never waits on the relay.
+"""
+
+import math
+import os
+import threading
+import time
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_MAX_BACKLOG = int(os.getenv('ADMISSION_MAX_BACKLOG', '1000'))
+ADMISSION_MAX_DRAIN_SECONDS = float(os.getenv('ADMISSION_MAX_DRAIN_SECONDS', '300'))
+ADMISSION_MAX_RETRY_AFTER = int(os.getenv('ADMISSION_MAX_RETRY_AFTER', '600'))
+ADMISSION_WINDOW = float(os.getenv('ADMISSION_WINDOW', '60'))
+ADMISSION_REFRESH_INTERVAL = float(os.getenv('ADMISSION_REFRESH_INTERVAL', '1'))
+
+
+class AdmissionController:
+    """Decides from the shared mail queue's load whether to accept new mail work"""
+
+    def __init__(self, queue, enabled=ADMISSION_ENABLED, max_backlog=ADMISSION_MAX_BACKLOG,
+                 max_drain_seconds=ADMISSION_MAX_DRAIN_SECONDS, max_retry_after=ADMISSION_MAX_RETRY_AFTER,
+                 window=ADMISSION_WINDOW, refresh_interval=ADMISSION_REFRESH_INTERVAL):
+        self.queue = queue
+        self.enabled = enabled
+        self.max_backlog = max_backlog
+        self.max_drain_seconds = max_drain_seconds
+        self.max_retry_after = max_retry_after
+        self.window = window
+        self.refresh_interval = refresh_interval
+        self._assessed = None  # (monotonic time, assessment)
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """None to admit the request, else the seconds the client should wait"""
+        if not self.enabled:
+            return None
+        return self.state()['retry_after']
+
+    def state(self):
+        """Latest load assessment, refreshed by at most one thread at a time"""
+        assessed = self._assessed
+        if assessed is None or time.monotonic() - assessed[0] >= self.refresh_interval:
+            # Others keep using the previous assessment while one thread refreshes
+            if self._lock.acquire(blocking=assessed is None):
+                try:
+                    assessed = self._assessed = (time.monotonic(), self._assess())
+                finally:
+                    self._lock.release()
+            else:
+                assessed = self._assessed or assessed
+        return assessed[1]
+
+    def _assess(self):
+        waiting, in_flight, latency = self.queue.pressure(self.window)
+        backlog = waiting + in_flight
+        if latency is None:
+            latency = 0.0
+        parallelism = max(in_flight, 1)
+
+        allowed = self.max_backlog
+        if latency > 0:
+            allowed = min(allowed, self.max_drain_seconds * parallelism / latency)
+
+        retry_after = None
+        if backlog > allowed:
+            # Time until the backlog is back under the threshold at the current pace
+            wait = (backlog - allowed) * latency / parallelism if latency > 0 else self.window
+            retry_after = int(min(max(math.ceil(wait), 1), self.max_retry_after))
+
+        return {
+            'backlog': backlog,
+            'in_flight': in_flight,
+            'latency_ms': round(latency * 1000, 1),
+            'drain_seconds': round(backlog * latency / parallelism, 1),
+            'retry_after': retry_after
+        }
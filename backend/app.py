@@ -1,72 +1,90 @@
-from flask import Flask, request, jsonify
+from dotenv import load_dotenv
+
+# Load environment variables (before the local modules below read them)
+load_dotenv()
+
+from flask import Flask, Blueprint, request, jsonify, g, Response, current_app
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_talisman import Talisman
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from functools import wraps
 import json
 import html
-from email_validator import validate_email as validate_email_lib, EmailNotValidError
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
+import hmac
+import smtplib
+import uuid
+from log_config import configure_logging
+from db import database_path
+from mail_queue import MailQueue
+from admission import AdmissionController
+from relay_pool import RelayPool, parse_relays
+from cache import TTLCache
+from content_filter import ContentFilter, load_patterns
+import rate_limit_storage  # noqa: F401 - registers the sqlite:// limiter storage
+from email_templates import render_contact_emails, render_admin_digest, render_test_email
+from mime_builder import assemble_message, encode_body
+import metrics
+import autoscale
+import profiler
+from health import HealthMonitor
+from static_responses import FORCE_HTTPS, ConstantJSON, add_security_headers, redirect_to_https
+import json_codec
+from json_codec import FastJSONProvider
+from request_schema import ObjectSchema, SchemaError
+from idempotency import IdempotencyIndex, submission_key
+from submissions import SubmissionStore, SubmissionQuery, encode_cursor, decode_cursor, ndjson_lines, csv_lines
+
+# All routes live on this blueprint; create_app() builds the application around it
+api = Blueprint('api', __name__)
 
 # Security: Configure CORS with restricted origins
 allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:5173').split(',')
-CORS(app, resources={
-    r"/api/*": {
-        "origins": allowed_origins,
-        "methods": ["GET", "POST"],
-        "allow_headers": ["Content-Type"],
-        "max_age": 3600
-    }
-})
-
-# Security: Add security headers
-Talisman(app, 
-    force_https=False,  # Set to True in production with HTTPS
-    strict_transport_security=True,
-    strict_transport_security_max_age=31536000,
-    content_security_policy={
-        'default-src': "'self'",
-        'script-src': "'self'",
-        'style-src': "'self' 'unsafe-inline'"
-    },
-    content_security_policy_nonce_in=['script-src']
-)
 
-# Security: Set max request size (16KB)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024
+def count_rate_limit_rejection(request_limit):
+    """Limiter breach callback: count the rejection, keep the default 429 response"""
+    metrics.inc('sysdak_rate_limit_rejections_total', endpoint=request.endpoint or 'unmatched')
 
 # Security: Add rate limiting
+# Counters live in a SQLite table shared by every worker on the host (see rate_limit_storage)
 limiter = Limiter(
-    app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'sqlite://rate_limits.db'),
+    strategy=os.getenv('RATELIMIT_STRATEGY', 'fixed-window'),
+    on_breach=count_rate_limit_rejection
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('email_service.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Error replies that never change, serialized once (see static_responses)
+NOT_FOUND = ConstantJSON(404, success=False, message='Resource not found')
+REQUEST_TOO_LARGE = ConstantJSON(413, success=False, message='Request too large')
+INTERNAL_ERROR = ConstantJSON(500, success=False, message='An error occurred')
+UNAUTHORIZED = ConstantJSON(401, success=False, message='Unauthorized')
+EMAIL_NOT_CONFIGURED = ConstantJSON(500, success=False, message='Email service not configured')
+INVALID_IDEMPOTENCY_KEY = ConstantJSON(400, success=False, message='Invalid Idempotency-Key')
+REQUEST_IN_PROGRESS = ConstantJSON(409, success=False, message='An identical request is still being processed')
+CONTACT_FAILED = ConstantJSON(500, success=False, message='An error occurred while processing your request.')
+SUBMISSION_NOT_FOUND = ConstantJSON(404, success=False, message='Submission not found')
+NOTIFY_FIELDS_REQUIRED = ConstantJSON(400, success=False, message='subject and message are required')
+INVALID_RECIPIENTS = ConstantJSON(400, success=False, message='recipients must be a list of valid email addresses')
+INVALID_LIMIT = ConstantJSON(400, success=False, message='limit must be an integer')
+INVALID_IDS = ConstantJSON(400, success=False, message='ids must be a list of integers')
+INVALID_EXPORT_FORMAT = ConstantJSON(400, success=False, message='format must be ndjson or csv')
+INVALID_EXPORT_FILTER = ConstantJSON(400, success=False, message='since and until must be ISO 8601 or epoch seconds')
+INVALID_CURSOR = ConstantJSON(400, success=False, message='Invalid cursor')
+INVALID_PROFILER_REQUEST = ConstantJSON(400, success=False, message='enabled must be a boolean and seconds a positive number')
+CAPTURE_NOT_FOUND = ConstantJSON(404, success=False, message='Capture not found')
+INVALID_EMAIL = ConstantJSON(400, success=False, message='Invalid email address')
+INVALID_REQUEST_BODY = ConstantJSON(400, success=False, message='Invalid request body')
+TEST_EMAIL_FAILED = ConstantJSON(500, success=False, message='Failed to send test email')
+ENDPOINT_FAILED = ConstantJSON(500, success=False, message='Error occurred')
+SERVICE_BUSY = ConstantJSON(503, success=False, message='We are receiving a lot of messages right now. Please try again shortly.')
+
 # Email configuration
 EMAIL_CONFIG = {
     'host': os.getenv('EMAIL_HOST', 'smtp.gmail.com'),
@@ -75,16 +93,96 @@ EMAIL_CONFIG = {
     'username': os.getenv('EMAIL_USERNAME', ''),
     'password': os.getenv('EMAIL_PASSWORD', ''),
     'from_email': os.getenv('EMAIL_FROM', ''),
-    'to_emails': os.getenv('EMAIL_TO', '').split(',') if os.getenv('EMAIL_TO') else []
+    'to_emails': os.getenv('EMAIL_TO', '').split(',') if os.getenv('EMAIL_TO') else [],
+    'timeout': float(os.getenv('EMAIL_TIMEOUT', '30')),
+    'pool_size': int(os.getenv('EMAIL_POOL_SIZE', '2')),
+    'pool_idle_ttl': float(os.getenv('EMAIL_POOL_IDLE_TTL', '60')),
+    'max_recipients_per_message': int(os.getenv('EMAIL_MAX_RECIPIENTS', '50')),
+    'connect_timeout': float(os.getenv('EMAIL_CONNECT_TIMEOUT', '10')),
+    'relay_failure_threshold': int(os.getenv('EMAIL_RELAY_FAILURE_THRESHOLD', '5')),
+    'relay_reset_timeout': float(os.getenv('EMAIL_RELAY_RESET_TIMEOUT', '30'))
 }
+# Relays to balance across; defaults to the single EMAIL_HOST/EMAIL_PORT relay
+EMAIL_CONFIG['relays'] = parse_relays(os.getenv('EMAIL_RELAYS', ''), EMAIL_CONFIG['host'], EMAIL_CONFIG['port'])
+
+# Digest mode: admin notifications are merged into one email per interval or per batch
+ADMIN_DIGEST_ENABLED = os.getenv('ADMIN_DIGEST_ENABLED', 'false').lower() == 'true'
+
+# Bearer token for internal endpoints such as /api/notify (disabled when empty)
+INTERNAL_API_TOKEN = os.getenv('INTERNAL_API_TOKEN', '')
+
+# Config readiness (computed once) and the cached SMTP liveness probe
+health_monitor = HealthMonitor(EMAIL_CONFIG)
+
+# Reusable authenticated SMTP sessions for this worker, per relay, with failover
+relay_pool = RelayPool(EMAIL_CONFIG)
+
+# Outbound mail queue: contact emails are delivered by a background dispatcher
+mail_queue = MailQueue(
+    database_path(os.getenv('MAIL_QUEUE_DB', 'mail_queue.db')),
+    sender=lambda **message: deliver_email(**message),
+    poll_interval=float(os.getenv('MAIL_QUEUE_POLL_INTERVAL', '1.0')),
+    concurrency=int(os.getenv('MAIL_QUEUE_CONCURRENCY', '2')),
+    max_attempts=int(os.getenv('MAIL_MAX_ATTEMPTS', '8')),
+    retry_base_delay=float(os.getenv('MAIL_RETRY_BASE_DELAY', '30')),
+    retry_max_delay=float(os.getenv('MAIL_RETRY_MAX_DELAY', '3600')),
+    digest_builder=lambda held: build_admin_digest(held),
+    digest_interval=float(os.getenv('ADMIN_DIGEST_INTERVAL', '300')),
+    digest_max_items=int(os.getenv('ADMIN_DIGEST_MAX_SUBMISSIONS', '50'))
+)
+
+# Sheds new mail work with 503 + Retry-After while the queue drains too slowly
+admission = AdmissionController(mail_queue)
+
+# Every accepted contact submission, written in batches by a background thread
+submission_store = SubmissionStore(database_path(os.getenv('SUBMISSIONS_DB', 'submissions.db')))
+
+# Responses of recent submissions, so repeats are answered without sending mail again
+idempotency_index = IdempotencyIndex(
+    database_path(os.getenv('IDEMPOTENCY_DB', 'idempotency.db')),
+    ttl=float(os.getenv('IDEMPOTENCY_TTL', '600')),
+    max_keys=int(os.getenv('IDEMPOTENCY_MAX_KEYS', '10000'))
+)
+
+# Memoized validation outcomes; invalid addresses are cached for a shorter time
+email_validation_cache = TTLCache(
+    max_size=int(os.getenv('EMAIL_VALIDATION_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('EMAIL_VALIDATION_CACHE_TTL', '3600'))
+)
+EMAIL_VALIDATION_NEGATIVE_TTL = float(os.getenv('EMAIL_VALIDATION_NEGATIVE_TTL', '600'))
 
 def validate_email(email):
-    """Validate email format using industry-standard library"""
+    """Validate email format using industry-standard library (memoized)
+
+    Results are cached per address with the domain lowercased, as domains
+    are case-insensitive; case variants of one address share an entry.
+    """
+    if not isinstance(email, str):
+        return False
+    if email != email.strip():
+        # The validator refuses surrounding whitespace; padded variants are
+        # not worth a cache entry each
+        return False
+
+    local, at, domain = email.rpartition('@')
+    key = f"{local}{at}{domain.lower()}"
+    cached = email_validation_cache.get(key)
+    metrics.inc('sysdak_email_validation_cache_lookups_total', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        return cached
+
+    # Imported on first use: email_validator is the slowest import in the app
+    from email_validator import validate_email as validate_email_lib, EmailNotValidError
+
     try:
-        valid = validate_email_lib(email, check_deliverability=False)
-        return True
+        validate_email_lib(email, check_deliverability=False)
+        valid, ttl = True, None
     except EmailNotValidError:
-        return False
+        valid, ttl = False, EMAIL_VALIDATION_NEGATIVE_TTL
+    evicted = email_validation_cache.set(key, valid, ttl=ttl)
+    if evicted:
+        metrics.inc('sysdak_email_validation_cache_evictions_total', evicted)
+    return valid
 
 def redact_email(email):
     """Redact email for logging: user@domain.com -> u***@d*****.com"""
@@ -96,219 +194,244 @@ def redact_email(email):
         pass
     return "***"
 
+# Blocklist of injection, spam and phishing patterns, matched in one pass per field
+content_filter = ContentFilter(load_patterns())
+
+# Maximum lengths of the free-text contact form fields
+FIELD_LIMITS = {
+    'name': (100, 'Name'),
+    'subject': (200, 'Subject'),
+    'message': (5000, 'Message')
+}
+
+# Request bodies accepted by the public endpoints, checked while they are decoded
+CONTACT_SCHEMA = ObjectSchema({'email': (254, 'Email'), **FIELD_LIMITS})
+TEST_EMAIL_SCHEMA = ObjectSchema({'email': (254, 'Email')})
+
 def validate_contact_form(data):
     """Comprehensive form validation"""
+    if not isinstance(data, dict):
+        return ['Invalid request body']
+
     errors = []
-    
+
     # Check required fields
     required_fields = ['name', 'email', 'subject', 'message']
     for field in required_fields:
-        if not data.get(field) or not str(data.get(field)).strip():
+        value = data.get(field)
+        if not value or not str(value).strip():
             errors.append(f'{field} is required')
-    
+        elif not isinstance(value, str):
+            errors.append(f'{field} must be a string')
+
     if errors:
         return errors
-    
+
     # Length limits
-    if len(data.get('name', '')) > 100:
-        errors.append('Name too long (max 100 characters)')
-    if len(data.get('subject', '')) > 200:
-        errors.append('Subject too long (max 200 characters)')
-    if len(data.get('message', '')) > 5000:
-        errors.append('Message too long (max 5000 characters)')
-    
+    for field, (limit, label) in FIELD_LIMITS.items():
+        if len(data[field]) > limit:
+            errors.append(f'{label} too long (max {limit} characters)')
+
     # Email validation
-    if not validate_email(data.get('email', '')):
+    if not validate_email(data['email']):
         errors.append('Invalid email format')
-    
-    # Prevent injection attempts
-    dangerous_patterns = ['<script', 'javascript:', 'onerror=', 'onload=']
-    for field in ['name', 'subject', 'message']:
-        value = str(data.get(field, '')).lower()
-        if any(pattern in value for pattern in dangerous_patterns):
-            errors.append(f'Invalid content detected in {field}')
-    
+
+    # Prevent injection attempts and known spam/phishing content
+    flagged = content_filter.scan_fields({field: data[field] for field in FIELD_LIMITS})
+    for field, matches in flagged.items():
+        errors.append(f'Invalid content detected in {field}')
+        logger.warning(f"Content filter flagged {field}: " + ', '.join(
+            f"{match.category}:{match.pattern}@{match.offset}" for match in matches))
+
     return errors
 
 def require_email_config(f):
     """Decorator to check if email is configured"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not all([EMAIL_CONFIG['username'], EMAIL_CONFIG['password'], EMAIL_CONFIG['from_email'], EMAIL_CONFIG['to_emails']]):
-            return jsonify({
-                'success': False,
-                'message': 'Email service not configured'
-            }), 500
+        if not health_monitor.email_configured:
+            return EMAIL_NOT_CONFIGURED.response()
         return f(*args, **kwargs)
     return decorated_function
 
-def create_contact_email_template(data):
-    """Create HTML email template for contact form submission - XSS SAFE"""
-    # Sanitize all user inputs
-    safe_data = {
-        'name': html.escape(data['name']),
-        'email': html.escape(data['email']),
-        'subject': html.escape(data['subject']),
-        'message': html.escape(data['message']).replace('\n', '<br>')
-    }
-    
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <title>New Contact Form Submission</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background-color: #0F52BA; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .content {{ padding: 30px; background-color: #f9f9f9; border-radius: 0 0 10px 10px; }}
-            .field {{ margin-bottom: 20px; padding: 15px; background-color: white; border-radius: 5px; border-left: 4px solid #0F52BA; }}
-            .label {{ font-weight: bold; color: #0F52BA; display: block; margin-bottom: 5px; }}
-            .footer {{ text-align: center; padding: 20px; color: #666; font-size: 12px; }}
-            .timestamp {{ color: #888; font-size: 12px; margin-top: 10px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>📧 New Contact Form Submission</h1>
-                <p>SysDak Website - Customer Inquiry</p>
-            </div>
-            <div class="content">
-                <div class="field">
-                    <span class="label">👤 Name:</span>
-                    <span>{safe_data['name']}</span>
-                </div>
-                <div class="field">
-                    <span class="label">📧 Email:</span>
-                    <span>{safe_data['email']}</span>
-                </div>
-                <div class="field">
-                    <span class="label">📝 Subject:</span>
-                    <span>{safe_data['subject']}</span>
-                </div>
-                <div class="field">
-                    <span class="label">💬 Message:</span>
-                    <p>{safe_data['message']}</p>
-                </div>
-                <div class="timestamp">
-                    <strong>Submitted:</strong> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-                </div>
-            </div>
-            <div class="footer">
-                <p>This email was sent from the contact form on your website.</p>
-                <p>SysDak - IT Solutions &amp; Services</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-
-def create_auto_reply_template(data):
-    """Create HTML email template for auto-reply - XSS SAFE"""
-    # Sanitize all user inputs
-    safe_data = {
-        'name': html.escape(data['name']),
-        'email': html.escape(data['email']),
-        'subject': html.escape(data['subject']),
-        'message': html.escape(data['message']).replace('\n', '<br>')
-    }
-    
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <title>Thank You for Contacting Us</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background-color: #0F52BA; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-            .content {{ padding: 30px; background-color: #f9f9f9; border-radius: 0 0 10px 10px; }}
-            .message-box {{ background-color: white; padding: 20px; border-radius: 5px; border-left: 4px solid #0F52BA; margin: 20px 0; }}
-            .contact-info {{ background-color: #e8f4f8; padding: 15px; border-radius: 5px; margin-top: 20px; }}
-            .footer {{ text-align: center; padding: 20px; color: #666; font-size: 12px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🎉 Thank You for Contacting Us!</h1>
-                <p>We've received your message</p>
-            </div>
-            <div class="content">
-                <p>Dear {safe_data['name']},</p>
-                <p>Thank you for reaching out to SysDak. We have received your message regarding <strong>"{safe_data['subject']}"</strong> and will get back to you as soon as possible.</p>
-
-                <div class="message-box">
-                    <h3>📋 Your Message:</h3>
-                    <p><em>{safe_data['message']}</em></p>
-                </div>
-
-                <p>Our team typically responds within <strong>24-48 business hours</strong>. If you need immediate assistance, please don't hesitate to call us directly.</p>
-
-                <div class="contact-info">
-                    <h3>📞 Contact Information:</h3>
-                    <p><strong>Phone:</strong> +91 8946060246</p>
-                    <p><strong>Email:</strong> contact@sysdak.com</p>
-                    <p><strong>Address:</strong> Plot no 48 Nirmun Layout A Samanapalli Road Sipcot 2 Hosur - 635109</p>
-                </div>
-
-                <p>Best regards,<br>
-                <strong>The SysDak Team</strong></p>
-            </div>
-            <div class="footer">
-                <p>SysDak - IT Solutions &amp; Services</p>
-                <p>© 2024 All rights reserved.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-
-def send_email(to_emails, subject, html_content, text_content=None, reply_to=None):
-    """Send email using SMTP"""
-    try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = EMAIL_CONFIG['from_email']
-        msg['To'] = ', '.join(to_emails) if isinstance(to_emails, list) else to_emails
-        if reply_to:
-            msg['Reply-To'] = reply_to
-
-        # Add HTML content
-        msg.attach(MIMEText(html_content, 'html'))
+def require_api_token(f):
+    """Decorator to restrict internal endpoints to holders of INTERNAL_API_TOKEN"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[7:] if auth_header.startswith('Bearer ') else ''
+        if not INTERNAL_API_TOKEN or not hmac.compare_digest(token, INTERNAL_API_TOKEN):
+            return UNAUTHORIZED.response()
+        return f(*args, **kwargs)
+    return decorated_function
 
-        # Add text content if provided
-        if text_content:
-            msg.attach(MIMEText(text_content, 'plain'))
+def shed_when_saturated(f):
+    """Decorator to turn requests away while the mail backlog cannot keep up"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        retry_after = admission.retry_after()
+        if retry_after is not None:
+            metrics.inc('sysdak_admission_rejections_total', endpoint=request.endpoint)
+            response = SERVICE_BUSY.response()
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        return f(*args, **kwargs)
+    return decorated_function
 
-        # Connect to SMTP server and send email
-        server = smtplib.SMTP(EMAIL_CONFIG['host'], EMAIL_CONFIG['port'])
+def parse_json_body(schema):
+    """Decorator to parse the JSON body against a schema into g.json_body
 
-        if EMAIL_CONFIG['use_tls']:
-            server.starttls()
+    Unknown fields, non-string values and over-long strings are refused
+    with 400 as soon as the parser reaches them.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not request.is_json:
+                return INVALID_REQUEST_BODY.response()
+            try:
+                g.json_body = schema.parse(request.get_data())
+            except SchemaError as e:
+                metrics.inc('sysdak_schema_rejections_total', endpoint=request.endpoint)
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def idempotent_submission(f):
+    """Decorator to answer repeated submissions with the original response
+
+    Requests are keyed by their Idempotency-Key header, or else by the
+    normalized email, subject and message. Only successful responses are
+    kept; any other outcome releases the key so a corrected or retried
+    submission is processed afresh. Expects the body parsed by parse_json_body.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        data = g.json_body
+        key = submission_key(request.headers.get('Idempotency-Key'),
+                             (data.get('email'), data.get('subject'), data.get('message')))
+        if key is None:
+            return INVALID_IDEMPOTENCY_KEY.response()
+
+        previous = idempotency_index.claim(key)
+        if previous is not None:
+            status, body = previous
+            if status is None:
+                return REQUEST_IN_PROGRESS.response()
+            response = current_app.response_class(body, status=status, mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency_index.release(key)
+            raise
+        if 200 <= response.status_code < 300:
+            idempotency_index.store(key, response.status_code, response.get_data(as_text=True))
+        else:
+            idempotency_index.release(key)
+        return response
+    return decorated_function
 
-        server.login(EMAIL_CONFIG['username'], EMAIL_CONFIG['password'])
-        server.send_message(msg)
-        server.quit()
+def build_message(to_header, subject, html_content=None, text_content=None, reply_to=None,
+                  html_encoded=None, text_encoded=None):
+    """Build the raw MIME message shared by single and bulk sends
 
+    Bodies rendered from precompiled templates arrive already base64-encoded
+    (html_encoded/text_encoded); plain strings are encoded here.
+    """
+    if html_encoded is None:
+        html_encoded = encode_body(html_content)
+    if text_encoded is None and text_content:
+        text_encoded = encode_body(text_content)
+
+    return assemble_message(EMAIL_CONFIG['from_email'], to_header, subject, html_encoded, text_encoded, reply_to)
+
+def prepare_envelope(to_emails, subject, html_content=None, text_content=None, reply_to=None,
+                     html_encoded=None, text_encoded=None):
+    """Turn send_email arguments into (recipients, raw message bytes)"""
+    recipients = to_emails if isinstance(to_emails, list) else [to_emails]
+    msg = build_message(', '.join(recipients), subject, html_content, text_content, reply_to,
+                        html_encoded, text_encoded)
+    return recipients, msg
+
+def deliver_email(to_emails, subject, html_content=None, text_content=None, reply_to=None,
+                  html_encoded=None, text_encoded=None):
+    """Send email using SMTP, raising on failure so the caller can decide whether to retry"""
+    recipients, msg = prepare_envelope(to_emails, subject, html_content, text_content, reply_to,
+                                       html_encoded, text_encoded)
+
+    # Send over a pooled, already authenticated session on the best available relay
+    relay_pool.send_message(msg, EMAIL_CONFIG['from_email'], recipients)
+
+def send_email(to_emails, subject, html_content=None, text_content=None, reply_to=None,
+               html_encoded=None, text_encoded=None):
+    """Send email using SMTP"""
+    try:
+        deliver_email(to_emails, subject, html_content, text_content, reply_to, html_encoded, text_encoded)
         return True
     except Exception as e:
         logger.error(f"Error sending email: {str(e)}")
         return False
 
-@app.route('/api/contact', methods=['POST'])
-@limiter.limit("5 per hour")  # Security: Rate limit to prevent abuse
+def send_bulk_email(recipients, subject, html_content, text_content=None, reply_to=None):
+    """Send one message to many recipients in as few SMTP transactions as possible
+
+    Recipients are deduplicated and BCC'd on the envelope in chunks of
+    EMAIL_CONFIG['max_recipients_per_message'], reusing a pooled session.
+    Each chunk is its own transaction, so a chunk that fails only marks its
+    own recipients as failed. Returns (transaction_count, failed_recipients).
+    """
+    recipients = list(dict.fromkeys(r.strip() for r in recipients if r and r.strip()))
+    chunk_size = max(EMAIL_CONFIG['max_recipients_per_message'], 1)
+    chunks = [recipients[i:i + chunk_size] for i in range(0, len(recipients), chunk_size)]
+
+    # The visible To header never lists the other recipients
+    msg = build_message('undisclosed-recipients:;', subject, html_content, text_content, reply_to)
+
+    failed = []
+    for chunk in chunks:
+        try:
+            refused, = relay_pool.send_messages([(msg, EMAIL_CONFIG['from_email'], chunk)])
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients
+        except Exception as e:
+            logger.error(f"Error sending bulk email to {len(chunk)} recipients: {str(e)}")
+            refused = chunk
+        failed.extend(refused)
+    return len(chunks), failed
+
+def build_admin_digest(held):
+    """Payload of the digest email for held admin notifications"""
+    submissions = [message['submission'] for message in held]
+    digest = {'to_emails': EMAIL_CONFIG['to_emails'], **render_admin_digest(submissions)}
+    if len(submissions) == 1:
+        digest['reply_to'] = submissions[0]['email']
+    return digest
+
+def should_deduct(response):
+    """Replayed idempotent responses and shed requests do not count against rate limits"""
+    return response.status_code != 503 and response.headers.get('Idempotent-Replayed') != 'true'
+
+@api.route('/api/contact', methods=['POST'])
+@limiter.limit("5 per hour", deduct_when=should_deduct)  # Security: Rate limit to prevent abuse
 @require_email_config
+@parse_json_body(CONTACT_SCHEMA)
+@idempotent_submission  # Replays an accepted submission even while shedding
+@shed_when_saturated
 def handle_contact_form():
     """Handle contact form submission"""
     try:
-        data = request.get_json()
+        data = g.json_body
 
         # Security: Comprehensive input validation
-        errors = validate_contact_form(data)
+        with metrics.timed('validation'):
+            errors = validate_contact_form(data)
         if errors:
             return jsonify({
                 'success': False,
@@ -318,117 +441,268 @@ def handle_contact_form():
         # Security: Log with redacted email
         logger.info(f"Contact form submission from {redact_email(data['email'])}: {html.escape(data['subject'][:50])}")
 
-        # Send email to admin
-        admin_subject = f"New Contact Form Submission: {data['subject']}"
-        admin_html = create_contact_email_template(data)
-        admin_text = f"""
-New Contact Form Submission
-
-Name: {data['name']}
-Email: {data['email']}
-Subject: {data['subject']}
-Message: {data['message']}
-
-Submitted: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-        """.strip()
-
-        admin_email_sent = send_email(
-            EMAIL_CONFIG['to_emails'],
-            admin_subject,
-            admin_html,
-            admin_text,
-            reply_to=data['email']
-        )
-
-        # Send auto-reply to customer
-        auto_reply_subject = f"Thank you for contacting SysDak - {data['subject']}"
-        auto_reply_html = create_auto_reply_template(data)
-        auto_reply_text = f"""
-Dear {data['name']},
-
-Thank you for reaching out to SysDak. We have received your message regarding "{data['subject']}" and will get back to you as soon as possible.
-
-Your message:
-"{data['message']}"
-
-We typically respond within 24-48 business hours. If you need immediate assistance, please call us at +91 8946060246.
-
-Best regards,
-The SysDak Team
-
-SysDak - IT Solutions & Services
-Email: contact@sysdak.com
-Phone: +91 8946060246
-        """.strip()
-
-        auto_reply_sent = send_email(
-            [data['email']],
-            auto_reply_subject,
-            auto_reply_html,
-            auto_reply_text
-        )
-
-        if admin_email_sent and auto_reply_sent:
-            return jsonify({
-                'success': True,
-                'message': 'Your message has been sent successfully. We will contact you soon!'
-            })
+        # Render both emails from one set of escaped fields
+        with metrics.timed('render'):
+            emails = render_contact_emails(data, digest=ADMIN_DIGEST_ENABLED)
+
+        # In digest mode the admin notification is held for the next digest
+        if ADMIN_DIGEST_ENABLED:
+            admin_email = {'kind': 'admin', 'held': True, **emails['admin']}
         else:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to send email. Please try again.'
-            }), 500
+            admin_email = {
+                'kind': 'admin',
+                'to_emails': EMAIL_CONFIG['to_emails'],
+                'reply_to': data['email'],
+                **emails['admin']
+            }
+
+        # Queue both emails; the dispatcher delivers them off the request path
+        submission_id = uuid.uuid4().hex
+        with metrics.timed('enqueue'):
+            mail_queue.enqueue(submission_id, [
+                admin_email,
+                {
+                    'kind': 'auto_reply',
+                    'to_emails': [data['email']],
+                    **emails['auto_reply']
+                }
+            ])
+
+        # The mail is queued, so the submission has been accepted: a failure to
+        # record it must not turn into an error the client retries (and so a
+        # second pair of emails)
+        try:
+            submission_store.add(submission_id, data)
+        except Exception as e:
+            logger.error(f"Recording submission {submission_id} failed: {str(e)}")
+
+        return jsonify({
+            'success': True,
+            'message': 'Your message has been received. We will contact you soon!',
+            'submission_id': submission_id
+        }), 202
 
     except Exception as e:
         logger.error(f"Error processing contact form: {str(e)}")
+        return CONTACT_FAILED.response()
+
+@api.route('/api/contact/<submission_id>', methods=['GET'])
+def contact_status(submission_id):
+    """Report per-message delivery state of a contact submission"""
+    status = mail_queue.status(submission_id) if len(submission_id) == 32 else None
+    if status is None:
+        return SUBMISSION_NOT_FOUND.response()
+
+    return jsonify({
+        'success': True,
+        'submission_id': submission_id,
+        **status
+    })
+
+@api.route('/api/notify', methods=['POST'])
+@limiter.limit("30 per hour")
+@require_api_token
+@require_email_config
+def notify():
+    """Internal endpoint: fan a notification out to many recipients"""
+    try:
+        data = request.get_json() or {}
+        recipients = data.get('recipients') or EMAIL_CONFIG['to_emails']
+        subject = str(data.get('subject', '')).strip()
+        message = str(data.get('message', '')).strip()
+
+        if not subject or not message:
+            return NOTIFY_FIELDS_REQUIRED.response()
+        if not isinstance(recipients, list) or not all(isinstance(r, str) and validate_email(r) for r in recipients):
+            return INVALID_RECIPIENTS.response()
+
+        html_content = data.get('html') or f"<p>{html.escape(message).replace(chr(10), '<br>')}</p>"
+        transactions, failed = send_bulk_email(recipients, subject, html_content, message)
+
+        logger.info(f"Notification fanned out to {len(recipients)} recipients in {transactions} transactions ({len(failed)} failed)")
+
         return jsonify({
-            'success': False,
-            'message': 'An error occurred while processing your request.'
-        }), 500
+            'success': not failed,
+            'transactions': transactions,
+            'failed': failed
+        }), 200 if not failed else 502
 
-@app.route('/api/health', methods=['GET'])
+    except Exception as e:
+        logger.error(f"Error in notify: {str(e)}")
+        return ENDPOINT_FAILED.response()
+
+@api.route('/api/health', methods=['GET'])
+@limiter.exempt
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (cached; never waits on the SMTP relay)"""
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'email_configured': all([EMAIL_CONFIG['username'], EMAIL_CONFIG['password'], EMAIL_CONFIG['from_email'], EMAIL_CONFIG['to_emails']])
+        'email_configured': health_monitor.email_configured,
+        'smtp': health_monitor.smtp_status()
+    })
+
+@api.route('/api/health/deep', methods=['GET'])
+@limiter.exempt
+def deep_health_check():
+    """Readiness check: fails unless mail is configured and the relay answered a recent probe"""
+    smtp = health_monitor.smtp_status(wait=True)
+    healthy = health_monitor.email_configured and smtp['reachable']
+    return jsonify({
+        'status': 'healthy' if healthy else 'unhealthy',
+        'timestamp': datetime.now().isoformat(),
+        'email_configured': health_monitor.email_configured,
+        'smtp': smtp,
+        'relays': relay_pool.status(),
+        'mail_queue_depth': mail_queue.depth(),
+        'admission': admission.state(),
+        'json_codec': json_codec.BACKEND
+    }), 200 if healthy else 503
+
+@api.route('/api/admin/dead-letters', methods=['GET'])
+@require_api_token
+def list_dead_letters():
+    """Internal endpoint: messages that failed for good (newest first)"""
+    try:
+        limit = min(max(int(request.args.get('limit', '100')), 1), 1000)
+    except ValueError:
+        return INVALID_LIMIT.response()
+    include_replayed = request.args.get('include_replayed', 'false').lower() == 'true'
+
+    return jsonify({
+        'success': True,
+        'dead_letters': mail_queue.dead_letters(limit, include_replayed)
     })
 
-@app.route('/api/test-email', methods=['POST'])
-@limiter.limit("3 per hour")  # Security: Rate limit test endpoint
+@api.route('/api/admin/dead-letters/replay', methods=['POST'])
+@require_api_token
+def replay_dead_letters():
+    """Internal endpoint: queue dead letters again (the listed ids, or all of them)"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return INVALID_IDS.response()
+
+    replayed = mail_queue.replay(ids)
+    logger.info(f"Replayed {replayed} dead-lettered emails")
+    return jsonify({'success': True, 'replayed': replayed})
+
+def parse_timestamp(value):
+    """Epoch seconds from an ISO 8601 string (UTC unless it has an offset) or a number"""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+@api.route('/api/submissions', methods=['GET'])
+@require_api_token
+def export_submissions():
+    """Internal endpoint: stream stored submissions as NDJSON or CSV, oldest first
+
+    Filters: since/until (until is exclusive), domain (sender domain) and
+    subject (case-insensitive prefix). With `limit`, one page is returned and
+    X-Next-Cursor carries the `cursor` to pass for the next one.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return INVALID_EXPORT_FORMAT.response()
+    try:
+        since, until = (parse_timestamp(request.args[name]) if request.args.get(name) else None
+                        for name in ('since', 'until'))
+    except ValueError:
+        return INVALID_EXPORT_FILTER.response()
+    try:
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return INVALID_CURSOR.response()
+    try:
+        limit = min(max(int(request.args['limit']), 1), 100000) if request.args.get('limit') else None
+    except ValueError:
+        return INVALID_LIMIT.response()
+
+    query = SubmissionQuery(since, until, request.args.get('domain'), request.args.get('subject'), after)
+    headers = {}
+    rows = ()
+    if limit is None:
+        rows = submission_store.iter_rows(query)
+    else:
+        # Fix the page's end up front so the cursor can go in a header before streaming
+        last, more = submission_store.page_bounds(query, limit)
+        if more:
+            headers['X-Next-Cursor'] = encode_cursor(*last)
+        if last is not None:
+            rows = submission_store.iter_rows(query, until_key=last)
+    if export_format == 'csv':
+        headers['Content-Disposition'] = 'attachment; filename="submissions.csv"'
+        return Response(csv_lines(rows), mimetype='text/csv', headers=headers)
+    return Response(ndjson_lines(rows), mimetype='application/x-ndjson', headers=headers)
+
+@api.route('/api/admin/profiler', methods=['GET', 'POST'])
+@require_api_token
+def profiler_control():
+    """Internal endpoint: switch sampling on or off in the worker serving the call
+
+    GET reports that worker's state and the newest captures on the host.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        enabled, seconds = data.get('enabled', True), data.get('seconds')
+        if not isinstance(enabled, bool) or (seconds is not None and (
+                isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0)):
+            return INVALID_PROFILER_REQUEST.response()
+        if enabled:
+            profiler.profiler.enable(seconds)
+        else:
+            profiler.profiler.disable()
+        logger.info(f"Profiling {'enabled' if enabled else 'disabled'} via API in worker {os.getpid()}")
+
+    return jsonify({
+        'success': True,
+        'profiler': profiler.profiler.status(),
+        'captures': profiler.captures()
+    })
+
+@api.route('/api/admin/profiler/captures/<name>', methods=['GET'])
+@require_api_token
+def profiler_capture(name):
+    """Internal endpoint: a capture's stacks in the collapsed (flamegraph) format"""
+    stacks = profiler.capture_stacks(name)
+    if stacks is None:
+        return CAPTURE_NOT_FOUND.response()
+    return Response(stacks, mimetype='text/plain')
+
+@api.route('/api/metrics', methods=['GET'])
+@limiter.exempt
+@require_api_token
+def metrics_endpoint():
+    """Prometheus text metrics combined across all workers on this host"""
+    gauges = [
+        ('sysdak_mail_queue_depth', {}, mail_queue.depth()),
+        ('sysdak_email_validation_cache_entries', {}, email_validation_cache.stats()['size'])
+    ] + autoscale.metrics_gauges()
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/test-email', methods=['POST'])
+@limiter.limit("3 per hour", deduct_when=should_deduct)  # Security: Rate limit test endpoint
 @require_email_config
+@shed_when_saturated
+@parse_json_body(TEST_EMAIL_SCHEMA)
 def test_email():
     """Test email configuration"""
     try:
-        data = request.get_json()
+        data = g.json_body
         test_email_addr = data.get('email', EMAIL_CONFIG['from_email'])
         
         # Security: Validate email
         if not validate_email(test_email_addr):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid email address'
-            }), 400
+            return INVALID_EMAIL.response()
 
         # Send test email
-        subject = "SysDak Email Service Test"
-        html_content = """
-        <h2>🧪 Email Service Test</h2>
-        <p>This is a test email from the SysDak email service.</p>
-        <p>If you received this email, the SMTP configuration is working correctly!</p>
-        <p><strong>Timestamp:</strong> """ + datetime.now().strftime('%B %d, %Y at %I:%M %p') + """</p>
-        """
-        text_content = f"""
-Email Service Test
-
-This is a test email from the SysDak email service.
-If you received this email, the SMTP configuration is working correctly!
-
-Timestamp: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-        """.strip()
-
-        success = send_email([test_email_addr], subject, html_content, text_content)
+        test_message = render_test_email()
+        success = send_email([test_email_addr], **test_message)
 
         if success:
             return jsonify({
@@ -436,45 +710,85 @@ Timestamp: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
                 'message': f'Test email sent successfully to {test_email_addr}'
             })
         else:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to send test email'
-            }), 500
+            return TEST_EMAIL_FAILED.response()
 
     except Exception as e:
         logger.error(f"Error in test email: {str(e)}")
-        return jsonify({
-            'success': False,
-            'message': 'Error occurred'
-        }), 500
-
-# Security: Add security headers to all responses
-@app.after_request
-def add_security_headers(response):
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
+        return ENDPOINT_FAILED.response()
+
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@api.after_app_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('sysdak_http_request_duration_seconds', time.perf_counter() - started,
+                        endpoint=endpoint, method=request.method, status=str(response.status_code))
     return response
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
-    return jsonify({'success': False, 'message': 'Resource not found'}), 404
+    return NOT_FOUND.response()
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     logger.error(f"Internal error: {str(error)}")
-    return jsonify({'success': False, 'message': 'An error occurred'}), 500
+    return INTERNAL_ERROR.response()
 
-@app.errorhandler(413)
+@api.app_errorhandler(413)
 def request_entity_too_large(error):
     """Handle request too large errors"""
-    return jsonify({'success': False, 'message': 'Request too large'}), 413
+    return REQUEST_TOO_LARGE.response()
+
+def create_app():
+    """Build the Flask application
+
+    Module-level state (config, compiled templates, the content filter) is
+    built at import, so with Gunicorn's preload_app it is created once in
+    the master and shared copy-on-write by every worker. Connections and
+    background threads are opened lazily in the worker that uses them.
+    """
+    # Configure logging: records are queued and written off the request path (see log_config)
+    configure_logging()
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+
+    # Security: Set max request size (16KB)
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024
+
+    # Rate limiting can only be switched off explicitly (load tests, local development)
+    app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": allowed_origins,
+            "methods": ["GET", "POST"],
+            "allow_headers": ["Content-Type", "Idempotency-Key"],
+            "expose_headers": ["Idempotent-Replayed", "Retry-After"],
+            "max_age": 3600
+        }
+    })
+
+    # Security: Add security headers to all responses (precomputed, see static_responses)
+    app.after_request(add_security_headers)
+    if FORCE_HTTPS:
+        app.before_request(redirect_to_https)
+
+    limiter.init_app(app)
+    app.register_blueprint(api)
+    return app
 
 if __name__ == '__main__':
+    app = create_app()
+
     # Check email configuration on startup
-    if not all([EMAIL_CONFIG['username'], EMAIL_CONFIG['password'], EMAIL_CONFIG['from_email'], EMAIL_CONFIG['to_emails']]):
+    if not health_monitor.email_configured:
         logger.warning("Email service not fully configured. Some features may not work.")
 
     logger.info("Starting SysDak Email Service API...")
@@ -486,5 +800,9 @@ if __name__ == '__main__':
     
     if debug_mode:
         logger.warning("⚠️  DEBUG MODE IS ENABLED - DO NOT USE IN PRODUCTION!")
+
+    # The reloader's parent process only watches files; the child serves
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        mail_queue.start()
     
     app.run(debug=debug_mode, host=host, port=port)
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+ASGI Entry Point for the async serving mode
+
+Serves the Flask application to an ASGI server (uvicorn workers under
+Gunicorn) and swaps the per-worker mail dispatcher thread for an asyncio
+dispatcher with non-blocking SMTP, so slow relays hold coroutines instead
+of processes.
+
+Usage:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \\
+        gunicorn -c gunicorn.conf.py asgi:application
+
+Requires the packages in requirements-async.txt.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+# Load environment variables
+from dotenv import load_dotenv
+load_dotenv()
+
+# Import the Flask application
+from app import create_app, mail_queue, prepare_envelope, EMAIL_CONFIG
+from async_mailer import AsyncMailDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class WSGIBridge:
+    """Runs a WSGI app on a thread pool behind an ASGI interface
+
+    asgiref's WsgiToAsgi funnels every request through a single thread, so
+    this bridge uses its own pool. Response chunks are sent as they are
+    produced, which keeps streaming responses streaming.
+    """
+
+    def __init__(self, wsgi_app, max_threads=32, max_body_size=None):
+        self.wsgi_app = wsgi_app
+        self.max_body_size = max_body_size
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi-wsgi')
+
+    async def __call__(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            # Stop buffering once the body is over the limit; Flask answers 413
+            if not message.get('more_body') or (self.max_body_size and len(body) > self.max_body_size):
+                break
+
+        loop = asyncio.get_running_loop()
+
+        def send_sync(event):
+            asyncio.run_coroutine_threadsafe(send(event), loop).result()
+
+        await loop.run_in_executor(self.executor, self._run, self._environ(scope, bytes(body)), send_sync)
+
+    def _run(self, environ, send_sync):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    send_sync({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                    started = True
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                send_sync({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            send_sync({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope['query_string'].decode('ascii'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+        for name, value in scope['headers']:
+            name = name.decode('latin1')
+            if name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            elif name == 'content-type':
+                key = 'CONTENT_TYPE'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            value = value.decode('latin1')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+app = create_app()
+
+flask_application = WSGIBridge(
+    app,
+    max_threads=int(os.getenv('ASGI_THREADS', '32')),
+    max_body_size=app.config['MAX_CONTENT_LENGTH']
+)
+
+dispatcher = AsyncMailDispatcher(
+    mail_queue,
+    prepare_envelope,
+    EMAIL_CONFIG,
+    concurrency=int(os.getenv('ASYNC_MAIL_CONCURRENCY', '100'))
+)
+
+
+async def application(scope, receive, send):
+    """ASGI application: HTTP goes to Flask, lifespan runs the mail dispatcher"""
+    if scope['type'] == 'http':
+        await flask_application(scope, receive, send)
+        return
+    if scope['type'] != 'lifespan':
+        return
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await dispatcher.start()
+            logger.info("SysDak API started in async mode (asyncio mail dispatcher)")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await dispatcher.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
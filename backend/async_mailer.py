@@ -0,0 +1,217 @@
+"""
+Asyncio mail dispatcher for the ASGI serving mode
+
+Drains the same SQLite outbound queue as the threaded dispatcher in
+mail_queue, but sends over non-blocking SMTP (aiosmtplib) on the worker's
+event loop. Each in-flight delivery is a coroutine instead of a thread, so a
+handful of processes can keep thousands of slow SMTP transactions open.
+"""
+
+import asyncio
+import logging
+import time
+
+import aiosmtplib
+
+import json_codec
+import metrics
+from relay_pool import NoRelayAvailable, RelayPool
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSMTPPool:
+    """Authenticated aiosmtplib sessions reused across sends (one per event loop)"""
+
+    def __init__(self, config, max_size=None):
+        self.config = config
+        self.max_size = max_size or config.get('pool_size', 2)
+        self.idle_ttl = config.get('pool_idle_ttl', 60)
+        self.timeout = config.get('timeout', 30)
+        self.connect_timeout = config.get('connect_timeout', self.timeout)
+        self._idle = []  # (client, last_used) pairs, most recent last
+
+    async def sendmail(self, from_addr, recipients, message):
+        """Send raw message bytes, reconnecting once if the session went stale"""
+        for attempt in (1, 2):
+            client = await self._acquire()
+            try:
+                with metrics.timed('smtp_send'):
+                    await client.sendmail(from_addr, recipients, message)
+            except aiosmtplib.SMTPServerDisconnected:
+                client.close()
+                if attempt == 2:
+                    raise
+            except aiosmtplib.SMTPResponseException as e:
+                if e.code != 421:
+                    await self._reset(client)
+                    raise
+                client.close()
+                if attempt == 2:
+                    raise
+            except Exception:
+                client.close()
+                raise
+            else:
+                self._release(client)
+                return
+
+    async def close_all(self):
+        idle, self._idle = self._idle, []
+        for client, _ in idle:
+            await self._quit(client)
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(
+            hostname=self.config['host'],
+            port=self.config['port'],
+            timeout=self.connect_timeout,
+            start_tls=False
+        )
+        with metrics.timed('smtp_connect'):
+            await client.connect()
+        client.timeout = self.timeout
+        try:
+            if self.config['use_tls']:
+                with metrics.timed('smtp_tls'):
+                    await client.starttls()
+            with metrics.timed('smtp_auth'):
+                await client.login(self.config['username'], self.config['password'])
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    async def _acquire(self):
+        now = time.monotonic()
+        while self._idle:
+            client, last_used = self._idle.pop()
+            if now - last_used > self.idle_ttl:
+                await self._quit(client)
+                continue
+            try:
+                if (await client.noop()).code == 250:
+                    return client
+            except (aiosmtplib.SMTPException, OSError):
+                pass
+            client.close()
+        return await self._connect()
+
+    def _release(self, client):
+        if len(self._idle) < self.max_size:
+            self._idle.append((client, time.monotonic()))
+        else:
+            asyncio.get_running_loop().create_task(self._quit(client))
+
+    async def _reset(self, client):
+        try:
+            await client.rset()
+        except (aiosmtplib.SMTPException, OSError):
+            client.close()
+        else:
+            self._release(client)
+
+    async def _quit(self, client):
+        try:
+            await client.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            client.close()
+
+
+class AsyncRelayPool(RelayPool):
+    """RelayPool over aiosmtplib sessions: same relay choice, breakers and failover"""
+
+    def __init__(self, config, max_size=None):
+        super().__init__(config, pool_factory=lambda relay_config: AsyncSMTPPool(relay_config, max_size))
+
+    async def sendmail(self, from_addr, recipients, message):
+        tried = set()
+        last_error = None
+        while True:
+            relay = self._acquire(tried)
+            if relay is None:
+                raise last_error if last_error is not None else NoRelayAvailable()
+            started = time.perf_counter()
+            try:
+                await relay.pool.sendmail(from_addr, recipients, message)
+            except Exception as e:
+                if not self._failed(relay, e):
+                    raise
+                last_error = e
+                continue
+            self._succeeded(relay, started)
+            return
+
+    async def close_all(self):
+        for relay in self.relays:
+            await relay.pool.close_all()
+
+
+class AsyncMailDispatcher:
+    """Claims rows from a MailQueue and delivers them as concurrent coroutines"""
+
+    def __init__(self, queue, prepare, config, concurrency=100):
+        """`prepare(**payload)` turns a queued payload into (recipients, message bytes)"""
+        self.queue = queue
+        self.prepare = prepare
+        self.config = config
+        self.concurrency = concurrency
+        # Keep a session for every delivery that can be in flight; a smaller
+        # pool would reconnect and log in again for most sends under load
+        self.pool = AsyncRelayPool(config, max_size=max(concurrency, config.get('pool_size', 2)))
+        self._tasks = set()
+        self._wakeup = None
+        self._runner = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # Requests run on executor threads; wake the loop from there
+        self.queue.on_enqueue = lambda: loop.call_soon_threadsafe(self._wakeup.set)
+        self._runner = loop.create_task(self._run())
+
+    async def stop(self, timeout=10):
+        self.queue.on_enqueue = None
+        if self._runner is not None:
+            self._runner.cancel()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        await self.pool.close_all()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            free = self.concurrency - len(self._tasks)
+            limit = min(free, self.queue.batch_size)
+            rows = []
+            if limit > 0:
+                try:
+                    rows = await asyncio.to_thread(self.queue.claim, limit)
+                except Exception as e:
+                    logger.error(f"Mail queue claim failed: {str(e)}")
+
+            for row in rows:
+                task = asyncio.get_running_loop().create_task(self._deliver(row))
+                self._tasks.add(task)
+                task.add_done_callback(self._delivery_done)
+
+            if rows and len(rows) == limit:
+                continue  # more may be waiting
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.queue.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _delivery_done(self, task):
+        self._tasks.discard(task)
+        self._wakeup.set()
+
+    async def _deliver(self, row):
+        started = time.monotonic()
+        try:
+            recipients, message = self.prepare(**json_codec.loads(row['payload']))
+            await self.pool.sendmail(self.config['from_email'], recipients, message)
+            error = None
+        except Exception as e:
+            error = e
+        await asyncio.to_thread(self.queue.record_result, row, error, (time.monotonic() - started) * 1000)
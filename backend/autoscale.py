@@ -0,0 +1,261 @@
+"""
+Adaptive Gunicorn worker count driven by request load and mail backlog
+
+Workers record how many requests they are serving into a board of slots in
+anonymous shared memory, which the master creates before the first fork
+(Gunicorn's pre_request/post_request hooks). Each slot keeps the running
+integral of in-flight requests over time, so the master can compute the
+average number of busy request handlers between two samples without missing
+short requests or ignoring one that has been blocked on SMTP for seconds.
+
+A controller thread in the master samples the board and the number of
+messages due in the outbound mail queue every AUTOSCALE_INTERVAL seconds and
+derives the worker count that would keep handlers at
+AUTOSCALE_TARGET_UTILIZATION and give every AUTOSCALE_BACKLOG_PER_WORKER
+queued messages a worker (each worker runs its own mail dispatcher). The
+count moves with SIGTTIN/SIGTTOU, so Gunicorn's own bookkeeping and the
+nworkers_changed hook see every change. Scaling up needs AUTOSCALE_UP_SAMPLES
+consecutive samples asking for it and jumps straight to the wanted count;
+scaling down needs AUTOSCALE_DOWN_SAMPLES and removes one worker at a time;
+both wait AUTOSCALE_COOLDOWN seconds after the previous change.
+
+Decisions are logged by the master and published in DATA_DIR/autoscale.json,
+which /api/metrics turns into gauges (see metrics_gauges). Async (uvicorn)
+workers do not run the request hooks, so for them only the backlog counts.
+"""
+
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import signal
+import struct
+import threading
+import time
+from contextlib import closing
+
+from db import connect, database_path
+
+AUTOSCALE_ENABLED = os.getenv('AUTOSCALE_ENABLED', 'false').lower() == 'true'
+AUTOSCALE_MIN_WORKERS = int(os.getenv('AUTOSCALE_MIN_WORKERS', '2'))
+AUTOSCALE_MAX_WORKERS = int(os.getenv('AUTOSCALE_MAX_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+AUTOSCALE_INTERVAL = float(os.getenv('AUTOSCALE_INTERVAL', '1'))
+AUTOSCALE_TARGET_UTILIZATION = float(os.getenv('AUTOSCALE_TARGET_UTILIZATION', '0.6'))
+AUTOSCALE_BACKLOG_PER_WORKER = int(os.getenv('AUTOSCALE_BACKLOG_PER_WORKER', '20'))
+AUTOSCALE_UP_SAMPLES = int(os.getenv('AUTOSCALE_UP_SAMPLES', '3'))
+AUTOSCALE_DOWN_SAMPLES = int(os.getenv('AUTOSCALE_DOWN_SAMPLES', '30'))
+AUTOSCALE_COOLDOWN = float(os.getenv('AUTOSCALE_COOLDOWN', '10'))
+
+STATE_FILE = 'autoscale.json'
+
+# Per slot: requests in flight, integral of in-flight requests (ns), time of the last change (ns)
+SLOT = struct.Struct('qqq')
+
+# Messages a worker's dispatcher can pick up now (not waiting out a retry delay)
+BACKLOG_SQL = """
+SELECT COUNT(*) FROM outbound_mail
+WHERE status = 'sending' OR (status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= ?))
+"""
+
+
+class BusyBoard:
+    """In-flight request accounting shared between the master and its workers
+
+    Slots are handed out by the master (acquire/release) and written only by
+    the worker that owns them, so the per-process lock only orders threads
+    of a threaded worker.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self._map = mmap.mmap(-1, SLOT.size * slots)
+        self._free = list(range(slots - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Reserve a slot for a worker about to be forked; None when all are taken"""
+        if not self._free:
+            return None
+        index = self._free.pop()
+        SLOT.pack_into(self._map, index * SLOT.size, 0, 0, time.monotonic_ns())
+        return index
+
+    def release(self, index):
+        if index is not None:
+            self._free.append(index)
+
+    def begin(self, index):
+        self._change(index, 1)
+
+    def end(self, index):
+        self._change(index, -1)
+
+    def _change(self, index, delta):
+        if index is None:
+            return
+        offset = index * SLOT.size
+        with self._lock:
+            now = time.monotonic_ns()
+            inflight, busy, changed = SLOT.unpack_from(self._map, offset)
+            SLOT.pack_into(self._map, offset, max(inflight + delta, 0), busy + inflight * (now - changed), now)
+
+    def busy_time(self, index):
+        """Integral of in-flight requests for a slot up to now, in ns"""
+        inflight, busy, changed = SLOT.unpack_from(self._map, index * SLOT.size)
+        return busy + inflight * max(time.monotonic_ns() - changed, 0)
+
+    def in_use(self):
+        free = set(self._free)
+        return [index for index in range(self.slots) if index not in free]
+
+
+def backlog(path):
+    """Outbound messages that are due for delivery
+
+    Runs in the master, so the connection is not cached for forks to inherit.
+    """
+    with closing(connect(path)) as conn:
+        return conn.execute(BACKLOG_SQL, (time.time(),)).fetchone()[0]
+
+
+class AutoScaler:
+    """Master-side controller that steers server.num_workers"""
+
+    def __init__(self, server, board, queue_path, threads=1, min_workers=AUTOSCALE_MIN_WORKERS,
+                 max_workers=AUTOSCALE_MAX_WORKERS, interval=AUTOSCALE_INTERVAL,
+                 target_utilization=AUTOSCALE_TARGET_UTILIZATION, backlog_per_worker=AUTOSCALE_BACKLOG_PER_WORKER,
+                 up_samples=AUTOSCALE_UP_SAMPLES, down_samples=AUTOSCALE_DOWN_SAMPLES, cooldown=AUTOSCALE_COOLDOWN):
+        self.server = server
+        self.board = board
+        self.queue_path = queue_path
+        self.threads = max(threads, 1)
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.target_utilization = target_utilization
+        self.backlog_per_worker = backlog_per_worker
+        self.up_samples = up_samples
+        self.down_samples = down_samples
+        self.cooldown = cooldown
+        self.decisions = {'up': 0, 'down': 0}
+        self.state_path = database_path(STATE_FILE)
+        self._previous = {}
+        self._up_streak = 0
+        self._down_streak = 0
+        self._last_change = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._sample_load()  # baseline for the first interval
+        self._thread = threading.Thread(target=self._run, name='autoscaler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                self.server.log.error(f"Autoscale sample failed: {str(e)}")
+
+    def _sample_load(self):
+        """Average requests in flight since the previous sample"""
+        now = time.monotonic_ns()
+        previous_at = self._previous.get('at', now)
+        total = 0
+        current = {}
+        for index in self.board.in_use():
+            value = self.board.busy_time(index)
+            last = self._previous.get(index, 0)
+            # A slot reused by a new worker starts again from zero
+            total += value - last if value >= last else value
+            current[index] = value
+        current['at'] = now
+        self._previous = current
+        return total / (now - previous_at) if now > previous_at else 0.0
+
+    def desired_workers(self, load, queued):
+        by_load = math.ceil(load / (self.threads * self.target_utilization))
+        by_backlog = math.ceil(queued / self.backlog_per_worker)
+        return min(max(by_load, by_backlog, self.min_workers), self.max_workers)
+
+    def tick(self):
+        load = self._sample_load()
+        queued = backlog(self.queue_path)
+        workers = self.server.num_workers
+        desired = self.desired_workers(load, queued)
+
+        self._up_streak = self._up_streak + 1 if desired > workers else 0
+        self._down_streak = self._down_streak + 1 if desired < workers else 0
+        cooled = time.monotonic() - self._last_change >= self.cooldown
+
+        if self._up_streak >= self.up_samples and cooled:
+            self._scale(workers, desired, signal.SIGTTIN, 'up', load, queued)
+        elif self._down_streak >= self.down_samples and cooled:
+            self._scale(workers, workers - 1, signal.SIGTTOU, 'down', load, queued)
+
+        self._write_state({
+            'workers': self.server.num_workers,
+            'desired': desired,
+            'load': round(load, 3),
+            'backlog': queued,
+            'min_workers': self.min_workers,
+            'max_workers': self.max_workers,
+            'decisions': self.decisions,
+            'updated_at': time.time()
+        })
+
+    def _scale(self, workers, target, signum, direction, load, queued):
+        self.server.log.info(
+            f"Autoscale {direction}: {workers} -> {target} workers "
+            f"(load {load:.2f} requests in flight, backlog {queued} messages)"
+        )
+        self.decisions[direction] += 1
+        self._up_streak = self._down_streak = 0
+        self._last_change = time.monotonic()
+        for _ in range(abs(target - workers)):
+            expected = self.server.num_workers + (1 if signum == signal.SIGTTIN else -1)
+            os.kill(os.getpid(), signum)
+            # Gunicorn queues at most a few signals; send the next one once this one is handled
+            deadline = time.monotonic() + 2
+            while self.server.num_workers != expected and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+    def _write_state(self, state):
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+
+def read_state():
+    """Latest controller state written by the master, or None when it is not running"""
+    try:
+        with open(database_path(STATE_FILE)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A state file left behind by a stopped master says nothing about now
+    if time.time() - state.get('updated_at', 0) > max(AUTOSCALE_INTERVAL * 10, 30):
+        return None
+    return state
+
+
+def metrics_gauges():
+    """(name, labels, value) triples for metrics.render"""
+    state = read_state()
+    if state is None:
+        return []
+    gauges = [
+        ('sysdak_autoscale_workers', {}, state['workers']),
+        ('sysdak_autoscale_desired_workers', {}, state['desired']),
+        ('sysdak_autoscale_load', {}, state['load']),
+        ('sysdak_autoscale_backlog', {}, state['backlog'])
+    ]
+    for direction, count in state['decisions'].items():
+        gauges.append(('sysdak_autoscale_decisions_total', {'direction': direction}, count))
+    return gauges
@@ -0,0 +1,55 @@
+"""
+Benchmark: content filter cost vs. number of patterns
+
+Compares the original per-pattern substring scan (`any(p in value ...)`)
+with ContentFilter as the blocklist grows. ContentFilter itself uses
+substring checks up to SUBSTRING_SCAN_MAX_PATTERNS patterns and the
+single-pass trie regex above that; the last column forces the regex.
+
+Usage: python benchmarks/bench_content_filter.py [iterations]
+"""
+
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_filter import INJECTION_PATTERNS, ContentFilter
+
+FIELDS = {
+    'name': 'Jane Doe',
+    'subject': 'Quote for a managed IT support contract',
+    'message': 'Hello team, we would like a quote and a timeline for the rollout. ' * 70
+}
+
+
+def naive_scan(patterns):
+    def scan():
+        return [field for field, value in FIELDS.items()
+                if any(pattern in value.lower() for pattern in patterns)]
+    return scan
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(7)
+
+    print(f"{'patterns':>9} {'per-pattern scan':>18} {'ContentFilter':>15} {'regex only':>13}")
+    for count in (4, 50, 200, 1000):
+        patterns = list(INJECTION_PATTERNS)
+        patterns += [''.join(rng.choices(string.ascii_lowercase + ' ', k=rng.randint(5, 14)))
+                     for _ in range(count - len(patterns))]
+        content_filter = ContentFilter({'spam': patterns})
+        regex_filter = ContentFilter({'spam': patterns})
+        regex_filter._substring_scan = False
+
+        before = timeit.timeit(naive_scan(patterns), number=iterations) / iterations
+        after = timeit.timeit(lambda: content_filter.scan_fields(FIELDS), number=iterations) / iterations
+        regex = timeit.timeit(lambda: regex_filter.scan_fields(FIELDS), number=iterations) / iterations
+        print(f"{count:>9} {before * 1e6:>15.1f} us {after * 1e6:>12.1f} us {regex * 1e6:>10.1f} us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: decoding contact bodies and encoding JSON responses
+
+Compares json.loads followed by the old type and length checks with the
+schema parser (request_schema) on a valid submission and on typical bot
+payloads that fill the 16 KB body limit, then jsonify through Flask's
+stdlib provider and through FastJSONProvider (orjson when installed).
+
+Usage: python benchmarks/bench_json_parsing.py [iterations]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_codec
+from json_codec import FastJSONProvider
+from request_schema import ObjectSchema, SchemaError
+
+FIELD_LIMITS = {
+    'email': (254, 'Email'),
+    'name': (100, 'Name'),
+    'subject': (200, 'Subject'),
+    'message': (5000, 'Message')
+}
+SCHEMA = ObjectSchema(FIELD_LIMITS)
+
+VALID = json.dumps({
+    'name': 'Jane Doe',
+    'email': 'jane@example.com',
+    'subject': 'Question about managed services',
+    'message': 'Hello, we would like a quote for 40 workstations.\n' * 20
+}).encode()
+
+BODIES = {
+    'valid': VALID,
+    'nested': (b'{"name":' + b'[' * 5000 + b']' * 5000 + b'}'),
+    'extra fields': json.dumps({f'field{i}': 'x' * 20 for i in range(500)}).encode(),
+    'oversized': json.dumps({'name': 'x', 'message': 'y' * 16000}).encode()
+}
+
+RESPONSE = {'success': True, 'message': 'Your message has been received. We will contact you soon!',
+            'submission_id': '0123456789abcdef0123456789abcdef'}
+
+
+def decode_then_validate(body):
+    """What handle_contact_form did: decode everything, then check it"""
+    try:
+        data = json.loads(body)
+    except (ValueError, RecursionError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    for name, value in data.items():
+        if name not in FIELD_LIMITS or not isinstance(value, str) or len(value) > FIELD_LIMITS[name][0]:
+            return None
+    return data
+
+
+def schema_parse(body):
+    try:
+        return SCHEMA.parse(body)
+    except SchemaError:
+        return None
+
+
+def per_call(fn, arg, iterations):
+    for _ in range(min(iterations, 200)):
+        fn(arg)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"iterations: {iterations}, codec: {json_codec.BACKEND}")
+
+    for label, body in BODIES.items():
+        before = per_call(decode_then_validate, body, iterations)
+        after = per_call(schema_parse, body, iterations)
+        print(f"{label:<13} {len(body):6d} B  decode+validate: {before * 1e6:8.1f} us, "
+              f"schema parser: {after * 1e6:8.1f} us")
+
+    for provider in (DefaultJSONProvider, FastJSONProvider):
+        app = Flask('bench')
+        app.json = provider(app)
+        with app.app_context():
+            elapsed = per_call(lambda obj: app.json.response(obj), RESPONSE, iterations)
+        print(f"jsonify via {provider.__name__:<20} {elapsed * 1e6:6.1f} us/response")
+
+
+if __name__ == '__main__':
+    main()
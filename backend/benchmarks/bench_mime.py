@@ -0,0 +1,107 @@
+"""
+Benchmark: MIME serialization cost per contact submission
+
+Builds the admin notification and the auto-reply for N synthetic
+submissions, once with the original MIMEMultipart/MIMEText path and once
+with the pre-encoded parts from mime_builder, and reports time and peak
+allocation per submission.
+
+Usage: python benchmarks/bench_mime.py [submissions]
+"""
+
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_templates import (AUTO_REPLY_HTML, AUTO_REPLY_TEXT, CONTACT_EMAIL_HTML, CONTACT_EMAIL_TEXT,
+                             prepare_fields, render_contact_emails)
+from mime_builder import assemble_message
+
+FROM = 'website@sysdak.com'
+ADMINS = 'contact@sysdak.com'
+
+
+def synthetic_submissions(count, seed=42):
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(500)]
+    for i in range(count):
+        yield {
+            'name': f"{rng.choice(words).title()} {rng.choice(words).title()}",
+            'email': f"user{i}@example.com",
+            'subject': ' '.join(rng.choices(words, k=rng.randint(3, 10))),
+            'message': '\n'.join(' '.join(rng.choices(words, k=12)) for _ in range(rng.randint(1, 30)))
+        }
+
+
+def legacy_build(data):
+    """Original path: render strings, then MIMEMultipart + MIMEText encoding"""
+    html_fields, text_fields = prepare_fields(data)
+    messages = []
+    for to, subject, html_body, text_body in (
+        (ADMINS, f"New Contact Form Submission: {data['subject']}",
+         CONTACT_EMAIL_HTML.render(html_fields), CONTACT_EMAIL_TEXT.render(text_fields)),
+        (data['email'], f"Thank you for contacting SysDak - {data['subject']}",
+         AUTO_REPLY_HTML.render(html_fields), AUTO_REPLY_TEXT.render(text_fields))
+    ):
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = FROM
+        msg['To'] = to
+        msg.attach(MIMEText(html_body, 'html'))
+        msg.attach(MIMEText(text_body, 'plain'))
+        messages.append(msg.as_bytes())
+    return messages
+
+
+def cached_build(data):
+    """Pre-encoded static parts assembled into raw bytes"""
+    emails = render_contact_emails(data)
+    return [
+        assemble_message(FROM, ADMINS, emails['admin']['subject'],
+                         emails['admin']['html_encoded'], emails['admin']['text_encoded'], data['email']),
+        assemble_message(FROM, data['email'], emails['auto_reply']['subject'],
+                         emails['auto_reply']['html_encoded'], emails['auto_reply']['text_encoded'])
+    ]
+
+
+def measure(build, submissions):
+    started = time.perf_counter()
+    for data in submissions:
+        build(data)
+    elapsed = time.perf_counter() - started
+
+    # Allocation profile on a sample; tracemalloc itself is slow
+    tracemalloc.start()
+    peaks = []
+    for data in submissions[:500]:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        build(data)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return elapsed, sum(peaks) / len(peaks)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    submissions = list(synthetic_submissions(count))
+
+    print(f"submissions: {count}")
+    results = {}
+    for name, build in (('MIMEMultipart', legacy_build), ('pre-encoded', cached_build)):
+        elapsed, peak = measure(build, submissions)
+        results[name] = elapsed
+        print(f"{name:>14}: {elapsed / count * 1e6:8.1f} us/submission, "
+              f"{peak / 1024:7.1f} KiB peak allocation/submission")
+    print(f"{'speedup':>14}: {results['MIMEMultipart'] / results['pre-encoded']:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Micro-benchmark: per-request framework overhead on /api/health
+
+Calls the WSGI app directly (no server, no socket) so the numbers are the
+cost of Flask plus its extensions and hooks. The baseline rebuilds the
+previous setup around the same blueprint: Flask-Talisman with a per-request
+CSP nonce plus the old after_request hook that set three headers again
+(requires flask-talisman). The current app copies precomputed header sets.
+A second table compares jsonify with ConstantJSON for a constant error body.
+
+Usage: python benchmarks/bench_request_overhead.py [iterations]
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='sysdak-overhead-'))
+os.environ.setdefault('LOG_FILE', os.path.join(os.environ['DATA_DIR'], 'app.log'))
+os.environ.setdefault('LOG_STDERR', 'false')
+for name, value in (('EMAIL_USERNAME', 'bench'), ('EMAIL_PASSWORD', 'bench'), ('EMAIL_FROM', 'bench@example.com'),
+                    ('EMAIL_TO', 'bench@example.com'), ('EMAIL_HOST', '127.0.0.1'), ('EMAIL_PORT', '9')):
+    os.environ.setdefault(name, value)
+
+from flask import Flask, jsonify
+from flask_cors import CORS
+from flask_talisman import Talisman
+
+import app as backend
+from static_responses import ConstantJSON
+
+
+def legacy_security_headers(response):
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['X-Frame-Options'] = 'DENY'
+    response.headers['X-XSS-Protection'] = '1; mode=block'
+    return response
+
+
+def legacy_app():
+    """The app as create_app() used to build it"""
+    app = Flask('app')
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": backend.allowed_origins,
+            "methods": ["GET", "POST"],
+            "allow_headers": ["Content-Type", "Idempotency-Key"],
+            "expose_headers": ["Idempotent-Replayed"],
+            "max_age": 3600
+        }
+    })
+    Talisman(app,
+        force_https=False,
+        strict_transport_security=True,
+        strict_transport_security_max_age=31536000,
+        content_security_policy={
+            'default-src': "'self'",
+            'script-src': "'self'",
+            'style-src': "'self' 'unsafe-inline'"
+        },
+        content_security_policy_nonce_in=['script-src']
+    )
+    backend.limiter.init_app(app)
+    app.register_blueprint(backend.api)
+    app.after_request(legacy_security_headers)
+    return app
+
+
+def environ(path):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '5000', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_ORIGIN': 'http://localhost:5173', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False
+    }
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def per_request(app, path, iterations):
+    base = environ(path)
+    for _ in range(200):
+        b''.join(app(dict(base), start_response))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        b''.join(app(dict(base), start_response))
+    return (time.perf_counter() - started) / iterations
+
+
+def per_call(build, app, iterations):
+    with app.app_context():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            build()
+        return (time.perf_counter() - started) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    current, legacy = backend.create_app(), legacy_app()
+
+    print(f"iterations: {iterations}")
+    for path in ('/api/health', '/api/missing'):
+        before = per_request(legacy, path, iterations)
+        after = per_request(current, path, iterations)
+        print(f"{path:<14} Talisman: {before * 1e6:7.1f} us/request, "
+              f"precomputed: {after * 1e6:7.1f} us/request ({(before - after) * 1e6:5.1f} us saved)")
+
+    not_found = ConstantJSON(404, success=False, message='Resource not found')
+    before = per_call(lambda: jsonify({'success': False, 'message': 'Resource not found'}), current, iterations)
+    after = per_call(not_found.response, current, iterations)
+    print(f"{'error body':<14}  jsonify: {before * 1e6:7.1f} us/call,    "
+          f"ConstantJSON: {after * 1e6:7.1f} us/call")
+
+
+if __name__ == '__main__':
+    main()
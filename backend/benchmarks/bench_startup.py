@@ -0,0 +1,131 @@
+"""
+Startup benchmark: cold import versus forking from a preloaded parent
+
+Cold start runs `create_app()` in fresh interpreters, which is what every
+worker (and every max_requests respawn) paid before preload_app. Warm start
+imports the app once in this process, as the Gunicorn master does, then forks
+children that serve their first request through the test client; the time
+from fork() to that first response is what a respawn costs now. While the
+children are alive their memory is read from /proc/<pid>/smaps_rollup to show
+how much of it is still shared with the parent, with and without gc.freeze().
+
+Usage: python benchmarks/bench_startup.py [cold_runs] [forks]
+"""
+
+import gc
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+COLD_START = """
+import sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+print(time.perf_counter() - started, 'email_validator' in sys.modules)
+"""
+
+ENV = {
+    'EMAIL_USERNAME': 'bench', 'EMAIL_PASSWORD': 'bench', 'EMAIL_FROM': 'bench@example.com',
+    'EMAIL_TO': 'bench@example.com', 'EMAIL_HOST': '127.0.0.1', 'EMAIL_PORT': '9',
+    'EMAIL_USE_TLS': 'false', 'LOG_STDERR': 'false', 'RATELIMIT_ENABLED': 'false'
+}
+
+
+def memory(pid):
+    """Rss/Pss/Shared/Private in KiB for a live process"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+
+def cold_start(runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START], cwd=BACKEND_DIR, env=os.environ,
+                                capture_output=True, text=True, check=True).stdout.split()
+        timings.append(float(output[0]))
+    return timings, output[1] == 'True'
+
+
+def fork_start(app, forks, freeze):
+    """Fork children from this (preloaded) process; returns timings and their memory"""
+    if freeze:
+        gc.freeze()
+    timings, usage = [], []
+    for _ in range(forks):
+        result_r, result_w = os.pipe()
+        release_r, release_w = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(result_r)
+            os.close(release_w)
+            status = app.test_client().get('/api/health').status_code
+            os.write(result_w, f"{time.perf_counter() - started} {status}".encode())
+            # A collection is what unshares pages the objects live on
+            gc.collect()
+            os.read(release_r, 1)
+            os._exit(0)
+        os.close(result_w)
+        os.close(release_r)
+        elapsed, status = os.read(result_r, 64).decode().split()
+        assert status == '200', status
+        timings.append(float(elapsed))
+        usage.append(memory(pid))
+        os.close(release_w)
+        os.waitpid(pid, 0)
+        os.close(result_r)
+    if freeze:
+        gc.unfreeze()
+    return timings, usage
+
+
+def summary(timings):
+    return f"median {statistics.median(timings) * 1000:8.1f} ms, max {max(timings) * 1000:8.1f} ms"
+
+
+def main():
+    cold_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    forks = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    os.environ.update(ENV)
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='sysdak-startup-')
+    os.environ['LOG_FILE'] = os.path.join(os.environ['DATA_DIR'], 'app.log')
+
+    timings, validator_loaded = cold_start(cold_runs)
+    print(f"cold start (import + create_app): {summary(timings)}")
+    print(f"email_validator imported at startup: {validator_loaded}")
+
+    started = time.perf_counter()
+    from app import create_app
+    app = create_app()
+    print(f"preload in parent:                 {(time.perf_counter() - started) * 1000:8.1f} ms")
+    print(f"parent rss: {memory(os.getpid())['rss']} KiB")
+
+    for freeze in (False, True):
+        timings, usage = fork_start(app, forks, freeze)
+        label = 'fork + first request' + (' (gc.freeze)' if freeze else '')
+        print(f"{label:<34} {summary(timings)}")
+        print(f"    per child: rss {statistics.mean(u['rss'] for u in usage):8.0f} KiB, "
+              f"pss {statistics.mean(u['pss'] for u in usage):8.0f} KiB, "
+              f"shared {statistics.mean(u['shared'] for u in usage):8.0f} KiB, "
+              f"private {statistics.mean(u['private'] for u in usage):8.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Micro-benchmark: per-request email render cost
+
+Compares the original f-string builders (kept here verbatim as the
+baseline) with string rendering through the precompiled templates in
+email_templates.
+
+Usage: python benchmarks/bench_templates.py [iterations]
+"""
+
+import html
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_templates import (AUTO_REPLY_HTML, AUTO_REPLY_TEXT, CONTACT_EMAIL_HTML, CONTACT_EMAIL_TEXT,
+                             prepare_fields)
+
+SAMPLE = {
+    'name': 'Jane <Doe>',
+    'email': 'jane.doe@example.com',
+    'subject': 'Pricing for a 12 month "support" contract',
+    'message': 'Hello team,\nWe would like a quote & timeline.\n' * 20
+}
+
+
+def create_contact_email_template(data):
+    """Create HTML email template for contact form submission - XSS SAFE"""
+    # Sanitize all user inputs
+    safe_data = {
+        'name': html.escape(data['name']),
+        'email': html.escape(data['email']),
+        'subject': html.escape(data['subject']),
+        'message': html.escape(data['message']).replace('\n', '<br>')
+    }
+    
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>New Contact Form Submission</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
+            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+            .header {{ background-color: #0F52BA; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
+            .content {{ padding: 30px; background-color: #f9f9f9; border-radius: 0 0 10px 10px; }}
+            .field {{ margin-bottom: 20px; padding: 15px; background-color: white; border-radius: 5px; border-left: 4px solid #0F52BA; }}
+            .label {{ font-weight: bold; color: #0F52BA; display: block; margin-bottom: 5px; }}
+            .footer {{ text-align: center; padding: 20px; color: #666; font-size: 12px; }}
+            .timestamp {{ color: #888; font-size: 12px; margin-top: 10px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>📧 New Contact Form Submission</h1>
+                <p>SysDak Website - Customer Inquiry</p>
+            </div>
+            <div class="content">
+                <div class="field">
+                    <span class="label">👤 Name:</span>
+                    <span>{safe_data['name']}</span>
+                </div>
+                <div class="field">
+                    <span class="label">📧 Email:</span>
+                    <span>{safe_data['email']}</span>
+                </div>
+                <div class="field">
+                    <span class="label">📝 Subject:</span>
+                    <span>{safe_data['subject']}</span>
+                </div>
+                <div class="field">
+                    <span class="label">💬 Message:</span>
+                    <p>{safe_data['message']}</p>
+                </div>
+                <div class="timestamp">
+                    <strong>Submitted:</strong> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
+                </div>
+            </div>
+            <div class="footer">
+                <p>This email was sent from the contact form on your website.</p>
+                <p>SysDak - IT Solutions &amp; Services</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+
+def create_auto_reply_template(data):
+    """Create HTML email template for auto-reply - XSS SAFE"""
+    # Sanitize all user inputs
+    safe_data = {
+        'name': html.escape(data['name']),
+        'email': html.escape(data['email']),
+        'subject': html.escape(data['subject']),
+        'message': html.escape(data['message']).replace('\n', '<br>')
+    }
+    
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>Thank You for Contacting Us</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
+            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+            .header {{ background-color: #0F52BA; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
+            .content {{ padding: 30px; background-color: #f9f9f9; border-radius: 0 0 10px 10px; }}
+            .message-box {{ background-color: white; padding: 20px; border-radius: 5px; border-left: 4px solid #0F52BA; margin: 20px 0; }}
+            .contact-info {{ background-color: #e8f4f8; padding: 15px; border-radius: 5px; margin-top: 20px; }}
+            .footer {{ text-align: center; padding: 20px; color: #666; font-size: 12px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>🎉 Thank You for Contacting Us!</h1>
+                <p>We've received your message</p>
+            </div>
+            <div class="content">
+                <p>Dear {safe_data['name']},</p>
+                <p>Thank you for reaching out to SysDak. We have received your message regarding <strong>"{safe_data['subject']}"</strong> and will get back to you as soon as possible.</p>
+
+                <div class="message-box">
+                    <h3>📋 Your Message:</h3>
+                    <p><em>{safe_data['message']}</em></p>
+                </div>
+
+                <p>Our team typically responds within <strong>24-48 business hours</strong>. If you need immediate assistance, please don't hesitate to call us directly.</p>
+
+                <div class="contact-info">
+                    <h3>📞 Contact Information:</h3>
+                    <p><strong>Phone:</strong> +91 8946060246</p>
+                    <p><strong>Email:</strong> contact@sysdak.com</p>
+                    <p><strong>Address:</strong> Plot no 48 Nirmun Layout A Samanapalli Road Sipcot 2 Hosur - 635109</p>
+                </div>
+
+                <p>Best regards,<br>
+                <strong>The SysDak Team</strong></p>
+            </div>
+            <div class="footer">
+                <p>SysDak - IT Solutions &amp; Services</p>
+                <p>© 2024 All rights reserved.</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+
+def legacy_render(data):
+    """The pre-compilation render path of handle_contact_form"""
+    admin_subject = f"New Contact Form Submission: {data['subject']}"
+    admin_html = create_contact_email_template(data)
+    admin_text = f"""
+New Contact Form Submission
+
+Name: {data['name']}
+Email: {data['email']}
+Subject: {data['subject']}
+Message: {data['message']}
+
+Submitted: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
+    """.strip()
+
+    # Auto-reply to customer
+    auto_reply_subject = f"Thank you for contacting SysDak - {data['subject']}"
+    auto_reply_html = create_auto_reply_template(data)
+    auto_reply_text = f"""
+Dear {data['name']},
+
+Thank you for reaching out to SysDak. We have received your message regarding "{data['subject']}" and will get back to you as soon as possible.
+
+Your message:
+"{data['message']}"
+
+We typically respond within 24-48 business hours. If you need immediate assistance, please call us at +91 8946060246.
+
+Best regards,
+The SysDak Team
+
+SysDak - IT Solutions & Services
+Email: contact@sysdak.com
+Phone: +91 8946060246
+    """.strip()
+
+    return admin_subject, admin_html, admin_text, auto_reply_subject, auto_reply_html, auto_reply_text
+
+
+def compiled_render(data):
+    """The same six outputs rendered from the precompiled templates"""
+    html_fields, text_fields = prepare_fields(data)
+    return (
+        f"New Contact Form Submission: {data['subject']}",
+        CONTACT_EMAIL_HTML.render(html_fields),
+        CONTACT_EMAIL_TEXT.render(text_fields),
+        f"Thank you for contacting SysDak - {data['subject']}",
+        AUTO_REPLY_HTML.render(html_fields),
+        AUTO_REPLY_TEXT.render(text_fields)
+    )
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    before = timeit.timeit(lambda: legacy_render(SAMPLE), number=iterations)
+    after = timeit.timeit(lambda: compiled_render(SAMPLE), number=iterations)
+
+    print(f"iterations:            {iterations}")
+    print(f"f-string builders:     {before / iterations * 1e6:8.2f} us/request")
+    print(f"precompiled templates: {after / iterations * 1e6:8.2f} us/request")
+    print(f"speedup:               {before / after:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+In-process SMTP sink for benchmarks and local testing
+
+Speaks enough ESMTP for smtplib and aiosmtplib (EHLO, AUTH PLAIN, MAIL, RCPT,
+DATA, RSET, NOOP, QUIT), discards every message, and can inject relay
+behaviour: a fixed delay before each reply, a delay on DATA only, transient
+4xx or permanent 5xx answers to a fraction of messages, and dropped
+connections.
+
+Usage: python benchmarks/fake_smtp.py [--port 2525] [--latency 0.05] [--error-rate 0.01]
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server
+        sink.count('connections')
+        self.reply('220 fake-smtp ESMTP ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            verb = command.split(' ', 1)[0]
+
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-fake-smtp\r\n250-PIPELINING\r\n250-8BITMIME\r\n')
+                self.reply('250 AUTH PLAIN')
+            elif verb == 'AUTH':
+                sink.count('logins')
+                if len(command.split()) == 2:
+                    # AUTH PLAIN without an initial response: ask for it
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b'.\r\n', b''):
+                        break
+                    size += len(chunk)
+                if sink.data_latency:
+                    time.sleep(sink.data_latency)
+                if sink.roll(sink.disconnect_rate):
+                    sink.count('disconnects')
+                    return
+                if sink.roll(sink.error_rate):
+                    sink.count('transient_errors')
+                    self.reply('451 4.3.0 Temporary failure (injected)')
+                elif sink.roll(sink.reject_rate):
+                    sink.count('permanent_errors')
+                    self.reply('550 5.7.1 Message rejected (injected)')
+                else:
+                    sink.count('messages')
+                    sink.count('bytes', size)
+                    self.reply('250 2.0.0 Ok: queued')
+            elif verb == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            elif verb == 'STARTTLS':
+                self.reply('454 4.7.0 TLS not available')
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self.reply('250 2.0.0 Ok')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Threaded SMTP sink with injectable latency and failures"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, data_latency=0.0,
+                 error_rate=0.0, reject_rate=0.0, disconnect_rate=0.0, seed=None):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.data_latency = data_latency
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.disconnect_rate = disconnect_rate
+        self.stats = dict.fromkeys(
+            ('connections', 'logins', 'messages', 'bytes', 'transient_errors', 'permanent_errors', 'disconnects'), 0
+        )
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def roll(self, rate):
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-smtp', daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every reply')
+    parser.add_argument('--data-latency', type=float, default=0.0, help='extra seconds before accepting DATA')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of messages answered 451')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='fraction of messages answered 550')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help='fraction of messages dropped mid-session')
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.host, args.port, args.latency, args.data_latency,
+                            args.error_rate, args.reject_rate, args.disconnect_rate)
+    print(f"Fake SMTP listening on {args.host}:{server.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(server.stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""
+Load test: drive the API under Gunicorn against a local fake SMTP relay
+
+Starts a FakeSMTPServer (see fake_smtp.py) in this process and Gunicorn with
+the repo's gunicorn.conf.py in a subprocess, pointed at the sink and at a
+throwaway DATA_DIR. Each endpoint is then loaded for --duration seconds by
+--concurrency client threads. For every phase the report shows requests/s,
+latency p50/p95/p99, status codes and the CPU used by each worker; the
+contact phase also reports how quickly the queued mail reached the sink.
+
+Rate limiting is disabled unless --rate-limits is given, which measures the
+cost of the limiter and its 429 path instead. Contact submissions carry a
+unique message so the idempotency index does not replay them.
+
+Usage:
+    python benchmarks/load_test.py --endpoints contact,health,test-email \\
+        --concurrency 16 --duration 10 --workers 4 \\
+        --smtp-latency 0.01 --smtp-error-rate 0.01 [--json results.json]
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_smtp import FakeSMTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_TOKEN = 'load-test-token'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+_sequence = itertools.count()
+
+
+def contact_request():
+    n = next(_sequence)
+    body = {
+        'name': 'Load Test',
+        'email': f"loadtest{n % 100}@example.com",
+        'subject': 'Load test submission',
+        'message': f"Load test message number {n}, long enough to pass validation."
+    }
+    return 'POST', '/api/contact', json.dumps(body)
+
+
+def health_request():
+    return 'GET', '/api/health', None
+
+
+def test_email_request():
+    return 'POST', '/api/test-email', json.dumps({'email': 'loadtest@example.com'})
+
+
+SCENARIOS = {
+    'contact': contact_request,
+    'health': health_request,
+    'test-email': test_email_request
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def worker_pids(master_pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process, or None when it is gone"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError):
+        return None
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class Server:
+    """Gunicorn running the backend with its own DATA_DIR and SMTP sink"""
+
+    def __init__(self, args, smtp_port):
+        self.port = free_port()
+        self.data_dir = tempfile.mkdtemp(prefix='sysdak-load-')
+        self.pid_file = os.path.join(self.data_dir, 'gunicorn.pid')
+        asgi = 'uvicorn' in args.worker_class.lower()
+        env = dict(
+            os.environ,
+            DATA_DIR=self.data_dir,
+            LOG_FILE=os.path.join(self.data_dir, 'app.log'),
+            LOG_STDERR='false',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=str(smtp_port),
+            EMAIL_USE_TLS='false',
+            EMAIL_USERNAME='load-test',
+            EMAIL_PASSWORD='load-test',
+            EMAIL_FROM='website@example.com',
+            EMAIL_TO='contact@example.com',
+            INTERNAL_API_TOKEN=API_TOKEN,
+            RATELIMIT_ENABLED='true' if args.rate_limits else 'false',
+            GUNICORN_HOST='127.0.0.1',
+            GUNICORN_PORT=str(self.port),
+            GUNICORN_WORKERS=str(args.workers),
+            GUNICORN_WORKER_CLASS=args.worker_class,
+            GUNICORN_ACCESS_LOG='/dev/null',
+            GUNICORN_LOG_LEVEL='warning'
+        )
+        # Workers are not recycled mid-run, so per-worker CPU figures stay valid
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--max-requests', '0',
+                   '--pid', self.pid_file, 'asgi:application' if asgi else 'wsgi:application']
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+        self._wait_ready()
+        with open(self.pid_file) as f:
+            self.master_pid = int(f.read())
+
+    def _wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=2)
+                conn.request('GET', '/api/health')
+                if conn.getresponse().status == 200 and os.path.exists(self.pid_file):
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError('gunicorn did not become ready')
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+def run_phase(port, make_request, concurrency, duration):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    headers = {'Content-Type': 'application/json', 'Authorization': f"Bearer {API_TOKEN}"}
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local_latencies, local_statuses = [], {}
+        while time.monotonic() < stop_at:
+            method, path, body = make_request()
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status = 'error'
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.monotonic() - started
+
+
+def wait_for_mail(smtp, expected, timeout=60):
+    """Seconds until the sink has seen `expected` outcomes (sent or failed), or None"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        stats = smtp.stats
+        seen = stats['messages'] + stats['transient_errors'] + stats['permanent_errors'] + stats['disconnects']
+        if seen >= expected:
+            return time.monotonic() - started
+        time.sleep(0.05)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the SysDak API against a fake SMTP relay')
+    parser.add_argument('--endpoints', default='contact,health,test-email',
+                        help=f"comma-separated phases from: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per endpoint')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--worker-class', default='sync')
+    parser.add_argument('--rate-limits', action='store_true', help='keep the rate limiter enabled')
+    parser.add_argument('--smtp-latency', type=float, default=0.0, help='seconds before every SMTP reply')
+    parser.add_argument('--smtp-data-latency', type=float, default=0.0, help='extra seconds on DATA')
+    parser.add_argument('--smtp-error-rate', type=float, default=0.0, help='fraction of messages answered 451')
+    parser.add_argument('--smtp-reject-rate', type=float, default=0.0, help='fraction of messages answered 550')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    smtp = FakeSMTPServer(latency=args.smtp_latency, data_latency=args.smtp_data_latency,
+                          error_rate=args.smtp_error_rate, reject_rate=args.smtp_reject_rate, seed=1).start()
+    server = Server(args, smtp.port)
+    results = {'config': vars(args), 'phases': {}}
+    try:
+        workers = worker_pids(server.master_pid)
+        print(f"gunicorn master {server.master_pid}, {len(workers)} {args.worker_class} workers, "
+              f"{args.concurrency} clients, {args.duration:.0f}s per endpoint")
+        print()
+        print(f"{'endpoint':<12} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'worker cpu':>11}  statuses")
+
+        for name in endpoints:
+            smtp_before = dict(smtp.stats)
+            cpu_before = {pid: cpu_seconds(pid) for pid in workers}
+            latencies, statuses, elapsed = run_phase(server.port, SCENARIOS[name], args.concurrency, args.duration)
+            cpu_after = {pid: cpu_seconds(pid) for pid in workers}
+
+            latencies.sort()
+            worker_cpu = {
+                pid: (cpu_after[pid] - cpu_before[pid]) / elapsed
+                for pid in workers if cpu_before[pid] is not None and cpu_after[pid] is not None
+            }
+            phase = {
+                'requests': len(latencies),
+                'requests_per_second': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 0.50) * 1000,
+                'p95_ms': percentile(latencies, 0.95) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+                'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+                'worker_cpu': {str(pid): round(share, 3) for pid, share in worker_cpu.items()},
+                'worker_rss_mb': {str(pid): rss_mb(pid) for pid in workers}
+            }
+
+            if name == 'contact':
+                # Each accepted submission queues two messages (admin + auto-reply)
+                accepted = statuses.get(202, 0)
+                drained = wait_for_mail(smtp, sum(smtp_before[k] for k in
+                                                  ('messages', 'transient_errors', 'permanent_errors',
+                                                   'disconnects')) + accepted * 2)
+                phase['mail_drain_seconds'] = drained
+                phase['mail_per_second'] = accepted * 2 / (elapsed + drained) if drained is not None else None
+            phase['smtp'] = {key: smtp.stats[key] - smtp_before[key] for key in smtp.stats}
+            results['phases'][name] = phase
+
+            cpu = ' '.join(f"{share * 100:.0f}%" for share in worker_cpu.values())
+            print(f"{name:<12} {phase['requests']:>9} {phase['requests_per_second']:>9.1f} "
+                  f"{phase['p50_ms']:>8.1f} {phase['p95_ms']:>8.1f} {phase['p99_ms']:>8.1f} "
+                  f"{cpu:>11}  {phase['statuses']}")
+
+        print()
+        for name, phase in results['phases'].items():
+            smtp_stats = phase['smtp']
+            line = (f"{name}: SMTP {smtp_stats['connections']} connections, {smtp_stats['logins']} logins, "
+                    f"{smtp_stats['messages']} messages, "
+                    f"{smtp_stats['transient_errors'] + smtp_stats['permanent_errors']} injected errors")
+            if phase.get('mail_per_second') is not None:
+                line += (f"; queue drained {phase['mail_drain_seconds']:.1f}s after load, "
+                         f"{phase['mail_per_second']:.1f} mails/s overall")
+            elif name == 'contact':
+                line += '; queue did not drain within 60s'
+            print(line)
+    finally:
+        server.stop()
+        smtp.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Content filter for form fields
+
+Every field is lowercased once and every match of a blocklisted pattern
+(the built-in injection list plus any configured spam or phishing
+patterns) is reported with its category and offset.
+
+Small blocklists, such as the four built-in patterns, are scanned with one
+str.find per pattern, which is the cheapest option at that size. Once a
+blocklist has more than SUBSTRING_SCAN_MAX_PATTERNS patterns, they are
+compiled into one regex shaped like a trie: patterns sharing a prefix share
+a branch, so at each input position the engine only follows branches whose
+next character matches, and each field is scanned once however many
+patterns are configured.
+
+Extra patterns come from the environment:
+
+    CONTENT_FILTER_SPAM_PATTERNS      comma-separated
+    CONTENT_FILTER_PHISHING_PATTERNS  comma-separated
+    CONTENT_FILTER_PATTERNS_FILE      one `category:pattern` per line
+"""
+
+import os
+import re
+from collections import namedtuple
+
+Match = namedtuple('Match', ['pattern', 'category', 'offset'])
+
+# Built-in patterns that indicate script injection attempts
+INJECTION_PATTERNS = ['<script', 'javascript:', 'onerror=', 'onload=']
+
+# Up to this many patterns a str.find per pattern beats the combined regex
+# (see benchmarks/bench_content_filter.py; they break even near 100)
+SUBSTRING_SCAN_MAX_PATTERNS = 64
+
+
+def _trie_regex(patterns):
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for char in pattern:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional suffix: prefer the longest pattern at each offset
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class ContentFilter:
+    """Blocklist of literal patterns, grouped by category"""
+
+    def __init__(self, patterns):
+        """`patterns` maps a category name to a list of literal patterns"""
+        self.categories = {}
+        for category, items in patterns.items():
+            for pattern in items:
+                pattern = pattern.strip().lower()
+                if pattern:
+                    self.categories.setdefault(pattern, category)
+
+        # Shorter patterns that start where a longer one matched are matches too
+        self._prefixes = {
+            pattern: [other for other in self.categories if other != pattern and pattern.startswith(other)]
+            for pattern in self.categories
+        }
+        self._regex = self._regex_ignorecase = None
+        if self.categories:
+            source = '(' + _trie_regex(self.categories) + ')'
+            self._regex = re.compile(source)
+            self._regex_ignorecase = re.compile(source, re.IGNORECASE)
+        self._substring_scan = len(self.categories) <= SUBSTRING_SCAN_MAX_PATTERNS
+
+    def scan(self, text):
+        """Return every Match in `text`, ordered by offset"""
+        if self._regex is None or not text:
+            return []
+
+        # Matching lowercased text is much faster than re.IGNORECASE, but
+        # only keeps offsets valid when lowercasing preserves the length
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            if self._substring_scan:
+                return self._find_each(lowered)
+            regex, text = self._regex, lowered
+        else:
+            regex = self._regex_ignorecase
+
+        matches = []
+        position = 0
+        while True:
+            found = regex.search(text, position)
+            if found is None:
+                return matches
+            pattern = found.group(1).lower()
+            offset = found.start()
+            if pattern in self.categories:
+                matches.append(Match(pattern, self.categories[pattern], offset))
+                for prefix in self._prefixes[pattern]:
+                    matches.append(Match(prefix, self.categories[prefix], offset))
+            # Resume one character later so overlapping matches are reported
+            position = offset + 1
+
+    def _find_each(self, text):
+        matches = []
+        for pattern, category in self.categories.items():
+            offset = text.find(pattern)
+            while offset != -1:
+                matches.append(Match(pattern, category, offset))
+                offset = text.find(pattern, offset + 1)
+        if len(matches) > 1:
+            # Same order as the regex scan: by offset, longest pattern first
+            matches.sort(key=lambda match: (match.offset, -len(match.pattern)))
+        return matches
+
+    def scan_fields(self, fields):
+        """Scan a mapping of field name -> text; only fields with matches are returned"""
+        results = {}
+        for field, text in fields.items():
+            matches = self.scan(text)
+            if matches:
+                results[field] = matches
+        return results
+
+
+def _split(value):
+    return [item for item in (value or '').split(',') if item.strip()]
+
+
+def load_patterns():
+    """Built-in injection patterns merged with the configured extras"""
+    patterns = {
+        'injection': list(INJECTION_PATTERNS),
+        'spam': _split(os.getenv('CONTENT_FILTER_SPAM_PATTERNS')),
+        'phishing': _split(os.getenv('CONTENT_FILTER_PHISHING_PATTERNS'))
+    }
+
+    patterns_file = os.getenv('CONTENT_FILTER_PATTERNS_FILE')
+    if patterns_file:
+        with open(patterns_file, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                category, _, pattern = line.partition(':')
+                if pattern:
+                    patterns.setdefault(category.strip(), []).append(pattern)
+
+    return patterns
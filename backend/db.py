@@ -0,0 +1,71 @@
+"""
+SQLite helpers shared by the backend's local stores
+
+Every gunicorn worker opens its own connections (one per thread and per
+process), so a connection is never carried across a fork. Databases run in
+WAL mode so readers in one worker never block a writer in another.
+
+Stores are created at import time, which with preload_app is in the Gunicorn
+master. A connection cached there would be inherited by every worker and
+closed in each of them, which SQLite does not allow across a fork, so code
+that can run in the master (schema setup, the autoscaler) uses a short-lived
+connection from connect() instead of get_connection().
+"""
+
+import os
+import sqlite3
+import threading
+
+# Directory holding the local SQLite databases
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+_local = threading.local()
+
+
+def database_path(name):
+    """Return the absolute path of a database file inside DATA_DIR"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def connect(path):
+    """Open a new WAL-mode connection; the caller closes it"""
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=10000')
+    return conn
+
+
+def get_connection(path):
+    """Return a WAL-mode connection owned by the calling thread and process"""
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = connect(path)
+    return conn
+
+
+def close_connections():
+    """Close the calling thread's cached connections (the master does so before forking)"""
+    connections = getattr(_local, 'connections', None)
+    if connections and _local.pid == os.getpid():
+        for conn in connections.values():
+            conn.close()
+    _local.connections = None
+
+
+def ensure_columns(conn, table, columns):
+    """Add columns introduced after a table was first created
+
+    `columns` maps column names to their SQL definitions.
+    """
+    existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
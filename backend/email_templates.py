@@ -0,0 +1,338 @@
+"""
+Precompiled email templates
+
+The HTML, CSS and text skeletons are split into static chunks once at import
+time. Rendering a message only escapes the submission fields (once, shared by
+every template rendered from the same submission) and joins them into a copy
+of the pre-split buffer, instead of rebuilding kilobytes of markup per call.
+Each template also carries a base64 encoding of its static chunks (see
+mime_builder), so outgoing bodies are produced already transfer-encoded.
+"""
+
+import html
+import re
+from datetime import datetime
+
+from mime_builder import EncodedTemplate
+
+# Slots are written as {{name}} so the CSS braces stay literal
+SLOT_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+
+class CompiledTemplate:
+    """A template pre-split into static chunks and named slots"""
+
+    def __init__(self, source):
+        parts = SLOT_PATTERN.split(source)
+        self.chunks = parts[0::2]
+        self.slots = parts[1::2]
+        self._buffer = parts
+        self._positions = list(range(1, len(parts), 2))
+        self.encoded = EncodedTemplate(self.chunks, self.slots)
+
+    def render(self, values):
+        buffer = self._buffer[:]
+        for position, name in zip(self._positions, self.slots):
+            buffer[position] = values[name]
+        return ''.join(buffer)
+
+    def render_encoded(self, values):
+        """Render straight to a base64 MIME body"""
+        return self.encoded.render(values)
+
+
+CONTACT_EMAIL_HTML = CompiledTemplate("""\
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>New Contact Form Submission</title>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background-color: #0F52BA; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+        .content { padding: 30px; background-color: #f9f9f9; border-radius: 0 0 10px 10px; }
+        .field { margin-bottom: 20px; padding: 15px; background-color: white; border-radius: 5px; border-left: 4px solid #0F52BA; }
+        .label { font-weight: bold; color: #0F52BA; display: block; margin-bottom: 5px; }
+        .footer { text-align: center; padding: 20px; color: #666; font-size: 12px; }
+        .timestamp { color: #888; font-size: 12px; margin-top: 10px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>📧 New Contact Form Submission</h1>
+            <p>SysDak Website - Customer Inquiry</p>
+        </div>
+        <div class="content">
+            <div class="field">
+                <span class="label">👤 Name:</span>
+                <span>{{name}}</span>
+            </div>
+            <div class="field">
+                <span class="label">📧 Email:</span>
+                <span>{{email}}</span>
+            </div>
+            <div class="field">
+                <span class="label">📝 Subject:</span>
+                <span>{{subject}}</span>
+            </div>
+            <div class="field">
+                <span class="label">💬 Message:</span>
+                <p>{{message}}</p>
+            </div>
+            <div class="timestamp">
+                <strong>Submitted:</strong> {{submitted}}
+            </div>
+        </div>
+        <div class="footer">
+            <p>This email was sent from the contact form on your website.</p>
+            <p>SysDak - IT Solutions &amp; Services</p>
+        </div>
+    </div>
+</body>
+</html>
+""")
+
+CONTACT_EMAIL_TEXT = CompiledTemplate("""\
+New Contact Form Submission
+
+Name: {{name}}
+Email: {{email}}
+Subject: {{subject}}
+Message: {{message}}
+
+Submitted: {{submitted}}""")
+
+# Digest mode: one admin email listing every submission since the last one
+ADMIN_DIGEST_HTML = CompiledTemplate("""\
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>New Contact Form Submissions</title>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background-color: #0F52BA; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+        .content { padding: 30px; background-color: #f9f9f9; border-radius: 0 0 10px 10px; }
+        .submission { margin-bottom: 20px; padding: 15px; background-color: white; border-radius: 5px; border-left: 4px solid #0F52BA; }
+        .label { font-weight: bold; color: #0F52BA; }
+        .footer { text-align: center; padding: 20px; color: #666; font-size: 12px; }
+        .timestamp { color: #888; font-size: 12px; margin-top: 10px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>📧 {{count}} New Contact Form Submissions</h1>
+            <p>SysDak Website - Customer Inquiries</p>
+        </div>
+        <div class="content">
+{{entries}}
+        </div>
+        <div class="footer">
+            <p>These submissions were sent from the contact form on your website.</p>
+            <p>SysDak - IT Solutions &amp; Services</p>
+        </div>
+    </div>
+</body>
+</html>
+""")
+
+ADMIN_DIGEST_ENTRY_HTML = CompiledTemplate("""\
+            <div class="submission">
+                <p><span class="label">👤 Name:</span> {{name}}</p>
+                <p><span class="label">📧 Email:</span> <a href="mailto:{{email}}">{{email}}</a></p>
+                <p><span class="label">📝 Subject:</span> {{subject}}</p>
+                <p><span class="label">💬 Message:</span><br>{{message}}</p>
+                <div class="timestamp"><strong>Submitted:</strong> {{submitted}}</div>
+            </div>
+""")
+
+ADMIN_DIGEST_TEXT = CompiledTemplate("""\
+{{count}} New Contact Form Submissions
+{{entries}}""")
+
+ADMIN_DIGEST_ENTRY_TEXT = CompiledTemplate("""
+----------------------------------------
+Name: {{name}}
+Email: {{email}}
+Subject: {{subject}}
+Message: {{message}}
+
+Submitted: {{submitted}}
+""")
+
+AUTO_REPLY_HTML = CompiledTemplate("""\
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Thank You for Contacting Us</title>
+    <style>
+        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background-color: #0F52BA; color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }
+        .content { padding: 30px; background-color: #f9f9f9; border-radius: 0 0 10px 10px; }
+        .message-box { background-color: white; padding: 20px; border-radius: 5px; border-left: 4px solid #0F52BA; margin: 20px 0; }
+        .contact-info { background-color: #e8f4f8; padding: 15px; border-radius: 5px; margin-top: 20px; }
+        .footer { text-align: center; padding: 20px; color: #666; font-size: 12px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🎉 Thank You for Contacting Us!</h1>
+            <p>We've received your message</p>
+        </div>
+        <div class="content">
+            <p>Dear {{name}},</p>
+            <p>Thank you for reaching out to SysDak. We have received your message regarding <strong>"{{subject}}"</strong> and will get back to you as soon as possible.</p>
+
+            <div class="message-box">
+                <h3>📋 Your Message:</h3>
+                <p><em>{{message}}</em></p>
+            </div>
+
+            <p>Our team typically responds within <strong>24-48 business hours</strong>. If you need immediate assistance, please don't hesitate to call us directly.</p>
+
+            <div class="contact-info">
+                <h3>📞 Contact Information:</h3>
+                <p><strong>Phone:</strong> +91 8946060246</p>
+                <p><strong>Email:</strong> contact@sysdak.com</p>
+                <p><strong>Address:</strong> Plot no 48 Nirmun Layout A Samanapalli Road Sipcot 2 Hosur - 635109</p>
+            </div>
+
+            <p>Best regards,<br>
+            <strong>The SysDak Team</strong></p>
+        </div>
+        <div class="footer">
+            <p>SysDak - IT Solutions &amp; Services</p>
+            <p>© 2024 All rights reserved.</p>
+        </div>
+    </div>
+</body>
+</html>
+""")
+
+AUTO_REPLY_TEXT = CompiledTemplate("""\
+Dear {{name}},
+
+Thank you for reaching out to SysDak. We have received your message regarding "{{subject}}" and will get back to you as soon as possible.
+
+Your message:
+"{{message}}"
+
+We typically respond within 24-48 business hours. If you need immediate assistance, please call us at +91 8946060246.
+
+Best regards,
+The SysDak Team
+
+SysDak - IT Solutions & Services
+Email: contact@sysdak.com
+Phone: +91 8946060246""")
+
+TEST_EMAIL_HTML = CompiledTemplate("""\
+<h2>🧪 Email Service Test</h2>
+<p>This is a test email from the SysDak email service.</p>
+<p>If you received this email, the SMTP configuration is working correctly!</p>
+<p><strong>Timestamp:</strong> {{submitted}}</p>
+""")
+
+TEST_EMAIL_TEXT = CompiledTemplate("""\
+Email Service Test
+
+This is a test email from the SysDak email service.
+If you received this email, the SMTP configuration is working correctly!
+
+Timestamp: {{submitted}}""")
+
+
+def timestamp():
+    return datetime.now().strftime('%B %d, %Y at %I:%M %p')
+
+
+def prepare_fields(data, submitted=None):
+    """Escape submission fields once for every template rendered from them - XSS SAFE
+
+    Returns (html_fields, text_fields).
+    """
+    submitted = submitted or timestamp()
+    text_fields = {
+        'name': data['name'],
+        'email': data['email'],
+        'subject': data['subject'],
+        'message': data['message'],
+        'submitted': submitted
+    }
+    html_fields = {
+        'name': html.escape(data['name']),
+        'email': html.escape(data['email']),
+        'subject': html.escape(data['subject']),
+        'message': html.escape(data['message']).replace('\n', '<br>'),
+        'submitted': submitted
+    }
+    return html_fields, text_fields
+
+
+def render_contact_emails(data, digest=False):
+    """Render the admin notification and the customer auto-reply
+
+    Each result holds the subject, html_encoded and text_encoded arguments
+    for send_email. With `digest`, the admin entry instead holds the
+    timestamped fields that render_admin_digest will list later.
+    """
+    html_fields, text_fields = prepare_fields(data)
+    if digest:
+        admin = {'submission': text_fields}
+    else:
+        admin = {
+            'subject': f"New Contact Form Submission: {data['subject']}",
+            'html_encoded': CONTACT_EMAIL_HTML.render_encoded(html_fields),
+            'text_encoded': CONTACT_EMAIL_TEXT.render_encoded(text_fields)
+        }
+    return {
+        'admin': admin,
+        'auto_reply': {
+            'subject': f"Thank you for contacting SysDak - {data['subject']}",
+            'html_encoded': AUTO_REPLY_HTML.render_encoded(html_fields),
+            'text_encoded': AUTO_REPLY_TEXT.render_encoded(text_fields)
+        }
+    }
+
+
+def render_admin_digest(submissions):
+    """Render one admin email for several submissions' fields (from render_contact_emails)
+
+    A digest of a single submission is the usual notification.
+    """
+    if len(submissions) == 1:
+        html_fields, text_fields = prepare_fields(submissions[0], submissions[0]['submitted'])
+        return {
+            'subject': f"New Contact Form Submission: {text_fields['subject']}",
+            'html_encoded': CONTACT_EMAIL_HTML.render_encoded(html_fields),
+            'text_encoded': CONTACT_EMAIL_TEXT.render_encoded(text_fields)
+        }
+
+    html_entries, text_entries = [], []
+    for submission in submissions:
+        html_fields, text_fields = prepare_fields(submission, submission['submitted'])
+        html_entries.append(ADMIN_DIGEST_ENTRY_HTML.render(html_fields))
+        text_entries.append(ADMIN_DIGEST_ENTRY_TEXT.render(text_fields))
+    count = str(len(submissions))
+    return {
+        'subject': f"{count} New Contact Form Submissions",
+        'html_encoded': ADMIN_DIGEST_HTML.render_encoded({'count': count, 'entries': ''.join(html_entries)}),
+        'text_encoded': ADMIN_DIGEST_TEXT.render_encoded({'count': count, 'entries': ''.join(text_entries)})
+    }
+
+
+def render_test_email():
+    """Render the SMTP configuration test email"""
+    fields = {'submitted': timestamp()}
+    return {
+        'subject': 'SysDak Email Service Test',
+        'html_encoded': TEST_EMAIL_HTML.render_encoded(fields),
+        'text_encoded': TEST_EMAIL_TEXT.render_encoded(fields)
+    }
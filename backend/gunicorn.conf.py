@@ -2,19 +2,43 @@
 Gunicorn Configuration for Production Deployment
 """
 
+import gc
 import multiprocessing
 import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Settings below (and the preloaded app) read .env
+from dotenv import load_dotenv
+load_dotenv()
+
+import autoscale
+import log_config
+import metrics
+from db import close_connections, database_path
+from profiler import profiler
 
 # Server socket
 bind = f"{os.getenv('GUNICORN_HOST', '0.0.0.0')}:{os.getenv('GUNICORN_PORT', '5000')}"
 backlog = 2048
 
 # Worker processes
-workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
-worker_class = 'sync'  # Use 'gevent' or 'eventlet' for async
+# 'uvicorn.workers.UvicornWorker' serves asgi:application (see requirements-async.txt)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+# Async workers multiplex connections, so one per core is enough
+default_workers = multiprocessing.cpu_count() if 'uvicorn' in worker_class.lower() else multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv('GUNICORN_WORKERS', default_workers))
+if autoscale.AUTOSCALE_ENABLED:
+    # The controller moves the count within these bounds (see autoscale.py)
+    workers = min(max(workers, autoscale.AUTOSCALE_MIN_WORKERS), autoscale.AUTOSCALE_MAX_WORKERS)
 worker_connections = 1000
 max_requests = 1000  # Restart worker after processing this many requests
 max_requests_jitter = 50  # Add randomness to max_requests to avoid thundering herd
+# Import the app once in the master; workers (and their replacements) are plain
+# forks that share its memory copy-on-write instead of re-importing Flask
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
 timeout = 30
 graceful_timeout = 30
 keepalive = 2
@@ -45,6 +69,14 @@ tmp_upload_dir = None
 # Server hooks
 def on_starting(server):
     """Called just before the master process is initialized."""
+    # One writer per host: workers ship their log batches to the master
+    server.log_server = log_config.start_log_server()
+    # Per-worker metric snapshots from a previous run would skew the totals
+    metrics.reset()
+    if autoscale.AUTOSCALE_ENABLED:
+        # Shared memory must exist before the first fork; exiting workers
+        # overlap their replacements, hence the spare slots
+        server.busy_board = autoscale.BusyBoard(autoscale.AUTOSCALE_MAX_WORKERS * 2)
     server.log.info("=" * 60)
     server.log.info("🚀 SysDak API Server Starting")
     server.log.info(f"Workers: {workers}")
@@ -56,18 +88,33 @@ def on_reload(server):
     """Called to recycle workers during a reload."""
     server.log.info("🔄 Reloading workers...")
 
-def when_ready(server):
-    """Called just after the server is started."""
-    server.log.info("✅ Server is ready. Accepting connections.")
-
 def pre_fork(server, worker):
     """Called just before a worker is forked."""
-    pass
+    # SQLite handles must not cross a fork; workers open their own
+    close_connections()
+    # Move the preloaded objects out of the collector's reach: a collection in
+    # the worker would otherwise touch (and so copy) every shared page
+    gc.freeze()
+    if autoscale.AUTOSCALE_ENABLED:
+        # The worker object is inherited by the child, so it carries the slot
+        worker.busy_board = server.busy_board
+        worker.busy_slot = server.busy_board.acquire()
 
 def post_fork(server, worker):
     """Called just after a worker has been forked."""
     server.log.info(f"Worker spawned (pid: {worker.pid})")
 
+def post_worker_init(worker):
+    """Called just after a worker has initialized the application."""
+    # Gunicorn resets SIGUSR2 in workers; `kill -USR2 <worker pid>` toggles profiling
+    signal.signal(signal.SIGUSR2, profiler.toggle)
+    if 'uvicorn' not in worker_class.lower():
+        # Deliver what earlier workers left queued (pending rows, expired leases,
+        # due retries and digests) without waiting for the next submission.
+        # Uvicorn workers start the asyncio dispatcher from the ASGI lifespan.
+        from app import mail_queue
+        mail_queue.start()
+
 def pre_exec(server):
     """Called just before a new master process is forked."""
     server.log.info("Forked child, re-executing.")
@@ -75,6 +122,16 @@ def pre_exec(server):
 def when_ready(server):
     """Called just after the server is started."""
     server.log.info("✅ Server is ready. Accepting connections.")
+    if autoscale.AUTOSCALE_ENABLED:
+        server.autoscaler = autoscale.AutoScaler(
+            server,
+            server.busy_board,
+            database_path(os.getenv('MAIL_QUEUE_DB', 'mail_queue.db')),
+            threads=server.cfg.threads
+        )
+        server.autoscaler.start()
+        server.log.info(f"Autoscaling workers between {autoscale.AUTOSCALE_MIN_WORKERS} "
+                        f"and {autoscale.AUTOSCALE_MAX_WORKERS}")
 
 def worker_int(worker):
     """Called just after a worker exited on SIGINT or SIGQUIT."""
@@ -87,14 +144,24 @@ def worker_abort(worker):
 def pre_request(worker, req):
     """Called just before a worker processes the request."""
     worker.log.debug(f"{req.method} {req.path}")
+    if autoscale.AUTOSCALE_ENABLED:
+        worker.busy_board.begin(worker.busy_slot)
+    profiler.begin_request()
 
 def post_request(worker, req, environ, resp):
     """Called after a worker processes the request."""
-    pass
+    if autoscale.AUTOSCALE_ENABLED:
+        worker.busy_board.end(worker.busy_slot)
+    # Keeps the stage breakdown (and sampled stacks) of slow requests
+    profiler.end_request(req.method, req.path, resp.status)
 
 def child_exit(server, worker):
     """Called just after a worker has been exited."""
     server.log.info(f"Worker exited (pid: {worker.pid})")
+    # Keep the exited worker's counters in the /api/metrics totals
+    metrics.archive_worker(worker.pid)
+    if autoscale.AUTOSCALE_ENABLED:
+        server.busy_board.release(worker.busy_slot)
 
 def worker_exit(server, worker):
     """Called just after a worker has been exited."""
@@ -107,3 +174,6 @@ def nworkers_changed(server, new_value, old_value):
 def on_exit(server):
     """Called just before exiting Gunicorn."""
     server.log.info("👋 Shutting down SysDak API Server")
+    if autoscale.AUTOSCALE_ENABLED:
+        server.autoscaler.stop()
+    server.log_server.stop()
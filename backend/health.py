@@ -0,0 +1,143 @@
+"""
+Health reporting with a cached SMTP liveness probe
+
+Configuration readiness never changes while a worker runs, so it is
+computed once. SMTP reachability is checked by a probe of every configured
+relay (connect, EHLO, NOOP, QUIT; reachable when any relay answers) whose
+result is cached for HEALTH_PROBE_TTL seconds and shared by every worker
+on the host through a small file in DATA_DIR. Only one probe runs at a
+time per host (a file lock), so the number of SMTP connections depends on
+the TTL, never on how often health endpoints are polled.
+"""
+
+import fcntl
+import json
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+from db import database_path
+
+HEALTH_PROBE_TTL = float(os.getenv('HEALTH_PROBE_TTL', '30'))
+HEALTH_PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', '5'))
+
+
+def email_configured(config):
+    """True when every setting needed to send mail is present"""
+    return all([config['username'], config['password'], config['from_email'], config['to_emails']])
+
+
+class HealthMonitor:
+    """Static readiness plus a TTL-cached, single-flight SMTP probe"""
+
+    def __init__(self, config, ttl=HEALTH_PROBE_TTL, timeout=HEALTH_PROBE_TIMEOUT):
+        self.config = config
+        self.ttl = ttl
+        self.timeout = timeout
+        self.email_configured = email_configured(config)
+        self.cache_path = database_path('health_probe.json')
+        self._result = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def smtp_status(self, wait=False):
+        """Latest probe result; a stale one triggers a refresh
+
+        Without `wait` the refresh runs in the background and the cached
+        (possibly stale or missing) result is returned immediately. With
+        `wait` the caller blocks until a fresh result exists, joining a probe
+        already in flight rather than starting another.
+        """
+        result = self._cached()
+        if result is not None and time.time() - result['checked_at'] < self.ttl:
+            return result
+
+        if wait:
+            return self._refresh()
+
+        with self._lock:
+            if not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, name='health-probe', daemon=True).start()
+        return result
+
+    def _cached(self):
+        result = self._result
+        if result is None or time.time() - result['checked_at'] >= self.ttl:
+            # Another worker may have probed more recently
+            shared = self._read_shared()
+            if shared is not None and (result is None or shared['checked_at'] > result['checked_at']):
+                self._result = result = shared
+        return result
+
+    def _refresh(self):
+        with self._probe_lock():
+            # Whoever held the lock before us may have just probed
+            result = self._read_shared()
+            if result is None or time.time() - result['checked_at'] >= self.ttl:
+                result = self._probe()
+                self._write_shared(result)
+        self._result = result
+        return result
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _probe(self):
+        started = time.perf_counter()
+        relays = self.config.get('relays') or [{'host': self.config['host'], 'port': self.config['port']}]
+        probes = [self._probe_relay(relay['host'], relay['port']) for relay in relays]
+        result = {'reachable': any(probe['reachable'] for probe in probes), 'checked_at': time.time()}
+        if not result['reachable']:
+            result['error'] = '; '.join(probe['error'] for probe in probes)
+        if len(probes) > 1:
+            result['relays'] = probes
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def _probe_relay(self, host, port):
+        started = time.perf_counter()
+        result = {'relay': f"{host}:{port}", 'reachable': False}
+        try:
+            server = smtplib.SMTP(host, port, timeout=self.timeout)
+            try:
+                server.ehlo()
+                code = server.noop()[0]
+            finally:
+                try:
+                    server.quit()
+                except (smtplib.SMTPException, OSError):
+                    server.close()
+            result['reachable'] = code == 250
+            if code != 250:
+                result['error'] = f"NOOP answered {code}"
+        except (smtplib.SMTPException, OSError) as e:
+            result['error'] = str(e) or e.__class__.__name__
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    @contextmanager
+    def _probe_lock(self):
+        # Serialize probes across workers; waiters reuse the winner's result
+        with open(self.cache_path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _read_shared(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_shared(self, result):
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, self.cache_path)
@@ -0,0 +1,128 @@
+"""
+Idempotency index for form submissions
+
+A repeated submission (a double-clicked submit button, a client retry, a bot
+replaying the same payload) is recognised by its key: the client's
+Idempotency-Key header when present, otherwise a hash of the normalized
+email, subject and message. The first request claims the key in a SQLite
+table shared by every worker; once it succeeds, its response is stored and
+later repeats inside the TTL get that response back without being validated
+or sending any mail. A request that fails gives the key up again, so a
+corrected resubmission is handled afresh.
+
+The index is bounded in time (IDEMPOTENCY_TTL) and size (IDEMPOTENCY_MAX_KEYS,
+oldest keys are evicted first).
+"""
+
+import hashlib
+import itertools
+import time
+from contextlib import closing
+
+from db import connect, get_connection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    status INTEGER,
+    body TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);
+"""
+
+# Longest Idempotency-Key header accepted
+MAX_KEY_LENGTH = 255
+
+# Rows claimed by a request that is still running have no status yet; a
+# claim older than CLAIM_LEASE seconds belongs to a worker that died
+CLAIM_LEASE = 60
+CLAIM_SQL = """
+INSERT INTO idempotency_keys (key, created_at) VALUES (:key, :now)
+ON CONFLICT (key) DO UPDATE SET status = NULL, body = NULL, created_at = :now
+    WHERE created_at <= :expired OR (status IS NULL AND created_at <= :abandoned)
+"""
+
+
+def _normalize(value):
+    return ' '.join(str(value or '').split()).casefold()
+
+
+def submission_key(header_value, fields):
+    """Idempotency key for a request; None when it cannot be derived
+
+    `fields` are the values hashed when no usable header was sent.
+    """
+    if header_value:
+        if len(header_value) > MAX_KEY_LENGTH:
+            return None
+        return 'header:' + hashlib.sha256(header_value.encode('utf-8')).hexdigest()
+    content = '\x1f'.join(_normalize(value) for value in fields)
+    return 'content:' + hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class IdempotencyIndex:
+    """Shared TTL index of request keys and the responses they produced"""
+
+    def __init__(self, path, ttl=600, max_keys=10000, wait_timeout=2.0, prune_every=100):
+        self.path = path
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.wait_timeout = wait_timeout
+        self.prune_every = prune_every
+        self._stores = itertools.count(1)
+        with closing(connect(self.path)) as conn:
+            conn.executescript(SCHEMA)
+
+    def claim(self, key):
+        """Claim `key` for the calling request
+
+        Returns None when the caller now owns the key and must produce the
+        response, or the stored (status, body) of an earlier request. When
+        that earlier request is still running this waits up to wait_timeout
+        (in total, however often the key changes hands) for its response
+        and returns (None, None) if it never arrives.
+        """
+        conn = get_connection(self.path)
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            now = time.time()
+            params = {'key': key, 'now': now, 'expired': now - self.ttl, 'abandoned': now - CLAIM_LEASE}
+            if conn.execute(CLAIM_SQL, params).rowcount:
+                return None
+
+            row = conn.execute(
+                'SELECT status, body FROM idempotency_keys WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row['status'] is not None:
+                return row['status'], row['body']
+            if time.monotonic() >= deadline:
+                return None, None
+            if row is None:
+                # The owner released the key after failing; try again as owner
+                continue
+            time.sleep(0.05)
+
+    def store(self, key, status, body):
+        """Record the response produced for a claimed key"""
+        get_connection(self.path).execute(
+            'UPDATE idempotency_keys SET status = ?, body = ? WHERE key = ?', (status, body, key)
+        )
+        if next(self._stores) % self.prune_every == 0:
+            self.prune()
+
+    def release(self, key):
+        """Forget a claimed key so the request can be retried (e.g. after an error)"""
+        get_connection(self.path).execute(
+            'DELETE FROM idempotency_keys WHERE key = ? AND status IS NULL', (key,)
+        )
+
+    def prune(self):
+        """Drop expired keys, then the oldest ones beyond max_keys"""
+        conn = get_connection(self.path)
+        conn.execute('DELETE FROM idempotency_keys WHERE created_at <= ?', (time.time() - self.ttl,))
+        conn.execute(
+            'DELETE FROM idempotency_keys WHERE created_at <= ('
+            'SELECT created_at FROM idempotency_keys ORDER BY created_at DESC LIMIT 1 OFFSET ?)',
+            (self.max_keys,)
+        )
@@ -0,0 +1,71 @@
+"""
+JSON encoding with orjson when it is installed, the stdlib otherwise
+
+orjson (see requirements-speedups.txt) encodes and decodes several times
+faster than the json module and writes bytes directly, which matters for
+the mail queue payloads (kilobytes of pre-encoded bodies per submission)
+and for every jsonify response. Without it everything falls back to the
+stdlib and behaves as before.
+
+Output differs from the stdlib only in that non-ASCII characters are
+written as UTF-8 rather than \\u escapes; both are valid JSON.
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Which codec is in use, reported by /api/health/deep and the benchmarks
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+if orjson is not None:
+    # Dates go through Flask's default hook so they keep its HTTP date format
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    _SORTED_OPTIONS = _OPTIONS | orjson.OPT_SORT_KEYS
+
+    def dumps(obj, default=None):
+        return orjson.dumps(obj, default=default, option=_OPTIONS).decode('utf-8')
+
+    def dumpb(obj, default=None, sort_keys=False):
+        """Encode to UTF-8 bytes without an intermediate str"""
+        return orjson.dumps(obj, default=default, option=_SORTED_OPTIONS if sort_keys else _OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj, default=None):
+        return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumpb(obj, default=None, sort_keys=False):
+        return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'),
+                          sort_keys=sort_keys).encode('utf-8')
+
+    loads = json.loads
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by this module's codec
+
+    Calls with extra json.dumps/json.loads arguments, and pretty-printed
+    debug responses, are left to the stdlib implementation.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return dumpb(obj, self.default, self.sort_keys).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumpb(obj, self.default, self.sort_keys) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,373 @@
+"""
+Queue-based logging with one writer per host
+
+Request handlers only put records on an in-memory queue (QueueHandler); a
+listener thread in each worker formats them as JSON lines and ships them in
+batches. Under Gunicorn the master runs a LogServer that receives those
+batches over a unix datagram socket and is the only process appending to the
+log file, so lines from different workers never interleave. Without a
+server (e.g. `python app.py`) the listener writes the file itself.
+
+The file rotates by size and by age:
+
+    LOG_FILE             path of the JSON-lines log (default email_service.log)
+    LOG_LEVEL            root level (default INFO)
+    LOG_MAX_BYTES        rotate when the file would exceed this size
+    LOG_ROTATE_INTERVAL  rotate when the file is older than this many seconds
+    LOG_BACKUP_COUNT     rotated files to keep
+    LOG_FLUSH_INTERVAL   seconds a batch may wait before it is written
+    LOG_QUEUE_SIZE       records buffered per worker before new ones are dropped
+    LOG_STDERR           also print human-readable lines to stderr
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+
+from db import database_path
+
+LOG_FILE = os.getenv('LOG_FILE', 'email_service.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_ROTATE_INTERVAL = int(os.getenv('LOG_ROTATE_INTERVAL', '86400'))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '7'))
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '0.5'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_STDERR = os.getenv('LOG_STDERR', 'true').lower() == 'true'
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_text_formatter = logging.Formatter(TEXT_FORMAT)
+
+# Largest datagram a worker sends; batches are split on line boundaries
+MAX_DATAGRAM = 60 * 1024
+
+# LogRecord attributes that are not `extra` fields
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields are included as keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RotatingWriter:
+    """Appends batches of lines to a file, rotating by size and by age"""
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, rotate_interval=LOG_ROTATE_INTERVAL,
+                 backup_count=LOG_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self._file = None
+        self._open()
+
+    def write(self, data):
+        """Write one batch (bytes of complete lines) with a single syscall"""
+        if self._should_rotate(len(data)):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        stat = os.fstat(self._file.fileno())
+        # An existing file keeps aging across restarts (same base as TimedRotatingFileHandler)
+        self._opened_at = stat.st_mtime if stat.st_size else time.time()
+
+    def _should_rotate(self, incoming):
+        size = self._file.tell()
+        if not size:
+            return False
+        if self.max_bytes and size + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        self.close()
+        if self.backup_count:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+
+class LogServer:
+    """Single writer for the host: receives JSON-line batches over a unix datagram socket
+
+    Runs as a thread in the Gunicorn master. Each datagram holds whole lines
+    from one worker, and datagrams arriving within LOG_FLUSH_INTERVAL are
+    written together.
+    """
+
+    def __init__(self, socket_path, writer, flush_interval=LOG_FLUSH_INTERVAL, max_batch_bytes=256 * 1024):
+        self.socket_path = socket_path
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.max_batch_bytes = max_batch_bytes
+        self._stop = threading.Event()
+        self._thread = None
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self._sock.bind(socket_path)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._sock.close()
+        self.writer.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def _run(self):
+        batch = bytearray()
+        deadline = None
+        while not self._stop.is_set():
+            timeout = 1.0 if deadline is None else max(deadline - time.monotonic(), 0)
+            self._sock.settimeout(timeout)
+            try:
+                data = self._sock.recv(MAX_DATAGRAM)
+            except socket.timeout:
+                data = None
+            except OSError:
+                break
+
+            if data:
+                batch += data
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.max_batch_bytes or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = bytearray()
+                deadline = None
+
+        # Drain whatever arrived before shutdown
+        self._sock.setblocking(False)
+        while True:
+            try:
+                batch += self._sock.recv(MAX_DATAGRAM)
+            except OSError:
+                break
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            self.writer.write(bytes(batch))
+        except Exception as e:
+            sys.stderr.write(f"Log server write failed: {str(e)}\n")
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped when the queue is full"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Keep the record structured (the stock prepare() flattens it to text)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _text_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+class _BatchListener:
+    """Worker-side listener: drains the queue and ships formatted lines in batches"""
+
+    def __init__(self, records, sink, stderr_handler=None, flush_interval=LOG_FLUSH_INTERVAL):
+        self.records = records
+        self.sink = sink
+        self.stderr_handler = stderr_handler
+        self.flush_interval = flush_interval
+        self.formatter = JSONFormatter()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-listener', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.records.put(None)
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                return
+            records = [record]
+            # Wait briefly so a burst of records goes out as one batch
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(records) < 1000:
+                try:
+                    record = self.records.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                records.append(record)
+            self._ship(records)
+            if stopping:
+                return
+
+    def _ship(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record).encode('utf-8', 'replace') + b'\n')
+            except Exception:
+                continue
+            if self.stderr_handler is not None:
+                self.stderr_handler.handle(record)
+        if _DroppingQueueHandler.dropped:
+            dropped, _DroppingQueueHandler.dropped = _DroppingQueueHandler.dropped, 0
+            lines.append(self.formatter.format(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"Log queue full, dropped {dropped} records"
+            })).encode() + b'\n')
+        try:
+            self.sink(lines)
+        except Exception as e:
+            sys.stderr.write(f"Log shipping failed: {str(e)}\n")
+
+
+def _socket_sink(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def send(lines):
+        datagram = bytearray()
+        for line in lines:
+            line = line[:MAX_DATAGRAM - 1] + b'\n' if len(line) > MAX_DATAGRAM else line
+            if len(datagram) + len(line) > MAX_DATAGRAM:
+                sock.sendto(datagram, socket_path)
+                datagram = bytearray()
+            datagram += line
+        if datagram:
+            sock.sendto(datagram, socket_path)
+
+    return send
+
+
+def _file_sink(path):
+    writer = RotatingWriter(path)
+    return lambda lines: writer.write(b''.join(lines))
+
+
+def log_socket_path():
+    return os.getenv('LOG_SOCKET') or database_path('log.sock')
+
+
+def start_log_server():
+    """Start the host-wide writer (Gunicorn master) and point workers at it"""
+    path = log_socket_path()
+    server = LogServer(path, RotatingWriter(LOG_FILE))
+    server.start()
+    # Workers inherit the environment and ship their records here
+    os.environ['LOG_SOCKET'] = path
+    if _listener is not None:
+        # The app was preloaded in this process; stop writing the file directly
+        _start_listener(_listener.records)
+    return server
+
+
+_listener = None
+_stderr_handler = None
+
+
+def _start_listener(records):
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    socket_path = os.getenv('LOG_SOCKET')
+    sink = _socket_sink(socket_path) if socket_path else _file_sink(LOG_FILE)
+    _listener = _BatchListener(records, sink, _stderr_handler)
+    _listener.start()
+
+
+def _restart_in_child():
+    # The listener thread does not survive a fork (e.g. preload_app), and the
+    # queue's lock may have been held by it, so the child starts afresh
+    global _listener
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _DroppingQueueHandler):
+            handler.queue = records
+    _listener = None
+    _start_listener(records)
+
+
+def configure_logging():
+    """Route the root logger through a non-blocking queue (idempotent)"""
+    global _stderr_handler
+    if _listener is not None:
+        return
+
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DroppingQueueHandler(records))
+    root.setLevel(LOG_LEVEL)
+
+    if LOG_STDERR:
+        _stderr_handler = logging.StreamHandler()
+        _stderr_handler.setFormatter(_text_formatter)
+
+    _start_listener(records)
+    os.register_at_fork(after_in_child=_restart_in_child)
+    atexit.register(lambda: _listener.stop())
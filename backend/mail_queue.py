@@ -0,0 +1,484 @@
+"""
+Durable outbound mail queue
+
+Messages are written to a local SQLite table by the request handler and
+delivered by a background dispatcher thread running in each worker, so
+/api/contact never waits on the SMTP relay. Rows are claimed inside an
+IMMEDIATE transaction, which lets every gunicorn worker on the host drain
+the same queue without sending a message twice. A claimed batch is sent
+on a small thread pool, so the admin notification and the auto-reply of a
+submission go out in parallel, and each message records its own outcome
+and send time.
+
+Failures are classified: transient ones (4xx replies, timeouts, dropped or
+refused connections) are rescheduled with jittered exponential backoff,
+while permanent ones, and messages that run out of attempts, move to a
+dead-letter table where they can be inspected and replayed.
+
+Messages enqueued as held (admin notifications in digest mode) are not
+sent on their own. Whenever enough of them have accumulated, or the oldest
+has waited long enough, the next claim merges them into a single digest
+message, built by `digest_builder` in the same transaction that marks them
+digested, and that message is delivered like any other.
+"""
+
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import json_codec
+import metrics
+from db import connect, ensure_columns, get_connection
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbound_mail (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    submission_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    sent_at REAL,
+    duration_ms REAL,
+    next_attempt_at REAL,
+    digest_id INTEGER,
+    claim_token TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbound_mail_status ON outbound_mail (status, id);
+CREATE INDEX IF NOT EXISTS idx_outbound_mail_submission ON outbound_mail (submission_id);
+CREATE INDEX IF NOT EXISTS idx_outbound_mail_claimed ON outbound_mail (claimed_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mail_id INTEGER NOT NULL,
+    submission_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL,
+    failed_at REAL NOT NULL,
+    replayed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_dead_letters_replayed ON dead_letters (replayed_at, id);
+"""
+
+# Columns added after the first release of the table
+MIGRATIONS = {
+    'duration_ms': 'REAL',
+    'next_attempt_at': 'REAL',
+    'digest_id': 'INTEGER',
+    'claim_token': 'TEXT'
+}
+
+
+def is_transient(error):
+    """True for delivery failures worth retrying: 4xx replies, timeouts, lost connections
+
+    Works for smtplib and aiosmtplib exceptions. Anything unrecognised,
+    including plain error strings, counts as permanent.
+    """
+    code = getattr(error, 'smtp_code', None) or getattr(error, 'code', None)
+    if isinstance(code, int):
+        return 400 <= code < 500
+
+    # Every recipient refused: transient only if every refusal was a 4xx
+    recipients = getattr(error, 'recipients', None)
+    if recipients:
+        if isinstance(recipients, dict):
+            codes = [reply[0] for reply in recipients.values()]
+        else:
+            codes = [getattr(refusal, 'code', None) for refusal in recipients]
+        return all(isinstance(c, int) and 400 <= c < 500 for c in codes)
+
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        # Protocol problems such as a missing AUTH extension will not fix themselves
+        return False
+    return isinstance(error, (OSError, TimeoutError))
+
+
+class MailQueue:
+    """SQLite-backed queue of outbound messages with a per-worker dispatcher"""
+
+    def __init__(self, path, sender, poll_interval=1.0, batch_size=10, lease_seconds=300, concurrency=2,
+                 max_attempts=8, retry_base_delay=30, retry_max_delay=3600, digest_builder=None,
+                 digest_interval=300, digest_max_items=50):
+        """`sender(**payload)` delivers one message and raises on failure
+
+        `digest_builder(payloads)` turns the payloads of held messages into
+        the payload of one digest message.
+        """
+        self.path = path
+        self.sender = sender
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.digest_builder = digest_builder
+        self.digest_interval = digest_interval
+        self.digest_max_items = digest_max_items
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Set by an external (e.g. asyncio) dispatcher that replaces the thread
+        self.on_enqueue = None
+        with closing(connect(self.path)) as conn:
+            conn.executescript(SCHEMA)
+            ensure_columns(conn, 'outbound_mail', MIGRATIONS)
+
+    def enqueue(self, submission_id, messages):
+        """Persist messages for a submission and wake the dispatcher
+
+        Each message is a dict with a 'kind' plus the keyword arguments
+        accepted by send_email (to_emails, subject, html_content, ...), or,
+        with 'held': True, whatever digest_builder expects.
+        """
+        now = time.time()
+        rows = [
+            (submission_id, message.get('kind', 'message'),
+             json_codec.dumps({k: v for k, v in message.items() if k not in ('kind', 'held')}),
+             'held' if message.get('held') else 'pending', now, now)
+            for message in messages
+        ]
+        conn = get_connection(self.path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO outbound_mail (submission_id, kind, payload, status, created_at, next_attempt_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._notify()
+
+    def _notify(self):
+        if self.on_enqueue is not None:
+            self.on_enqueue()
+            return
+        self.start()
+        self._wakeup.set()
+
+    def claim(self, limit):
+        """Atomically take up to `limit` pending messages for this worker
+
+        Each claim gets a fresh token, returned with the rows; the outcome of
+        the attempt is only recorded while the row still carries it, so a
+        worker whose lease expired cannot overwrite a later attempt.
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = get_connection(self.path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Give back messages whose worker died mid-send
+            conn.execute(
+                "UPDATE outbound_mail SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+                (now - self.lease_seconds,)
+            )
+            if self.digest_builder is not None:
+                self._coalesce_held(conn, now)
+            rows = conn.execute(
+                "SELECT id, submission_id, kind, payload, attempts, ? AS claim_token FROM outbound_mail "
+                "WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= ?) "
+                "ORDER BY id LIMIT ?",
+                (token, now, limit)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE outbound_mail SET status = 'sending', claimed_at = ?, attempts = attempts + 1, "
+                    "claim_token = ? WHERE id = ?",
+                    [(now, token, row['id']) for row in rows]
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return rows
+
+    def _coalesce_held(self, conn, now):
+        """Merge held messages into digests once a batch is full or the oldest is due"""
+        while True:
+            count, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM outbound_mail WHERE status = 'held'"
+            ).fetchone()
+            if not count or (count < self.digest_max_items and oldest > now - self.digest_interval):
+                return
+            rows = conn.execute(
+                "SELECT id, payload FROM outbound_mail WHERE status = 'held' ORDER BY id LIMIT ?",
+                (self.digest_max_items,)
+            ).fetchall()
+            try:
+                payload = self.digest_builder([json_codec.loads(row['payload']) for row in rows])
+            except Exception as e:
+                # Leave them held rather than block the rest of the queue
+                logger.error(f"Building mail digest failed: {str(e)}")
+                return
+            digest_id = conn.execute(
+                "INSERT INTO outbound_mail (submission_id, kind, payload, created_at, next_attempt_at) "
+                "VALUES (?, 'digest', ?, ?, ?)",
+                (f"digest-{uuid.uuid4().hex}", json_codec.dumps(payload), now, now)
+            ).lastrowid
+            conn.executemany(
+                "UPDATE outbound_mail SET status = 'digested', digest_id = ? WHERE id = ?",
+                [(digest_id, row['id']) for row in rows]
+            )
+            metrics.inc('sysdak_mail_digests_total')
+            metrics.inc('sysdak_mail_digested_total', len(rows))
+            logger.info(f"Merged {len(rows)} held emails into digest {digest_id}")
+
+    # The mark_* methods return False, changing nothing, when the claim is no
+    # longer current (the lease expired and the row was requeued or reclaimed)
+    def mark_sent(self, message_id, claim_token, duration_ms=None):
+        return get_connection(self.path).execute(
+            "UPDATE outbound_mail SET status = 'sent', sent_at = ?, duration_ms = ?, last_error = NULL "
+            "WHERE id = ? AND status = 'sending' AND claim_token = ?",
+            (time.time(), duration_ms, message_id, claim_token)
+        ).rowcount == 1
+
+    def mark_retry(self, message_id, claim_token, error, delay, duration_ms=None):
+        """Put a message back in the queue to be tried again after `delay` seconds"""
+        return get_connection(self.path).execute(
+            "UPDATE outbound_mail SET status = 'pending', duration_ms = ?, last_error = ?, next_attempt_at = ? "
+            "WHERE id = ? AND status = 'sending' AND claim_token = ?",
+            (duration_ms, error, time.time() + delay, message_id, claim_token)
+        ).rowcount == 1
+
+    def mark_failed(self, message_id, claim_token, error, duration_ms=None):
+        """Give up on a message and record it in the dead-letter store"""
+        now = time.time()
+        conn = get_connection(self.path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = conn.execute(
+                "UPDATE outbound_mail SET status = 'failed', duration_ms = ?, last_error = ? "
+                "WHERE id = ? AND status = 'sending' AND claim_token = ?",
+                (duration_ms, error, message_id, claim_token)
+            ).rowcount == 1
+            if current:
+                conn.execute(
+                    'INSERT INTO dead_letters (mail_id, submission_id, kind, error, attempts, failed_at) '
+                    'SELECT id, submission_id, kind, last_error, attempts, ? FROM outbound_mail WHERE id = ?',
+                    (now, message_id)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return current
+
+    def retry_delay(self, attempt):
+        """Jittered exponential backoff before the attempt after `attempt`"""
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    def dead_letters(self, limit=100, include_replayed=False):
+        """Messages that failed for good, newest first, without their bodies"""
+        rows = get_connection(self.path).execute(
+            "SELECT d.id, d.mail_id, d.submission_id, d.kind, d.error, d.attempts, d.failed_at, d.replayed_at, "
+            "m.payload FROM dead_letters d JOIN outbound_mail m ON m.id = d.mail_id "
+            + ("" if include_replayed else "WHERE d.replayed_at IS NULL ")
+            + "ORDER BY d.id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+        letters = []
+        for row in rows:
+            letter = {key: row[key] for key in row.keys() if key != 'payload'}
+            payload = json_codec.loads(row['payload'])
+            letter['to_emails'] = payload.get('to_emails')
+            letter['subject'] = payload.get('subject')
+            letters.append(letter)
+        return letters
+
+    def replay(self, dead_letter_ids=None):
+        """Queue dead letters for delivery again (all unreplayed ones by default)
+
+        Returns the number of messages requeued.
+        """
+        now = time.time()
+        conn = get_connection(self.path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            query = 'SELECT id, mail_id FROM dead_letters WHERE replayed_at IS NULL'
+            params = ()
+            if dead_letter_ids is not None:
+                query += f" AND id IN ({','.join('?' * len(dead_letter_ids))})"
+                params = tuple(dead_letter_ids)
+            rows = conn.execute(query, params).fetchall() if dead_letter_ids != [] else []
+            conn.executemany(
+                "UPDATE outbound_mail SET status = 'pending', attempts = 0, next_attempt_at = ? "
+                "WHERE id = ? AND status = 'failed'",
+                [(now, row['mail_id']) for row in rows]
+            )
+            conn.executemany(
+                'UPDATE dead_letters SET replayed_at = ? WHERE id = ?',
+                [(now, row['id']) for row in rows]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if rows:
+            self._notify()
+        return len(rows)
+
+    def status(self, submission_id):
+        """Per-message delivery state for a submission, or None if unknown"""
+        # A digested message reports the state of the digest that carries it
+        rows = get_connection(self.path).execute(
+            "SELECT m.kind, COALESCE(d.status, m.status) AS status, COALESCE(d.attempts, m.attempts) AS attempts, "
+            "COALESCE(d.duration_ms, m.duration_ms) AS duration_ms "
+            "FROM outbound_mail m LEFT JOIN outbound_mail d ON d.id = m.digest_id "
+            "WHERE m.submission_id = ? ORDER BY m.id",
+            (submission_id,)
+        ).fetchall()
+        if not rows:
+            return None
+
+        # Messages waiting for a retry or a digest are still 'pending'
+        statuses = {row['status'] for row in rows}
+        if statuses == {'sent'}:
+            overall = 'sent'
+        elif 'failed' in statuses:
+            overall = 'partial' if 'sent' in statuses else 'failed'
+        else:
+            overall = 'pending'
+
+        return {
+            'status': overall,
+            'messages': [dict(row) for row in rows]
+        }
+
+    def depth(self):
+        """Number of messages waiting to be delivered"""
+        row = get_connection(self.path).execute(
+            "SELECT COUNT(*) FROM outbound_mail WHERE status IN ('pending', 'sending')"
+        ).fetchone()
+        return row[0]
+
+    def pressure(self, window=60):
+        """Delivery load across every worker on the host
+
+        Returns (waiting, in_flight, latency): messages due and not yet being
+        sent, messages being sent right now, and the mean duration in seconds
+        of attempts claimed in the last `window` seconds. With no finished
+        attempt in the window, the age of the oldest send in flight stands in
+        for it (None when nothing is in flight either).
+        """
+        now = time.time()
+        conn = get_connection(self.path)
+        waiting, in_flight, oldest_claim = conn.execute(
+            "SELECT COALESCE(SUM(status = 'pending' AND COALESCE(next_attempt_at, 0) <= ?), 0), "
+            "COALESCE(SUM(status = 'sending'), 0), MIN(CASE WHEN status = 'sending' THEN claimed_at END) "
+            "FROM outbound_mail WHERE status IN ('pending', 'sending')",
+            (now,)
+        ).fetchone()
+        latency_ms = conn.execute(
+            # A row being sent still holds its previous attempt's duration
+            "SELECT AVG(duration_ms) FROM outbound_mail "
+            "WHERE claimed_at >= ? AND status != 'sending' AND duration_ms IS NOT NULL",
+            (now - window,)
+        ).fetchone()[0]
+        if latency_ms is not None:
+            latency = latency_ms / 1000
+        else:
+            latency = now - oldest_claim if oldest_claim is not None else None
+        return waiting, in_flight, latency
+
+    def start(self):
+        """Start the dispatcher thread for the current process (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='mail-sender')
+            self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                rows = self.claim(self.batch_size)
+            except Exception as e:
+                logger.error(f"Mail queue claim failed: {str(e)}")
+                rows = []
+
+            if not rows:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            # Messages are independent, so deliver the batch concurrently
+            list(self._executor.map(self._deliver, rows))
+
+    def _deliver(self, row):
+        started = time.monotonic()
+        try:
+            self.sender(**json_codec.loads(row['payload']))
+            error = None
+        except Exception as e:
+            error = e
+        self.record_result(row, error, (time.monotonic() - started) * 1000)
+
+    def record_result(self, row, error, duration_ms):
+        """Store the outcome of one delivery attempt for a claimed row
+
+        `error` is the exception raised by the attempt, or None on success.
+        """
+        attempt = row['attempts'] + 1  # claim() counted this attempt after reading the row
+        if error is None:
+            result = 'sent'
+        elif is_transient(error) and attempt < self.max_attempts:
+            result = 'retry'
+        else:
+            result = 'failed'
+        metrics.observe('sysdak_stage_duration_seconds', duration_ms / 1000, stage='delivery')
+        metrics.inc('sysdak_mail_deliveries_total', kind=row['kind'], result=result)
+
+        description = f"{row['kind']} email for submission {row['submission_id']}"
+        token = row['claim_token']
+        try:
+            if result == 'sent':
+                current = self.mark_sent(row['id'], token, duration_ms)
+                logger.info(f"Delivered {description} in {duration_ms:.0f} ms")
+            elif result == 'retry':
+                delay = self.retry_delay(attempt)
+                current = self.mark_retry(row['id'], token, str(error), delay, duration_ms)
+                logger.warning(f"Queued {description} failed (attempt {attempt}/{self.max_attempts}), "
+                               f"retrying in {delay:.0f} s: {str(error)}")
+            else:
+                current = self.mark_failed(row['id'], token, str(error), duration_ms)
+                logger.error(f"Queued {description} failed after {attempt} attempts, moved to dead letters: {str(error)}")
+            if not current:
+                logger.warning(f"Lease on queued email {row['id']} expired before the attempt finished; "
+                               f"its result was not recorded")
+        except Exception as e:
+            logger.error(f"Error recording delivery of queued email {row['id']}: {str(e)}")
@@ -0,0 +1,295 @@
+"""
+Latency and throughput metrics, combined across Gunicorn workers
+
+Each process records into an in-memory registry (histograms and counters
+with labels) and periodically writes a snapshot to DATA_DIR/metrics/<pid>.json.
+A scrape of /api/metrics merges the snapshots of every live worker with an
+archive of workers that have already exited, so counters only move forward
+when workers are recycled. The master folds a dead worker's snapshot into
+the archive from Gunicorn's child_exit hook (see archive_worker).
+
+Recording is lock-protected dict arithmetic; nothing touches disk on the
+request path.
+"""
+
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from db import database_path
+
+# Seconds between snapshot writes; a scrape also writes its own worker's first
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Histogram bucket upper bounds in seconds (SMTP stages can take several seconds)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'sysdak_stage_duration_seconds': ('histogram', 'Time spent in one stage of request handling or mail delivery'),
+    'sysdak_http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'sysdak_rate_limit_rejections_total': ('counter', 'Requests rejected by the rate limiter'),
+    'sysdak_mail_deliveries_total': ('counter', 'Queued mail delivery attempts by outcome'),
+    'sysdak_mail_digests_total': ('counter', 'Digest emails built from held admin notifications'),
+    'sysdak_mail_digested_total': ('counter', 'Admin notifications merged into digest emails'),
+    'sysdak_mail_queue_depth': ('gauge', 'Outbound mail waiting to be delivered'),
+    'sysdak_email_validation_cache_entries': ('gauge', 'Email validation results cached by the worker serving the scrape'),
+    'sysdak_email_validation_cache_lookups_total': ('counter', 'Email validation cache lookups by result'),
+    'sysdak_email_validation_cache_evictions_total': ('counter', 'Email validation results evicted to make room'),
+    'sysdak_workers': ('gauge', 'Worker processes contributing to these metrics'),
+    'sysdak_autoscale_workers': ('gauge', 'Worker count the Gunicorn master is maintaining'),
+    'sysdak_autoscale_desired_workers': ('gauge', 'Worker count wanted by the autoscaler for the last sample'),
+    'sysdak_autoscale_load': ('gauge', 'Average requests in flight over the last autoscaler sample'),
+    'sysdak_autoscale_backlog': ('gauge', 'Outbound mail due for delivery at the last autoscaler sample'),
+    'sysdak_autoscale_decisions_total': ('counter', 'Worker count changes made by the autoscaler'),
+    'sysdak_relay_sends_total': ('counter', 'SMTP send attempts per relay by outcome'),
+    'sysdak_relay_circuit_transitions_total': ('counter', 'SMTP relay circuit breaker state changes'),
+    'sysdak_schema_rejections_total': ('counter', 'Request bodies refused while parsing against their schema'),
+    'sysdak_admission_rejections_total': ('counter', 'Requests shed with 503 while the mail backlog drained too slowly')
+}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Registry:
+    """Histograms and counters recorded by this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # key -> [bucket counts..., +Inf count, sum]
+        self.counters = {}
+        self.dirty = False
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            values = self.histograms.get(key)
+            if values is None:
+                values = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            values[index] += 1
+            values[-1] += seconds
+            self.dirty = True
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.dirty = True
+
+    def snapshot(self):
+        with self._lock:
+            self.dirty = False
+            return {
+                'histograms': [[name, dict(labels), values[:]] for (name, labels), values in self.histograms.items()],
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()]
+            }
+
+
+registry = Registry()
+
+
+def observe(name, seconds, **labels):
+    registry.observe(name, seconds, **labels)
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+# Stages timed by the current thread's request, while a trace is running (see profiler)
+_stage_trace = threading.local()
+
+
+def start_stage_trace():
+    _stage_trace.stages = []
+
+
+def stop_stage_trace():
+    """Return the [(stage, seconds)] timed since start_stage_trace and stop tracing"""
+    stages = getattr(_stage_trace, 'stages', None)
+    _stage_trace.stages = None
+    return stages
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of a block as sysdak_stage_duration_seconds{stage=...}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe('sysdak_stage_duration_seconds', elapsed, stage=stage)
+        stages = getattr(_stage_trace, 'stages', None)
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+
+def metrics_dir():
+    path = database_path('metrics')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _locked(shared):
+    with open(os.path.join(metrics_dir(), '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+def flush(force=False):
+    """Write this process's snapshot if anything changed since the last write"""
+    if not (registry.dirty or force):
+        return
+    with _locked(shared=True):
+        _write_json(os.path.join(metrics_dir(), f"{os.getpid()}.json"), registry.snapshot())
+
+
+def _merge(target, snapshot):
+    for name, labels, values in snapshot['histograms']:
+        key = _key(name, labels)
+        current = target['histograms'].get(key)
+        if current is None:
+            target['histograms'][key] = list(values)
+        else:
+            for index, value in enumerate(values):
+                current[index] += value
+    for name, labels, value in snapshot['counters']:
+        key = _key(name, labels)
+        target['counters'][key] = target['counters'].get(key, 0) + value
+
+
+def _serializable(merged):
+    return {
+        'histograms': [[name, dict(labels), values] for (name, labels), values in merged['histograms'].items()],
+        'counters': [[name, dict(labels), value] for (name, labels), value in merged['counters'].items()]
+    }
+
+
+def archive_worker(pid):
+    """Fold an exited worker's final snapshot into the archive (Gunicorn master)"""
+    path = os.path.join(metrics_dir(), f"{pid}.json")
+    with _locked(shared=False):
+        snapshot = _read_json(path)
+        if snapshot is None:
+            return
+        archive_path = os.path.join(metrics_dir(), 'archive.json')
+        merged = {'histograms': {}, 'counters': {}}
+        for part in (_read_json(archive_path), snapshot):
+            if part:
+                _merge(merged, part)
+        _write_json(archive_path, _serializable(merged))
+        os.remove(path)
+
+
+def reset():
+    """Discard snapshots from a previous run (Gunicorn master, at startup)"""
+    with _locked(shared=False):
+        for path in glob.glob(os.path.join(metrics_dir(), '*.json')):
+            os.remove(path)
+
+
+def collect():
+    """Merge the archive and every worker snapshot; returns (merged, worker_count)"""
+    flush(force=True)
+    merged = {'histograms': {}, 'counters': {}}
+    workers = 0
+    with _locked(shared=True):
+        for path in glob.glob(os.path.join(metrics_dir(), '*.json')):
+            snapshot = _read_json(path)
+            if snapshot is None:
+                continue
+            if not path.endswith('archive.json'):
+                workers += 1
+            _merge(merged, snapshot)
+    return merged, workers
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render(gauges=()):
+    """Prometheus text exposition of all workers' metrics
+
+    `gauges` are (name, labels, value) triples computed at scrape time, such
+    as the mail queue depth, which is host-wide and read from its database.
+    """
+    merged, workers = collect()
+    families = {}
+    for (name, labels), values in merged['histograms'].items():
+        lines = families.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(BUCKETS, values):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, [('le', repr(bound))])} {cumulative}")
+        cumulative += values[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {values[-1]}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    for (name, labels), value in merged['counters'].items():
+        families.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+    for name, labels, value in list(gauges) + [('sysdak_workers', {}, workers)]:
+        families.setdefault(name, []).append(f"{name}{_labels(sorted(labels.items()))} {value}")
+
+    output = []
+    for name in sorted(families):
+        kind, description = HELP.get(name, ('untyped', name))
+        output.append(f"# HELP {name} {description}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(sorted(families[name]) if kind != 'histogram' else families[name])
+    return '\n'.join(output) + '\n'
+
+
+def _run_flusher():
+    pid = os.getpid()
+    while os.getpid() == pid:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _start_flusher():
+    threading.Thread(target=_run_flusher, name='metrics-flusher', daemon=True).start()
+
+
+def _reset_in_child():
+    # Figures recorded before a fork (e.g. preload_app) belong to the parent
+    global registry
+    registry = Registry()
+    _start_flusher()
+
+
+_start_flusher()
+os.register_at_fork(after_in_child=_reset_in_child)
+atexit.register(flush)
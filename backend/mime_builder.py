@@ -0,0 +1,126 @@
+"""
+MIME message assembly from pre-encoded parts
+
+Static template chunks are base64-encoded once at import, so building a
+message only encodes the dynamic slot values and joins cached bytes, instead
+of running MIMEText's encoder over the whole HTML body (CSS, footer and
+contact blocks included) for every send.
+
+Base64 works on 3-byte groups, so a chunk's encoding depends on how many
+bytes (0-2) the previous segment left over. Each chunk is therefore cached
+in three variants, one per carry length. RFC 2045 only caps encoded lines
+at 76 characters, so segments are wrapped independently and joined with
+CRLF; decoders ignore the line breaks.
+"""
+
+import base64
+import secrets
+
+# Cached segments wrap at 72 so a 4-character carry group fits on their first line
+LINE_WIDTH = 72
+
+# ASCII headers shorter than this are emitted unfolded (RFC 5322 hard limit is 998)
+MAX_HEADER_LINE = 900
+
+PART_HEADERS = {
+    'html': b'Content-Type: text/html; charset="utf-8"\r\n'
+            b'MIME-Version: 1.0\r\n'
+            b'Content-Transfer-Encoding: base64\r\n\r\n',
+    'plain': b'Content-Type: text/plain; charset="utf-8"\r\n'
+             b'MIME-Version: 1.0\r\n'
+             b'Content-Transfer-Encoding: base64\r\n\r\n'
+}
+
+
+def _wrap(encoded):
+    return b'\r\n'.join(encoded[i:i + LINE_WIDTH] for i in range(0, len(encoded), LINE_WIDTH))
+
+
+def _encode_groups(pending, out):
+    """Append the whole 3-byte groups of `pending` to `out`, return the remainder"""
+    aligned = len(pending) - len(pending) % 3
+    if aligned:
+        out.append(_wrap(base64.b64encode(pending[:aligned])))
+    return pending[aligned:]
+
+
+class EncodedTemplate:
+    """Base64 encoding of a CompiledTemplate with its static chunks cached"""
+
+    def __init__(self, chunks, slots):
+        self.slots = slots
+        self.chunks = [self._precompute(chunk.encode('utf-8')) for chunk in chunks]
+
+    @staticmethod
+    def _precompute(data):
+        variants = []
+        for carry in range(3):
+            head = min((3 - carry) % 3, len(data))
+            rest = data[head:]
+            aligned = len(rest) - len(rest) % 3
+            variants.append((data[:head], _wrap(base64.b64encode(rest[:aligned])), rest[aligned:]))
+        return variants
+
+    def render(self, values):
+        """Return the wrapped base64 body (ASCII str) for the given slot values"""
+        out = []
+        pending = b''
+        for index, variants in enumerate(self.chunks):
+            head, encoded, tail = variants[len(pending)]
+            pending += head
+            if len(pending) == 3:
+                group = base64.b64encode(pending)
+                out.append(group + encoded if encoded else group)
+                pending = b''
+            elif encoded:
+                out.append(encoded)
+            pending += tail
+
+            if index < len(self.slots):
+                pending = _encode_groups(pending + values[self.slots[index]].encode('utf-8'), out)
+
+        if pending:
+            out.append(base64.b64encode(pending))
+        return b'\r\n'.join(out).decode('ascii')
+
+
+def encode_body(text):
+    """Base64-encode a body that has no cached template"""
+    return _wrap(base64.b64encode(text.encode('utf-8'))).decode('ascii')
+
+
+def _header(name, value):
+    # Never let user-supplied values start a new header line
+    value = ' '.join(str(value).splitlines())
+    if value.isascii() and len(name) + len(value) < MAX_HEADER_LINE:
+        return f"{name}: {value}\r\n".encode('ascii')
+    charset = 'us-ascii' if value.isascii() else 'utf-8'
+    # Only non-ASCII or very long values get here; most sends never load email.header
+    from email.header import Header
+
+    encoded = Header(value, charset, header_name=name).encode(linesep='\r\n')
+    return f"{name}: {encoded}\r\n".encode('ascii')
+
+
+def assemble_message(from_email, to_header, subject, html_encoded, text_encoded=None, reply_to=None):
+    """Build a multipart/alternative message from base64-encoded bodies
+
+    Returns the message as bytes, ready for SMTP.sendmail.
+    """
+    boundary = f"==============={secrets.token_hex(12)}==".encode('ascii')
+    parts = [
+        b'Content-Type: multipart/alternative; boundary="' + boundary + b'"\r\n',
+        b'MIME-Version: 1.0\r\n',
+        _header('Subject', subject),
+        _header('From', from_email),
+        _header('To', to_header)
+    ]
+    if reply_to:
+        parts.append(_header('Reply-To', reply_to))
+
+    delimiter = b'\r\n--' + boundary + b'\r\n'
+    parts += [delimiter, PART_HEADERS['html'], html_encoded.encode('ascii')]
+    if text_encoded:
+        parts += [delimiter, PART_HEADERS['plain'], text_encoded.encode('ascii')]
+    parts.append(b'\r\n--' + boundary + b'--\r\n')
+    return b''.join(parts)
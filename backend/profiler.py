@@ -0,0 +1,251 @@
+"""
+On-demand sampling profiler and slow-request capture for Gunicorn workers
+
+Profiling is off until it is switched on for one worker, either with
+SIGUSR2 sent to the worker's pid (not the master's: there it means a binary
+upgrade) or through POST /api/admin/profiler, which toggles the worker that
+serves the call. Requests are traced from Gunicorn's pre_request and
+post_request hooks, which sync and gthread workers run on the thread that
+handles the request (uvicorn workers do not call them). While it is on, a
+sampler thread wakes every PROFILE_INTERVAL seconds and records the stack
+of every thread that is in the middle of a request; threads that are idle
+are never looked at. It turns itself off after PROFILE_MAX_SECONDS so a
+forgotten session does not keep running.
+
+Two kinds of captures go to DATA_DIR/profiles:
+
+- slow-*: every request slower than PROFILE_SLOW_REQUEST_MS, with the stage
+  breakdown from metrics.timed and, when the profiler was on, the stacks
+  sampled while it ran. Stage breakdowns are kept even while profiling is
+  off, as they cost nothing.
+- session-*: everything sampled in the worker between switching profiling
+  on and off.
+
+Stacks are written in the collapsed format ("frame;frame;frame count"),
+which flamegraph.pl, speedscope and inferno read directly; a .json file next
+to each holds the request, timing and stage details. The directory is a
+ring: only the newest PROFILE_MAX_CAPTURES captures are kept.
+"""
+
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import metrics
+from db import database_path
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.01'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '300'))
+PROFILE_SLOW_REQUEST_MS = float(os.getenv('PROFILE_SLOW_REQUEST_MS', '1000'))
+PROFILE_MAX_CAPTURES = int(os.getenv('PROFILE_MAX_CAPTURES', '200'))
+
+# Deeper stacks are cut at the root end
+MAX_STACK_DEPTH = 128
+
+
+class RequestTrace:
+    """Timing and samples of one request in flight"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.samples = Counter()
+
+
+class Session:
+    """One stretch of profiling, from switching it on until it stops"""
+
+    def __init__(self, seconds):
+        self.started = time.time()
+        self.deadline = time.monotonic() + seconds
+        self.samples = Counter()
+        self.stopped = False
+
+
+class SamplingProfiler:
+    """Per-worker sampler of in-flight request stacks"""
+
+    def __init__(self, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS,
+                 slow_request_ms=PROFILE_SLOW_REQUEST_MS, max_captures=PROFILE_MAX_CAPTURES):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.slow_request_ms = slow_request_ms
+        self.max_captures = max_captures
+        self._session = None
+        self._traces = {}  # thread ident -> RequestTrace
+        self._labels = {}  # code object -> frame label
+        # Reentrant: the signal handler may interrupt an enable() on the main thread
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self._session is not None
+
+    def enable(self, seconds=None):
+        """Start sampling in this worker for up to `seconds` (PROFILE_MAX_SECONDS at most)"""
+        seconds = min(seconds or self.max_seconds, self.max_seconds)
+        with self._lock:
+            if self._session is not None:
+                self._session.deadline = time.monotonic() + seconds
+                return
+            self._session = Session(seconds)
+            threading.Thread(target=self._run, args=(self._session,), name='profiler', daemon=True).start()
+
+    def disable(self):
+        """Stop sampling; the sampler thread writes the session capture as it exits"""
+        with self._lock:
+            session, self._session = self._session, None
+            if session is not None:
+                session.stopped = True
+
+    def toggle(self, *args):
+        """SIGUSR2 handler (does no logging or I/O itself)"""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def status(self):
+        session = self._session
+        return {
+            'pid': os.getpid(),
+            'enabled': session is not None,
+            'since': session.started if session else None,
+            'seconds_left': round(max(session.deadline - time.monotonic(), 0), 1) if session else None,
+            'interval': self.interval,
+            'slow_request_ms': self.slow_request_ms
+        }
+
+    def begin_request(self):
+        """Gunicorn pre_request: start tracing the calling thread's request"""
+        self._traces[threading.get_ident()] = RequestTrace()
+        metrics.start_stage_trace()
+
+    def end_request(self, method, path, status):
+        """Gunicorn post_request: keep the request's breakdown if it was slow"""
+        trace = self._traces.pop(threading.get_ident(), None)
+        stages = metrics.stop_stage_trace()
+        if trace is None:
+            return
+        elapsed_ms = (time.perf_counter() - trace.started) * 1000
+        if not self.slow_request_ms or elapsed_ms < self.slow_request_ms:
+            return
+        try:
+            self.write_capture('slow', {
+                'method': method,
+                'path': path,
+                'status': status,
+                'duration_ms': round(elapsed_ms, 1),
+                'stages': [{'stage': stage, 'ms': round(seconds * 1000, 3)} for stage, seconds in stages or ()]
+            }, trace.samples, root=f"{method} {path}")
+        except OSError as e:
+            logger.error(f"Writing slow request capture failed: {str(e)}")
+
+    def _run(self, session):
+        pid = os.getpid()
+        logger.info(f"Profiling worker {pid} for up to {session.deadline - time.monotonic():.0f}s")
+        while not session.stopped and time.monotonic() < session.deadline:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, trace in list(self._traces.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = self._collapse(frame)
+                trace.samples[stack] += 1
+                session.samples[stack] += 1
+            del frames
+
+        with self._lock:
+            if self._session is session:
+                self._session = None
+        samples = sum(session.samples.values())
+        logger.info(f"Profiling of worker {pid} stopped after {samples} samples")
+        if samples:
+            try:
+                self.write_capture('session', {
+                    'started': session.started,
+                    'duration_s': round(time.time() - session.started, 1)
+                }, session.samples)
+            except OSError as e:
+                logger.error(f"Writing profiling session failed: {str(e)}")
+
+    def _collapse(self, frame):
+        labels = self._labels
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                # ';' separates frames in the collapsed format
+                label = labels[code] = (f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                                        f"{code.co_firstlineno})").replace(';', ':')
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return ';'.join(stack)
+
+    def write_capture(self, kind, details, samples, root=None):
+        """Write <name>.json (and <name>.folded when there are samples), then trim the ring"""
+        directory = database_path('profiles')
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        name = f"{kind}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}.{int(now % 1 * 1000000):06d}-{os.getpid()}"
+        details = {'name': name, 'pid': os.getpid(), 'interval': self.interval,
+                   'samples': sum(samples.values()), **details}
+        if samples:
+            prefix = root.replace(';', ':') + ';' if root else ''
+            with open(os.path.join(directory, f"{name}.folded"), 'w') as f:
+                f.writelines(f"{prefix}{stack} {count}\n" for stack, count in samples.most_common())
+        with open(os.path.join(directory, f"{name}.json"), 'w') as f:
+            json.dump(details, f)
+        self._trim(directory)
+        return name
+
+    def _trim(self, directory):
+        captures = sorted(glob.glob(os.path.join(directory, '*.json')), key=_capture_time)
+        for path in captures[:max(len(captures) - self.max_captures, 0)]:
+            for stale in (path, path[:-len('.json')] + '.folded'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+
+def _capture_time(path):
+    # Names are <kind>-<UTC timestamp>.<microseconds>-<pid>
+    return os.path.basename(path).split('-', 1)[1]
+
+
+def captures(limit=50):
+    """Newest captures on this host (every worker), details only"""
+    directory = database_path('profiles')
+    paths = sorted(glob.glob(os.path.join(directory, '*.json')), key=_capture_time, reverse=True)
+    found = []
+    for path in paths[:limit]:
+        try:
+            with open(path) as f:
+                found.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return found
+
+
+def capture_stacks(name):
+    """Collapsed stacks of a capture, or None if there are none"""
+    if os.path.basename(name) != name or name.startswith('.'):
+        return None
+    try:
+        with open(os.path.join(database_path('profiles'), f"{name}.folded")) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+profiler = SamplingProfiler()
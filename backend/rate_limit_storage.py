@@ -0,0 +1,160 @@
+"""
+Host-wide rate limit storage for Flask-Limiter
+
+With `storage_uri="memory://"` every gunicorn worker keeps its own counters,
+so a "5 per hour" limit really allows 5 x workers. This backend keeps the
+counters in a WAL-mode SQLite table shared by all workers on the host, with
+no external service. Each hit is a single UPSERT statement, so workers never
+take an application-level lock, and expired keys are purged by a background
+thread instead of on the request path.
+
+Importing this module registers the `sqlite://` scheme with `limits`:
+
+    sqlite://rate_limits.db        file inside DATA_DIR
+    sqlite:////var/lib/x/rl.db     absolute path
+
+Supports the fixed-window and sliding-window-counter strategies.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from limits.storage import SlidingWindowCounterSupport, Storage
+
+from db import connect, database_path, get_connection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rate_limits_expires_at ON rate_limits (expires_at);
+"""
+
+INCR_SQL = """
+INSERT INTO rate_limits (key, count, expires_at) VALUES (:key, :amount, :expires_at)
+ON CONFLICT (key) DO UPDATE SET
+    count = CASE WHEN expires_at <= :now THEN excluded.count ELSE count + excluded.count END,
+    expires_at = CASE WHEN expires_at <= :now THEN excluded.expires_at ELSE expires_at END
+RETURNING count
+"""
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport):
+    """Rate limit counters in a SQLite table shared by every worker on the host"""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri=None, wrap_exceptions=False, cleanup_interval=60, **options):
+        location = (uri or '')[len('sqlite://'):]
+        self.path = location if os.path.isabs(location) else database_path(location or 'rate_limits.db')
+        self.cleanup_interval = float(cleanup_interval)
+        self._cleaner = None
+        self._cleaner_pid = None
+        self._lock = threading.Lock()
+        with closing(connect(self.path)) as conn:
+            conn.executescript(SCHEMA)
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, amount=1):
+        self._start_cleaner()
+        now = time.time()
+        row = get_connection(self.path).execute(
+            INCR_SQL, {'key': key, 'amount': amount, 'expires_at': now + expiry, 'now': now}
+        ).fetchone()
+        return row[0]
+
+    def decr(self, key, amount=1):
+        get_connection(self.path).execute(
+            'UPDATE rate_limits SET count = MAX(count - ?, 0) WHERE key = ?', (amount, key)
+        )
+
+    def get(self, key):
+        row = get_connection(self.path).execute(
+            'SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = get_connection(self.path).execute(
+            'SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            get_connection(self.path).execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return get_connection(self.path).execute('DELETE FROM rate_limits').rowcount
+
+    def clear(self, key):
+        get_connection(self.path).execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+
+    # Sliding window counter: one fixed-window counter per window, weighted
+    # by how much of the previous window still overlaps the current one.
+
+    @staticmethod
+    def _window_keys(key, expiry, now):
+        return f"{key}/{int((now - expiry) / expiry)}", f"{key}/{int(now / expiry)}"
+
+    def _window_info(self, key, expiry, now):
+        previous_key, current_key = self._window_keys(key, expiry, now)
+        previous_count = self.get(previous_key)
+        current_count = self.get(current_key)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_count, previous_ttl, current_count, _ = self._window_info(key, expiry, now)
+        if math.floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+            return False
+
+        current_key = self._window_keys(key, expiry, now)[1]
+        current_count = self.incr(current_key, 2 * expiry, amount=amount)
+        if math.floor(previous_count * previous_ttl / expiry + current_count) > limit:
+            # Another worker won the race for the last slot
+            self.decr(current_key, amount)
+            return False
+        return True
+
+    def get_sliding_window(self, key, expiry):
+        return self._window_info(key, expiry, time.time())
+
+    def clear_sliding_window(self, key, expiry):
+        for window_key in self._window_keys(key, expiry, time.time()):
+            self.clear(window_key)
+
+    def _start_cleaner(self):
+        if self._cleaner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._cleaner_pid == os.getpid():
+                return
+            self._cleaner_pid = os.getpid()
+            self._cleaner = threading.Thread(target=self._purge_expired, name='rate-limit-cleaner', daemon=True)
+            self._cleaner.start()
+
+    def _purge_expired(self):
+        while True:
+            time.sleep(self.cleanup_interval)
+            try:
+                get_connection(self.path).execute('DELETE FROM rate_limits WHERE expires_at <= ?', (time.time(),))
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,280 @@
+"""
+Load balancing and failover across several SMTP relays
+
+EMAIL_RELAYS lists relays as host:port*weight (weight defaults to 1), e.g.
+"smtp-a.example.com:587*3,smtp-b.example.com:587". Without it the single
+EMAIL_HOST/EMAIL_PORT relay is used, as before. Every relay keeps its own
+pool of authenticated sessions and shares the account settings of
+EMAIL_CONFIG.
+
+A send goes to the better of two relays drawn at random in proportion to
+their weights: the one with fewer sends in flight per unit of weight, then
+the lower recent latency. Relay failures (connection errors, timeouts,
+dropped sessions, 4xx throttling, rejected logins) move the send to another
+relay and count against the relay's circuit breaker. After
+EMAIL_RELAY_FAILURE_THRESHOLD consecutive failures the circuit opens and
+the relay is skipped; once EMAIL_RELAY_RESET_TIMEOUT seconds have passed a
+single send is let through as a probe (half-open), and its outcome closes
+the circuit again or reopens it. When every circuit is open a send fails
+immediately with a 421, which the mail queue treats as transient.
+
+Breaker state is per worker process; each worker learns on its own sends.
+"""
+
+import logging
+import math
+import random
+import smtplib
+import threading
+import time
+
+import metrics
+from smtp_pool import SMTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Weight given to the newest sample in a relay's latency average
+LATENCY_SMOOTHING = 0.2
+
+
+def parse_relays(spec, default_host, default_port):
+    """Parse EMAIL_RELAYS into [{'host', 'port', 'weight'}]; falls back to the single relay
+
+    Raises ValueError for a malformed entry or a weight that is not a
+    positive number, so a bad setting stops startup instead of failing sends.
+    """
+    relays = []
+    for entry in (spec or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        address, _, weight = entry.partition('*')
+        host, _, port = address.strip().rpartition(':')
+        if not host:
+            host, port = port, ''
+        weight = float(weight) if weight else 1.0
+        if not (weight > 0 and math.isfinite(weight)):
+            raise ValueError(f"EMAIL_RELAYS weight for {address.strip()} must be a positive number")
+        relays.append({
+            'host': host,
+            'port': int(port) if port else default_port,
+            'weight': weight
+        })
+    return relays or [{'host': default_host, 'port': default_port, 'weight': 1.0}]
+
+
+def is_relay_failure(error):
+    """True when an error says the relay, not the message, is the problem
+
+    Works for smtplib and aiosmtplib exceptions. Refused recipients and 5xx
+    answers to the message itself are the message's fault; the relay that
+    gave them is healthy.
+    """
+    if isinstance(error, (smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected,
+                          smtplib.SMTPAuthenticationError, ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, 'smtp_code', None) or getattr(error, 'code', None)
+    if isinstance(code, int):
+        # 4xx is throttling or a relay-side fault; 530/534/535 are rejected logins
+        return 400 <= code < 500 or code in (530, 534, 535)
+    if getattr(error, 'recipients', None) or isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
+
+
+class NoRelayAvailable(smtplib.SMTPConnectError):
+    """Every relay's circuit is open"""
+
+    def __init__(self):
+        super().__init__(421, 'No SMTP relay available (all circuits open)')
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe -> closed"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def available(self, now):
+        """Whether a send may be routed here (does not change state)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now - self.opened_at >= self.reset_timeout
+        return not self.probing
+
+    def acquire(self):
+        """Route a send here; the first send after the timeout becomes the probe
+
+        Returns the new state when it changed, else None.
+        """
+        changed = None
+        if self.state == self.OPEN:
+            self.state = changed = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self.probing = True
+        return changed
+
+    def record_success(self):
+        """Returns the new state when it changed, else None"""
+        self.failures = 0
+        self.probing = False
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            return self.state
+        return None
+
+    def record_failure(self, now):
+        """Returns the new state when it changed, else None"""
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = now
+            return self.state
+        return None
+
+
+class Relay:
+    """One relay: its session pool, breaker and load figures"""
+
+    def __init__(self, host, port, weight, pool, breaker):
+        self.name = f"{host}:{port}"
+        self.weight = weight
+        self.pool = pool
+        self.breaker = breaker
+        self.in_flight = 0
+        self.latency = None  # smoothed seconds per successful send
+
+    def load(self):
+        # Counting the send being placed lets weight decide between idle relays
+        return ((self.in_flight + 1) / self.weight, self.latency or 0.0)
+
+
+class RelayPool:
+    """Sends through the best available relay, failing over between them
+
+    `pool_factory(relay_config)` builds the per-relay session pool; it
+    receives EMAIL_CONFIG with host and port replaced.
+    """
+
+    def __init__(self, config, pool_factory=SMTPConnectionPool):
+        self.config = config
+        relays = config.get('relays') or parse_relays('', config['host'], config['port'])
+        self.relays = [
+            Relay(relay['host'], relay['port'], relay['weight'],
+                  pool_factory({**config, 'host': relay['host'], 'port': relay['port']}),
+                  CircuitBreaker(config.get('relay_failure_threshold', 5), config.get('relay_reset_timeout', 30.0)))
+            for relay in relays
+        ]
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def send_message(self, msg, from_addr=None, to_addrs=None):
+        return self.send_messages([(msg, from_addr, to_addrs)])[0]
+
+    def send_messages(self, envelopes):
+        """Send envelopes over one relay, moving the whole batch on a relay failure
+
+        A batch that fails part-way is sent again in full on the next relay,
+        so delivery is at least once (as with the mail queue's retries).
+        """
+        tried = set()
+        last_error = None
+        while True:
+            relay = self._acquire(tried)
+            if relay is None:
+                raise last_error if last_error is not None else NoRelayAvailable()
+            started = time.perf_counter()
+            try:
+                results = relay.pool.send_messages(envelopes)
+            except Exception as e:
+                if not self._failed(relay, e):
+                    raise
+                last_error = e
+                continue
+            self._succeeded(relay, started)
+            return results
+
+    def close_all(self):
+        for relay in self.relays:
+            relay.pool.close_all()
+
+    def status(self):
+        """This worker's view of every relay"""
+        with self._lock:
+            return [{
+                'relay': relay.name,
+                'weight': relay.weight,
+                'state': relay.breaker.state,
+                'in_flight': relay.in_flight,
+                'latency_ms': round(relay.latency * 1000, 1) if relay.latency is not None else None
+            } for relay in self.relays]
+
+    def _acquire(self, exclude):
+        """Pick a relay not in `exclude` and count the send as in flight; None when none is usable"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [r for r in self.relays if r not in exclude and r.breaker.available(now)]
+            if not candidates:
+                return None
+            # Power of two choices: weighted draw, keep the less loaded of the pair
+            first = self._random.choices(candidates, weights=[r.weight for r in candidates])[0]
+            others = [r for r in candidates if r is not first]
+            relay = first
+            if others:
+                second = self._random.choices(others, weights=[r.weight for r in others])[0]
+                relay = min((first, second), key=Relay.load)
+            changed = relay.breaker.acquire()
+            relay.in_flight += 1
+            exclude.add(relay)
+        self._transitioned(relay, changed)
+        return relay
+
+    def _succeeded(self, relay, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            relay.in_flight -= 1
+            relay.latency = elapsed if relay.latency is None else (
+                relay.latency + LATENCY_SMOOTHING * (elapsed - relay.latency))
+            changed = relay.breaker.record_success()
+        metrics.inc('sysdak_relay_sends_total', relay=relay.name, result='sent')
+        self._transitioned(relay, changed)
+
+    def _failed(self, relay, error):
+        """Record a failed send; True when another relay should be tried"""
+        relay_failure = is_relay_failure(error)
+        with self._lock:
+            relay.in_flight -= 1
+            if relay_failure:
+                changed = relay.breaker.record_failure(time.monotonic())
+            else:
+                # The relay answered; only the message was refused
+                changed = relay.breaker.record_success()
+        metrics.inc('sysdak_relay_sends_total', relay=relay.name,
+                    result='relay_error' if relay_failure else 'message_error')
+        self._transitioned(relay, changed)
+        if relay_failure:
+            logger.warning(f"SMTP relay {relay.name} failed: {str(error) or error.__class__.__name__}")
+        return relay_failure
+
+    def _transitioned(self, relay, state):
+        if state is None:
+            return
+        metrics.inc('sysdak_relay_circuit_transitions_total', relay=relay.name, state=state)
+        if state == CircuitBreaker.OPEN:
+            logger.warning(f"Circuit opened for SMTP relay {relay.name}; "
+                           f"probing again in {relay.breaker.reset_timeout:g}s")
+        elif state == CircuitBreaker.HALF_OPEN:
+            logger.info(f"Probing SMTP relay {relay.name} (circuit half-open)")
+        else:
+            logger.info(f"Circuit closed for SMTP relay {relay.name}")
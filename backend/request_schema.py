@@ -0,0 +1,112 @@
+"""
+Schema-checked parsing of flat JSON request bodies
+
+The public form endpoints accept one JSON object of string fields. Instead
+of decoding the whole body into Python objects and validating afterwards,
+ObjectSchema.parse walks the body token by token and stops at the first
+problem: an unknown field name is rejected before its value is looked at, a
+value that does not start as a string (a nested object, an array, a number)
+is rejected without being parsed, and an over-long string is refused as
+soon as it is read. Strings are read by the json module's own C string
+scanner, so a valid body costs about what json.loads does, while bot
+payloads built from extra fields or deep nesting (which can make json.loads
+hit the recursion limit) are dropped after a few steps.
+
+Only JSON that json.loads would also accept is let through, and accepted
+values are identical to what it would return. Duplicate field names are
+refused rather than silently resolved to the last one.
+"""
+
+import re
+from json.decoder import scanstring
+
+# JSON whitespace
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+WHITESPACE_CHARS = frozenset(' \t\n\r')
+
+# Longest unknown field name echoed back in an error
+MAX_REPORTED_NAME = 64
+
+
+class SchemaError(ValueError):
+    """The body is not JSON matching the schema; the message is safe to return"""
+
+
+class ObjectSchema:
+    """A JSON object whose members are strings with length limits
+
+    `fields` maps each accepted name to (max_length, label); the label is
+    used in error messages, matching validate_contact_form's wording.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def parse(self, body):
+        """Decode a request body (bytes or str) into a dict, or raise SchemaError"""
+        try:
+            text = body.decode('utf-8') if isinstance(body, bytes) else body
+            return self._parse(text)
+        except SchemaError:
+            raise
+        except (ValueError, IndexError):
+            # Malformed UTF-8 or JSON, or the body ended part-way
+            raise SchemaError('Invalid request body')
+
+    def _parse(self, text):
+        # Browsers send no whitespace, so it is only skipped where present
+        pos = WHITESPACE.match(text).end()
+        if text[pos] != '{':
+            raise SchemaError('Invalid request body')
+        pos += 1
+        if text[pos] in WHITESPACE_CHARS:
+            pos = WHITESPACE.match(text, pos).end()
+
+        result = {}
+        if text[pos] == '}':
+            return self._finish(text, pos + 1, result)
+
+        while True:
+            if text[pos] != '"':
+                raise SchemaError('Invalid request body')
+            name, pos = scanstring(text, pos + 1)
+            field = self.fields.get(name)
+            if field is None:
+                if len(name) > MAX_REPORTED_NAME:
+                    raise SchemaError('Unknown field')
+                raise SchemaError(f'Unknown field: {name}')
+            if name in result:
+                raise SchemaError(f'Duplicate field: {name}')
+
+            if text[pos] in WHITESPACE_CHARS:
+                pos = WHITESPACE.match(text, pos).end()
+            if text[pos] != ':':
+                raise SchemaError('Invalid request body')
+            pos += 1
+            if text[pos] in WHITESPACE_CHARS:
+                pos = WHITESPACE.match(text, pos).end()
+
+            if text[pos] != '"':
+                raise SchemaError(f'{name} must be a string')
+            max_length, label = field
+            value, pos = scanstring(text, pos + 1)
+            if len(value) > max_length:
+                raise SchemaError(f'{label} too long (max {max_length} characters)')
+            result[name] = value
+
+            if text[pos] in WHITESPACE_CHARS:
+                pos = WHITESPACE.match(text, pos).end()
+            if text[pos] == ',':
+                pos += 1
+                if text[pos] in WHITESPACE_CHARS:
+                    pos = WHITESPACE.match(text, pos).end()
+            elif text[pos] == '}':
+                return self._finish(text, pos + 1, result)
+            else:
+                raise SchemaError('Invalid request body')
+
+    @staticmethod
+    def _finish(text, pos, result):
+        if WHITESPACE.match(text, pos).end() != len(text):
+            raise SchemaError('Invalid request body')
+        return result
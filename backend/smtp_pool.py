@@ -0,0 +1,194 @@
+"""
+Pooled, persistent SMTP connections
+
+Each worker keeps a small set of authenticated SMTP sessions alive so a send
+costs one MAIL/RCPT/DATA exchange instead of a TCP connect, STARTTLS and
+AUTH. Sessions are checked with NOOP before reuse, replaced transparently
+when the relay drops them or answers 421, and retired once idle for longer
+than the configured TTL.
+"""
+
+import logging
+import os
+import smtplib
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the session is gone and the send can be retried on a new one
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class SMTPConnectionPool:
+    """Per-process pool of authenticated SMTP sessions for one relay"""
+
+    def __init__(self, config):
+        self.config = config
+        self.max_size = config.get('pool_size', 2)
+        self.idle_ttl = config.get('pool_idle_ttl', 60)
+        self.timeout = config.get('timeout', 30)
+        # A relay that is down should not hold a worker for the full I/O timeout
+        self.connect_timeout = config.get('connect_timeout', self.timeout)
+        self._idle = []  # (session, last_used) pairs, most recent last
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._reaper = None
+
+    def send_message(self, msg, from_addr=None, to_addrs=None):
+        """Send a message, reconnecting once if the pooled session went stale"""
+        return self.send_messages([(msg, from_addr, to_addrs)])[0]
+
+    def send_messages(self, envelopes):
+        """Send (msg, from_addr, to_addrs) envelopes over a single session
+
+        `msg` is either an email.message.Message or a raw message as bytes.
+        Returns the refused-recipients dict of each envelope. A stale session
+        is replaced once per envelope; any other error aborts the batch, and
+        the session is returned to the pool only if it is still usable.
+        """
+        if not envelopes:
+            return []
+
+        results = []
+        server = self._acquire()
+        for msg, from_addr, to_addrs in envelopes:
+            for attempt in (1, 2):
+                try:
+                    with metrics.timed('smtp_send'):
+                        if isinstance(msg, bytes):
+                            refused = server.sendmail(from_addr, to_addrs, msg)
+                        else:
+                            refused = server.send_message(msg, from_addr, to_addrs)
+                except DISCONNECT_ERRORS:
+                    self._discard(server)
+                    if attempt == 2:
+                        raise
+                    logger.info("SMTP session dropped, reconnecting")
+                except smtplib.SMTPResponseException as e:
+                    if e.smtp_code != 421:
+                        self._reset(server)
+                        raise
+                    self._discard(server)
+                    if attempt == 2:
+                        raise
+                    logger.info("SMTP relay answered 421, reconnecting")
+                except smtplib.SMTPException:
+                    self._reset(server)
+                    raise
+                except BaseException:
+                    # TLS errors, other socket errors, interrupts: the session's
+                    # state is unknown, so it is closed rather than pooled
+                    self._discard(server)
+                    raise
+                else:
+                    results.append(refused)
+                    break
+                server = self._acquire()
+
+        self._release(server)
+        return results
+
+    def close_all(self):
+        """Quit every idle session owned by this process"""
+        with self._lock:
+            self._check_fork()
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._quit(server)
+
+    def _connect(self):
+        server = smtplib.SMTP(timeout=self.connect_timeout)
+        with metrics.timed('smtp_connect'):
+            server.connect(self.config['host'], self.config['port'])
+        server.timeout = self.timeout
+        server.sock.settimeout(self.timeout)
+        try:
+            if self.config['use_tls']:
+                with metrics.timed('smtp_tls'):
+                    server.starttls()
+            with metrics.timed('smtp_auth'):
+                server.login(self.config['username'], self.config['password'])
+        except Exception:
+            self._quit(server)
+            raise
+        return server
+
+    def _acquire(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                self._check_fork()
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+
+            if now - last_used > self.idle_ttl:
+                self._quit(server)
+                continue
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(server)
+
+        self._start_reaper()
+        return self._connect()
+
+    def _release(self, server):
+        with self._lock:
+            self._check_fork()
+            if len(self._idle) < self.max_size:
+                self._idle.append((server, time.monotonic()))
+                return
+        self._quit(server)
+
+    def _reset(self, server):
+        """Clear a failed transaction so the session can be reused"""
+        try:
+            server.rset()
+        except (smtplib.SMTPException, OSError):
+            self._discard(server)
+        else:
+            self._release(server)
+
+    def _discard(self, server):
+        try:
+            server.close()
+        except OSError:
+            pass
+
+    def _quit(self, server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._discard(server)
+
+    def _check_fork(self):
+        # Sessions inherited from a parent process belong to the parent
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._reaper = None
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, name='smtp-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(self.idle_ttl / 2, 1))
+            cutoff = time.monotonic() - self.idle_ttl
+            with self._lock:
+                if self._pid != os.getpid():
+                    return
+                expired = [entry for entry in self._idle if entry[1] < cutoff]
+                self._idle = [entry for entry in self._idle if entry[1] >= cutoff]
+            for server, _ in expired:
+                self._quit(server)
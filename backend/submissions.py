@@ -0,0 +1,275 @@
+"""
+Searchable store of contact form submissions
+
+Every accepted submission is kept in a SQLite table (DATA_DIR/submissions.db)
+indexed by time, sender domain and subject, so reports no longer have to be
+assembled from mailboxes. The request handler only appends the record to an
+in-memory buffer; a writer thread in each worker commits whatever has
+accumulated in a single transaction every SUBMISSIONS_FLUSH_INTERVAL seconds
+(sooner once SUBMISSIONS_BATCH_SIZE records are waiting). A hard crash can
+lose the records of the last interval; the emails themselves are already in
+the durable mail queue.
+
+Exports walk the table in (created_at, id) order with a keyset cursor, one
+page of SUBMISSIONS_PAGE_SIZE rows at a time, and yield NDJSON or CSV lines
+as they go, so memory use does not grow with the size of the export.
+created_at is therefore the time a record was committed, not received:
+commits from different workers are serialized by the write lock, and each
+takes a time no earlier than any row already in the table, so a row never
+appears behind a cursor that an export has already passed.
+"""
+
+import atexit
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+import json_codec
+from db import connect, get_connection
+
+logger = logging.getLogger(__name__)
+
+SUBMISSIONS_FLUSH_INTERVAL = float(os.getenv('SUBMISSIONS_FLUSH_INTERVAL', '0.2'))
+SUBMISSIONS_BATCH_SIZE = int(os.getenv('SUBMISSIONS_BATCH_SIZE', '200'))
+SUBMISSIONS_PAGE_SIZE = int(os.getenv('SUBMISSIONS_PAGE_SIZE', '500'))
+
+# Subjects compare case-insensitively so the index also serves prefix searches
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    submission_id TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    email_domain TEXT NOT NULL,
+    subject TEXT NOT NULL COLLATE NOCASE,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_created ON submissions (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_submissions_domain ON submissions (email_domain, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_submissions_subject ON submissions (subject, created_at, id);
+"""
+
+INSERT_SQL = """
+INSERT OR IGNORE INTO submissions (submission_id, created_at, name, email, email_domain, subject, message)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+EXPORT_FIELDS = ('id', 'submission_id', 'created_at', 'name', 'email', 'subject', 'message')
+
+# Sorts after every other character, closing a subject prefix range
+PREFIX_END = '\U0010ffff'
+
+# Leading characters that make spreadsheets evaluate a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def encode_cursor(created_at, row_id):
+    return f"{created_at!r}:{row_id}"
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of the last exported row; ValueError when malformed"""
+    created_at, _, row_id = cursor.partition(':')
+    return float(created_at), int(row_id)
+
+
+class SubmissionQuery:
+    """Filters and position of one export
+
+    `since`/`until` are epoch seconds (until is exclusive), `domain` matches
+    the sender's domain exactly and `subject` is a case-insensitive prefix.
+    """
+
+    def __init__(self, since=None, until=None, domain=None, subject=None, after=None):
+        self.since = since
+        self.until = until
+        self.domain = domain.lower() if domain else None
+        self.subject = subject or None
+        self.after = after
+
+    def where(self, after=None):
+        clauses, params = [], []
+        if self.since is not None:
+            clauses.append('created_at >= ?')
+            params.append(self.since)
+        if self.until is not None:
+            clauses.append('created_at < ?')
+            params.append(self.until)
+        if self.domain is not None:
+            clauses.append('email_domain = ?')
+            params.append(self.domain)
+        if self.subject is not None:
+            clauses.append('subject >= ? AND subject < ?')
+            params.extend((self.subject, self.subject + PREFIX_END))
+        after = after or self.after
+        if after is not None:
+            clauses.append('(created_at, id) > (?, ?)')
+            params.extend(after)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+class SubmissionStore:
+    """Buffered writer and streaming reader for the submissions table"""
+
+    def __init__(self, path, flush_interval=SUBMISSIONS_FLUSH_INTERVAL, batch_size=SUBMISSIONS_BATCH_SIZE,
+                 page_size=SUBMISSIONS_PAGE_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        with closing(connect(self.path)) as conn:
+            conn.executescript(SCHEMA)
+        atexit.register(self._flush_at_exit)
+
+    def add(self, submission_id, data):
+        """Queue a submission for the next group commit (never touches disk)"""
+        email = data['email']
+        record = (submission_id, data['name'], email, email.rpartition('@')[2].lower(),
+                  data['subject'], data['message'])
+        with self._lock:
+            self._pending.append(record)
+            full = len(self._pending) >= self.batch_size
+        self._start()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Commit every buffered submission in one transaction; returns how many"""
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Records buffered before a fork were the parent's to write
+                    self._pending = []
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            conn = get_connection(self.path)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Stamped under the write lock so created_at follows id order
+                    latest = conn.execute('SELECT MAX(created_at) FROM submissions').fetchone()[0]
+                    created_at = max(time.time(), latest or 0)
+                    conn.executemany(INSERT_SQL, [(record[0], created_at) + record[1:] for record in batch])
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+            except Exception:
+                # Keep the records for the next attempt
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+            return len(batch)
+
+    def _start(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+            self._thread.start()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Writing submissions at exit failed: {str(e)}")
+
+    def _run(self):
+        pid = os.getpid()
+        while os.getpid() == pid:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Writing submissions failed: {str(e)}")
+
+    def page_bounds(self, query, limit):
+        """Last row of a page of `limit` rows and whether more rows follow it
+
+        Returns (last, has_more) where `last` is the (created_at, id) of the
+        page's final row, or None when the page is empty.
+        """
+        conn = get_connection(self.path)
+        where, params = query.where()
+        last = conn.execute(
+            f'SELECT created_at, id FROM (SELECT created_at, id FROM submissions{where} '
+            f'ORDER BY created_at, id LIMIT ?) ORDER BY created_at DESC, id DESC LIMIT 1',
+            params + [limit]
+        ).fetchone()
+        if last is None:
+            return None, False
+        where, params = query.where(after=tuple(last))
+        more = conn.execute(f'SELECT 1 FROM submissions{where} LIMIT 1', params).fetchone() is not None
+        return tuple(last), more
+
+    def iter_rows(self, query, until_key=None):
+        """Yield matching rows in (created_at, id) order, up to and including `until_key`
+
+        Each page is fetched in full before yielding, so no read transaction
+        stays open while the client consumes the stream.
+        """
+        conn = get_connection(self.path)
+        after = query.after
+        while True:
+            where, params = query.where(after=after)
+            if until_key is not None:
+                where += (' AND ' if where else ' WHERE ') + '(created_at, id) <= (?, ?)'
+                params = params + list(until_key)
+            rows = conn.execute(
+                f"SELECT {', '.join(EXPORT_FIELDS)} FROM submissions{where} ORDER BY created_at, id LIMIT ?",
+                params + [self.page_size]
+            ).fetchall()
+            yield from rows
+            if len(rows) < self.page_size:
+                return
+            after = (rows[-1]['created_at'], rows[-1]['id'])
+
+
+def _export_record(row):
+    record = dict(row)
+    record['created_at'] = datetime.fromtimestamp(row['created_at'], timezone.utc).isoformat()
+    return record
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json_codec.dumps(_export_record(row)) + '\n'
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(EXPORT_FIELDS)
+    for row in rows:
+        record = _export_record(row)
+        yield line(_csv_cell(record[field]) for field in EXPORT_FIELDS)
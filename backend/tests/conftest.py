@@ -0,0 +1,15 @@
+"""
+Shared setup for the backend tests
+
+Install requirements-dev.txt, then run from the backend directory:
+python -m pytest -q
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules read DATA_DIR on import; keep metric snapshots out of backend/data
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='sysdak-tests-'))
@@ -0,0 +1,51 @@
+"""
+Content filter: substring and regex scans report the same matches
+"""
+
+import random
+
+import pytest
+
+from content_filter import INJECTION_PATTERNS, SUBSTRING_SCAN_MAX_PATTERNS, ContentFilter, Match
+
+PATTERNS = {'injection': INJECTION_PATTERNS, 'spam': ['free', 'free money', 'crypto'], 'phishing': ['on']}
+
+
+def both_scans(patterns):
+    substring, regex = ContentFilter(patterns), ContentFilter(patterns)
+    substring._substring_scan, regex._substring_scan = True, False
+    return substring, regex
+
+
+def test_small_blocklists_use_substring_checks():
+    assert ContentFilter(PATTERNS)._substring_scan
+    assert not ContentFilter({'spam': [f'pattern{i}' for i in range(SUBSTRING_SCAN_MAX_PATTERNS + 1)]})._substring_scan
+
+
+def test_reports_every_overlapping_match_by_offset():
+    substring, _ = both_scans(PATTERNS)
+    assert substring.scan('FREE MONEY onload=x') == [
+        Match('free money', 'spam', 0),
+        Match('free', 'spam', 0),
+        Match('on', 'phishing', 6),
+        Match('onload=', 'injection', 11),
+        Match('on', 'phishing', 11),
+    ]
+
+
+@pytest.mark.parametrize('text', [
+    '', 'nothing to see', '<SCRIPT>alert(1)</script>', 'free free money', 'ononon',
+    'İstanbul javascript:', 'crypto' * 50
+])
+def test_scans_agree(text):
+    substring, regex = both_scans(PATTERNS)
+    assert substring.scan(text) == regex.scan(text)
+
+
+def test_scans_agree_on_random_text():
+    substring, regex = both_scans(PATTERNS)
+    rng = random.Random(11)
+    alphabet = 'freemonycptjavsil:=<> '
+    for _ in range(2000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert substring.scan(text) == regex.scan(text), text
@@ -0,0 +1,164 @@
+"""
+Idempotency index: claiming, storing and releasing submission keys
+"""
+
+import os
+import time
+
+import pytest
+
+from idempotency import MAX_KEY_LENGTH, IdempotencyIndex, submission_key
+
+
+@pytest.fixture
+def index(tmp_path):
+    return IdempotencyIndex(str(tmp_path / 'idempotency.db'), ttl=600, wait_timeout=0.1)
+
+
+def test_first_claim_owns_the_key(index):
+    assert index.claim('k') is None
+
+
+def test_stored_response_is_returned_to_repeats(index):
+    index.claim('k')
+    index.store('k', 200, '{"success":true}')
+    assert index.claim('k') == (200, '{"success":true}')
+
+
+def test_repeat_while_in_progress_waits_then_reports_in_progress(index):
+    index.claim('k')
+    started = time.monotonic()
+    assert index.claim('k') == (None, None)
+    assert time.monotonic() - started >= index.wait_timeout
+
+
+def test_released_key_can_be_claimed_again(index):
+    index.claim('k')
+    index.release('k')
+    assert index.claim('k') is None
+
+
+def test_release_keeps_a_stored_response(index):
+    index.claim('k')
+    index.store('k', 200, '{}')
+    index.release('k')
+    assert index.claim('k') == (200, '{}')
+
+
+def test_expired_response_is_forgotten(tmp_path):
+    index = IdempotencyIndex(str(tmp_path / 'idempotency.db'), ttl=0)
+    index.claim('k')
+    index.store('k', 200, '{}')
+    assert index.claim('k') is None
+
+
+def test_prune_keeps_the_newest_keys(tmp_path):
+    index = IdempotencyIndex(str(tmp_path / 'idempotency.db'), max_keys=2)
+    for key in ('a', 'b', 'c'):
+        index.claim(key)
+        index.store(key, 200, key)
+        time.sleep(0.01)
+    index.prune()
+    assert index.claim('a') is None
+    assert index.claim('c') == (200, 'c')
+
+
+def test_header_key_wins_over_content():
+    assert submission_key('abc', ('a@example.com', 'Hi', 'Hello')) == submission_key('abc', ('x', 'y', 'z'))
+    assert submission_key('abc', ()) != submission_key('abd', ())
+
+
+def test_content_key_ignores_case_and_whitespace():
+    assert (submission_key(None, ('A@Example.com', 'Hi  there', 'Hello\n'))
+            == submission_key(None, ('a@example.com', ' hi there', 'hello')))
+    assert submission_key(None, ('a@example.com', 'Hi', 'Hello')) != submission_key(None, ('a@example.com', 'Hi', 'Bye'))
+
+
+def test_overlong_header_is_refused():
+    assert submission_key('x' * (MAX_KEY_LENGTH + 1), ()) is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # app reads its configuration on import
+    for name, value in {'EMAIL_USERNAME': 'user', 'EMAIL_PASSWORD': 'secret', 'EMAIL_FROM': 'site@example.com',
+                        'EMAIL_TO': 'admin@example.com', 'RATELIMIT_ENABLED': 'false',
+                        'ADMISSION_ENABLED': 'false', 'LOG_STDERR': 'false',
+                        'LOG_FILE': os.path.join(os.environ['DATA_DIR'], 'app.log')}.items():
+        monkeypatch.setenv(name, value)
+    import app
+    monkeypatch.setattr(app.mail_queue, 'on_enqueue', lambda: None)
+    return app.create_app().test_client()
+
+
+def test_only_successful_submissions_are_replayed(client):
+    form = {'name': ' ', 'email': 'jane@example.com', 'subject': 'Quote', 'message': f'Hello {time.time()}'}
+    assert client.post('/api/contact', json=form).status_code == 400
+
+    # Same content key, name corrected: handled afresh, not answered with the old 400
+    accepted = client.post('/api/contact', json={**form, 'name': 'Jane'})
+    assert accepted.status_code == 202
+    assert 'Idempotent-Replayed' not in accepted.headers
+
+    repeated = client.post('/api/contact', json={**form, 'name': 'Jane'})
+    assert repeated.headers['Idempotent-Replayed'] == 'true'
+    assert repeated.get_json() == accepted.get_json()
+
+
+def test_store_failure_after_queueing_does_not_resend_mail(client, monkeypatch):
+    import app
+
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(app.submission_store, 'add', fail)
+
+    form = {'name': 'Jane', 'email': 'jane@example.com', 'subject': 'Quote', 'message': f'Hello {time.time()}'}
+    headers = {'Idempotency-Key': f'retry-{time.time()}'}
+    accepted = client.post('/api/contact', json=form, headers=headers)
+    assert accepted.status_code == 202
+    queued = app.mail_queue.depth()
+
+    retried = client.post('/api/contact', json=form, headers=headers)
+    assert retried.headers['Idempotent-Replayed'] == 'true'
+    assert retried.get_json()['submission_id'] == accepted.get_json()['submission_id']
+    assert app.mail_queue.depth() == queued
+
+
+
+def test_wait_is_bounded_when_the_key_keeps_changing_hands(index, monkeypatch):
+    class Rows:
+        rowcount = 0
+
+        def fetchone(self):
+            return None
+
+    class Connection:
+        # Another request always claims the key first, then releases it again
+        def execute(self, sql, params):
+            return Rows()
+
+    monkeypatch.setattr('idempotency.get_connection', lambda path: Connection())
+    started = time.monotonic()
+    assert index.claim('k') == (None, None)
+    assert time.monotonic() - started < index.wait_timeout + 0.1
+
+
+def test_accepted_submission_is_replayed_while_shedding(client, monkeypatch):
+    import app
+
+    form = {'name': 'Jane', 'email': 'jane@example.com', 'subject': 'Quote', 'message': f'Hello {time.time()}'}
+    accepted = client.post('/api/contact', json=form)
+    assert accepted.status_code == 202
+
+    monkeypatch.setattr(app.admission, 'retry_after', lambda: 30)
+    repeated = client.post('/api/contact', json=form)
+    assert repeated.status_code == 202
+    assert repeated.headers['Idempotent-Replayed'] == 'true'
+
+    shed = client.post('/api/contact', json={**form, 'message': 'Something new'})
+    assert shed.status_code == 503
+    assert shed.headers['Retry-After'] == '30'
+
+    # The shed request did not keep its key: it is handled once the backlog drains
+    monkeypatch.setattr(app.admission, 'retry_after', lambda: None)
+    assert client.post('/api/contact', json={**form, 'message': 'Something new'}).status_code == 202
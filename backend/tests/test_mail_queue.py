@@ -0,0 +1,274 @@
+"""
+Mail queue: failure classification, retry scheduling, dead letters, replay
+and digests
+"""
+
+import smtplib
+import socket
+import time
+
+import pytest
+
+import json_codec
+from db import get_connection
+from mail_queue import MailQueue, is_transient
+
+MESSAGE = {'kind': 'admin', 'to_emails': ['admin@example.com'], 'subject': 'Hello', 'text_content': 'Hi'}
+
+
+def make_queue(tmp_path, **options):
+    queue = MailQueue(str(tmp_path / 'mail_queue.db'), sender=None, **options)
+    # No dispatcher thread: the tests claim and record results themselves
+    queue.on_enqueue = lambda: None
+    return queue
+
+
+def mail_row(queue, message_id):
+    return get_connection(queue.path).execute('SELECT * FROM outbound_mail WHERE id = ?', (message_id,)).fetchone()
+
+
+def make_due(queue):
+    get_connection(queue.path).execute("UPDATE outbound_mail SET next_attempt_at = 0 WHERE status = 'pending'")
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return make_queue(tmp_path, max_attempts=3, retry_base_delay=10, retry_max_delay=60)
+
+
+@pytest.mark.parametrize('error', [
+    smtplib.SMTPResponseException(421, b'Service not available'),
+    smtplib.SMTPDataError(451, b'Try again later'),
+    smtplib.SMTPRecipientsRefused({'a@example.com': (450, b'Mailbox busy'), 'b@example.com': (452, b'Full')}),
+    smtplib.SMTPServerDisconnected('Connection unexpectedly closed'),
+    ConnectionRefusedError(111, 'Connection refused'),
+    socket.timeout('timed out'),
+    TimeoutError()
+])
+def test_transient_errors(error):
+    assert is_transient(error)
+
+
+@pytest.mark.parametrize('error', [
+    smtplib.SMTPResponseException(550, b'No such user'),
+    smtplib.SMTPRecipientsRefused({'a@example.com': (450, b'Mailbox busy'), 'b@example.com': (550, b'No such user')}),
+    smtplib.SMTPNotSupportedError('SMTP AUTH extension not supported by server.'),
+    smtplib.SMTPAuthenticationError(535, b'Authentication failed'),
+    ValueError('bad payload'),
+    KeyError('to_emails'),
+    'relay said no'
+])
+def test_permanent_errors(error):
+    assert not is_transient(error)
+
+
+def test_retry_delay_backs_off_with_jitter_up_to_the_cap(queue):
+    for attempt, full in ((1, 10), (2, 20), (3, 40), (4, 60), (10, 60)):
+        delays = [queue.retry_delay(attempt) for _ in range(50)]
+        assert all(full / 2 <= delay <= full for delay in delays)
+
+
+def test_claim_marks_rows_sending_and_counts_the_attempt(queue):
+    queue.enqueue('s1', [MESSAGE])
+    rows = queue.claim(10)
+    assert [row['attempts'] for row in rows] == [0]
+    assert queue.claim(10) == []
+
+    row = mail_row(queue, rows[0]['id'])
+    assert (row['status'], row['attempts']) == ('sending', 1)
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0)
+    queue.enqueue('s1', [MESSAGE])
+    first, = queue.claim(10)
+    time.sleep(0.01)
+    second, = queue.claim(10)
+    assert second['id'] == first['id']
+    assert second['attempts'] == 1
+
+
+def test_result_from_an_expired_lease_is_ignored(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0)
+    queue.enqueue('s1', [MESSAGE])
+    first, = queue.claim(10)
+    time.sleep(0.01)
+    second, = queue.claim(10)
+
+    queue.record_result(second, None, 1.0)
+    queue.record_result(first, ValueError('bad payload'), 1.0)
+    stored = mail_row(queue, second['id'])
+    assert (stored['status'], stored['last_error']) == ('sent', None)
+    assert queue.dead_letters() == []
+
+    assert not queue.mark_retry(first['id'], first['claim_token'], 'late', 10)
+    assert mail_row(queue, first['id'])['status'] == 'sent'
+
+
+def test_transient_failure_is_rescheduled(queue):
+    queue.enqueue('s1', [MESSAGE])
+    row, = queue.claim(10)
+    before = time.time()
+    queue.record_result(row, smtplib.SMTPResponseException(451, b'Try again later'), 12.5)
+
+    stored = mail_row(queue, row['id'])
+    assert stored['status'] == 'pending'
+    assert '451' in stored['last_error']
+    assert before + 5 <= stored['next_attempt_at'] <= time.time() + 10
+    assert queue.dead_letters() == []
+
+    # Not due yet, then claimed again once the backoff has passed
+    assert queue.claim(10) == []
+    make_due(queue)
+    retried, = queue.claim(10)
+    assert retried['attempts'] == 1
+
+
+def test_permanent_failure_goes_to_dead_letters(queue):
+    queue.enqueue('s1', [MESSAGE])
+    row, = queue.claim(10)
+    queue.record_result(row, ValueError('bad payload'), 3.0)
+
+    assert mail_row(queue, row['id'])['status'] == 'failed'
+    letter, = queue.dead_letters()
+    assert letter['mail_id'] == row['id']
+    assert letter['submission_id'] == 's1'
+    assert letter['attempts'] == 1
+    assert letter['error'] == 'bad payload'
+    assert letter['to_emails'] == ['admin@example.com']
+    assert queue.status('s1')['status'] == 'failed'
+
+
+def test_running_out_of_attempts_goes_to_dead_letters(queue):
+    queue.enqueue('s1', [MESSAGE])
+    for attempt in range(1, queue.max_attempts + 1):
+        make_due(queue)
+        row, = queue.claim(10)
+        queue.record_result(row, smtplib.SMTPServerDisconnected('dropped'), 1.0)
+        expected = 'failed' if attempt == queue.max_attempts else 'pending'
+        assert mail_row(queue, row['id'])['status'] == expected
+
+    letter, = queue.dead_letters()
+    assert letter['attempts'] == queue.max_attempts
+
+
+def test_success_after_retry_clears_the_error(queue):
+    queue.enqueue('s1', [MESSAGE])
+    row, = queue.claim(10)
+    queue.record_result(row, TimeoutError('timed out'), 1.0)
+    make_due(queue)
+    row, = queue.claim(10)
+    queue.record_result(row, None, 2.0)
+
+    stored = mail_row(queue, row['id'])
+    assert (stored['status'], stored['attempts'], stored['last_error']) == ('sent', 2, None)
+    assert queue.status('s1')['status'] == 'sent'
+
+
+def test_replay_requeues_dead_letters_once(queue):
+    queue.enqueue('s1', [MESSAGE, {**MESSAGE, 'kind': 'auto_reply'}])
+    for row in queue.claim(10):
+        queue.record_result(row, smtplib.SMTPResponseException(550, b'Rejected'), 1.0)
+    letters = queue.dead_letters()
+    assert len(letters) == 2
+
+    assert queue.replay([letters[0]['id']]) == 1
+    assert queue.replay([letters[0]['id']]) == 0
+    remaining, = queue.dead_letters()
+    assert remaining['id'] == letters[1]['id']
+    assert len(queue.dead_letters(include_replayed=True)) == 2
+
+    row, = queue.claim(10)
+    assert row['id'] == letters[0]['mail_id']
+    assert row['attempts'] == 0  # a replay starts with a fresh attempt budget
+
+
+def test_replay_defaults_to_every_unreplayed_letter(queue):
+    queue.enqueue('s1', [MESSAGE, MESSAGE])
+    for row in queue.claim(10):
+        queue.record_result(row, ValueError('bad payload'), 1.0)
+
+    assert queue.replay([]) == 0
+    assert queue.replay() == 2
+    assert queue.dead_letters() == []
+    assert len(queue.claim(10)) == 2
+
+
+def digest_queue(tmp_path, builder=None, **options):
+    def build(payloads):
+        return {'to_emails': ['admin@example.com'], 'subject': f'{len(payloads)} submissions',
+                'submissions': [payload['submission'] for payload in payloads]}
+    return make_queue(tmp_path, digest_builder=builder or build, **options)
+
+
+def held(name):
+    return {'kind': 'admin', 'held': True, 'submission': {'name': name}}
+
+
+def test_held_messages_wait_for_a_full_digest(tmp_path):
+    queue = digest_queue(tmp_path, digest_max_items=3, digest_interval=300)
+    queue.enqueue('s1', [held('a'), MESSAGE])
+    queue.enqueue('s2', [held('b')])
+
+    row, = queue.claim(10)
+    assert row['kind'] == 'admin' and row['submission_id'] == 's1'
+    assert queue.status('s2')['status'] == 'pending'
+
+    queue.enqueue('s3', [held('c')])
+    digest, = queue.claim(10)
+    assert digest['kind'] == 'digest'
+    assert json_codec.loads(digest['payload'])['submissions'] == [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]
+
+    queue.record_result(digest, None, 5.0)
+    for submission_id in ('s2', 's3'):
+        assert queue.status(submission_id)['status'] == 'sent'
+
+
+def test_oldest_held_message_flushes_a_partial_digest(tmp_path):
+    queue = digest_queue(tmp_path, digest_max_items=50, digest_interval=60)
+    queue.enqueue('s1', [held('a')])
+    queue.enqueue('s2', [held('b')])
+    assert queue.claim(10) == []
+
+    get_connection(queue.path).execute("UPDATE outbound_mail SET created_at = created_at - 61 WHERE submission_id = 's1'")
+    digest, = queue.claim(10)
+    assert json_codec.loads(digest['payload'])['subject'] == '2 submissions'
+    statuses = get_connection(queue.path).execute(
+        "SELECT status, digest_id FROM outbound_mail WHERE submission_id IN ('s1', 's2')"
+    ).fetchall()
+    assert {(row['status'], row['digest_id']) for row in statuses} == {('digested', digest['id'])}
+
+
+def test_large_backlog_is_split_into_several_digests(tmp_path):
+    queue = digest_queue(tmp_path, digest_max_items=2, digest_interval=300)
+    queue.enqueue('s1', [held(name) for name in 'abcde'])
+    digests = queue.claim(10)
+    assert [json_codec.loads(row['payload'])['subject'] for row in digests] == ['2 submissions', '2 submissions']
+    status = queue.status('s1')
+    assert status['messages'][-1]['status'] == 'held'  # 'e' waits for the next digest
+    assert status['status'] == 'pending'
+
+
+def test_failed_digest_is_reported_for_every_submission(tmp_path):
+    queue = digest_queue(tmp_path, digest_max_items=2)
+    queue.enqueue('s1', [held('a'), MESSAGE])
+    queue.enqueue('s2', [held('b')])
+    rows = {row['kind']: row for row in queue.claim(10)}
+    queue.record_result(rows['admin'], None, 1.0)
+    queue.record_result(rows['digest'], smtplib.SMTPResponseException(550, b'Rejected'), 1.0)
+
+    assert queue.status('s1')['status'] == 'partial'
+    assert queue.status('s2')['status'] == 'failed'
+
+
+def test_digest_builder_error_leaves_messages_held(tmp_path):
+    def broken(payloads):
+        raise KeyError('submission')
+    queue = digest_queue(tmp_path, builder=broken, digest_max_items=1)
+    queue.enqueue('s1', [held('a'), MESSAGE])
+
+    row, = queue.claim(10)
+    assert row['kind'] == 'admin'
+    assert get_connection(queue.path).execute(
+        "SELECT COUNT(*) FROM outbound_mail WHERE status = 'held'"
+    ).fetchone()[0] == 1
@@ -0,0 +1,97 @@
+"""
+Schema parser: accepts exactly what json.loads accepts and the schema allows
+"""
+
+import json
+import random
+
+import pytest
+
+from request_schema import ObjectSchema, SchemaError
+
+SCHEMA = ObjectSchema({
+    'email': (254, 'Email'),
+    'name': (100, 'Name'),
+    'subject': (200, 'Subject'),
+    'message': (5000, 'Message')
+})
+
+
+def reference(body):
+    """What the schema parser must return for `body`, or None when it must refuse it"""
+    try:
+        pairs = json.loads(body, object_pairs_hook=lambda pairs: pairs)
+    except (ValueError, RecursionError):
+        return None
+    if not isinstance(pairs, list):
+        return None
+    result = {}
+    for name, value in pairs:
+        if name not in SCHEMA.fields or name in result or not isinstance(value, str):
+            return None
+        if len(value) > SCHEMA.fields[name][0]:
+            return None
+        result[name] = value
+    return result
+
+
+@pytest.mark.parametrize('body', [
+    '{}',
+    '{"name":"Jane","email":"jane@example.com","subject":"Hi","message":"Hello"}',
+    ' \n{ "name" : "a\\u00e9\\n\\t\\"\\\\\\/" ,\r"subject":"\\ud83d\\ude00" } \n',
+    '{"na\\u006de":"escaped field name"}',
+    '{"message":"' + 'x' * 5000 + '"}',
+    '{"message":"héllo ☃"}'.encode('utf-8'),
+])
+def test_accepts_what_json_loads_accepts(body):
+    assert SCHEMA.parse(body) == json.loads(body)
+
+
+@pytest.mark.parametrize('body', [
+    '', ' ', '{', '}', '[]', '"name"', 'null', '{"name":"a"', '{"name":"a",}', '{"name" "a"}', '{,}',
+    "{'name':'a'}", '{"name":"a"} x', '{"name":"a"}{}', '{"name":"a\x01"}', '{"name":"a\\x"}',
+    '{"name":"\\ud83d\\u"}', '{name:"a"}', '{"name":"a"\x0b}', b'{"name":"\xff"}', b'\xef\xbb\xbf{}',
+])
+def test_refuses_invalid_json(body):
+    with pytest.raises(SchemaError, match='Invalid request body'):
+        SCHEMA.parse(body)
+
+
+@pytest.mark.parametrize('body, message', [
+    ('{"website":"x"}', 'Unknown field: website'),
+    ('{"' + 'w' * 65 + '":"x"}', 'Unknown field'),
+    ('{"name":"a","name":"b"}', 'Duplicate field: name'),
+    ('{"name":1}', 'name must be a string'),
+    ('{"name":null}', 'name must be a string'),
+    ('{"name":{"first":"a"}}', 'name must be a string'),
+    ('{"name":' + '[' * 100000 + ']' * 100000 + '}', 'name must be a string'),
+    ('{"name":"' + 'x' * 101 + '"}', r'Name too long \(max 100 characters\)'),
+])
+def test_refuses_bodies_outside_the_schema(body, message):
+    with pytest.raises(SchemaError, match=f'^{message}$'):
+        SCHEMA.parse(body)
+
+
+def test_matches_json_loads_on_mutated_bodies():
+    base = '{"name": "Jane", "email": "jane@example.com", "subject": "Hi \\u00e9", "message": "Hello\\n"}'
+    alphabet = '{}[]:,"\\ u0123456789abcdefnrt\x00\x1fé'
+    rng = random.Random(20240607)
+    for _ in range(5000):
+        body = list(base)
+        for _ in range(rng.randint(1, 3)):
+            position = rng.randrange(len(body) + 1)
+            operation = rng.random()
+            if operation < 0.4 and position < len(body):
+                del body[position]
+            elif operation < 0.8:
+                body.insert(position, rng.choice(alphabet))
+            elif position < len(body):
+                body[position] = rng.choice(alphabet)
+        body = ''.join(body)
+
+        expected = reference(body)
+        if expected is None:
+            with pytest.raises(SchemaError):
+                SCHEMA.parse(body)
+        else:
+            assert SCHEMA.parse(body) == expected, body
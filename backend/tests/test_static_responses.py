@@ -0,0 +1,42 @@
+"""
+Security headers and the opt-in HTTPS redirect
+"""
+
+import pytest
+from flask import Flask
+
+from static_responses import HSTS_HEADER, add_security_headers, redirect_to_https
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.after_request(add_security_headers)
+    app.before_request(redirect_to_https)
+
+    @app.route('/api/contact', methods=['GET', 'POST'])
+    def contact():
+        return 'ok'
+
+    return app.test_client()
+
+
+def test_plain_http_is_redirected(client):
+    response = client.get('/api/contact?x=1')
+    assert response.status_code == 301
+    assert response.headers['Location'] == 'https://localhost/api/contact?x=1'
+
+
+def test_post_redirect_keeps_the_method(client):
+    assert client.post('/api/contact', json={}).status_code == 308
+
+
+@pytest.mark.parametrize('options', [
+    {'base_url': 'https://localhost'},
+    {'headers': {'X-Forwarded-Proto': 'https'}}
+])
+def test_https_is_served_with_hsts(client, options):
+    response = client.get('/api/contact', **options)
+    assert response.status_code == 200
+    assert response.headers[HSTS_HEADER[0]] == HSTS_HEADER[1]
+    assert response.headers['X-Frame-Options'] == 'DENY'
@@ -13,18 +13,9 @@ from pathlib import Path
 backend_dir = Path(__file__).parent
 sys.path.insert(0, str(backend_dir))
 
-# Load environment variables
-from dotenv import load_dotenv
-load_dotenv()
-
-# Configure production logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-# Import the Flask application
-from app import app as application
+# Build the Flask application (app loads .env; create_app configures logging, see log_config)
+from app import create_app
+application = create_app()
 
 # Log startup information
 logger = logging.getLogger(__name__)
@@ -55,6 +46,8 @@ if __name__ == "__main__":
     # This block is for development/testing only
     # In production, use: gunicorn -c gunicorn.conf.py wsgi:application
     logger.warning("Running Flask development server. Use Gunicorn for production!")
+    from app import mail_queue
+    mail_queue.start()
     application.run(
         host=os.getenv('FLASK_HOST', '127.0.0.1'),
         port=int(os.getenv('FLASK_PORT', '5000')),